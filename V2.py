@@ -1,16 +1,18 @@
 import os
-import shutil
-from datetime import datetime, timedelta
+from datetime import datetime
 import schedule
 import time
 import configparser
 import threading
 import tkinter as tk
 import concurrent.futures
-import queue
 import subprocess
 import sys
 
+from backup_logger import close_logger, setup_logger_from_config, write_log
+from filters import FileFilter
+from retention import policy_from_config, start_retention
+
 # --------------------- CONFIG ---------------------
 config = configparser.ConfigParser()
 config.read("config.ini", encoding="utf-8")
@@ -24,33 +26,12 @@ destination_bases = [d.strip() for d in destination_bases_str.split(",") if d.st
 log_file = config.get("BackupSettings", "log_file", fallback=r"C:\Backup_AllMappedDrives\backup_log.txt")
 
 MAX_BACKUP_AGE_DAYS = config.getint("BackupSettings", "max_backup_age_days", fallback=7)
+retention_policy = policy_from_config(config, MAX_BACKUP_AGE_DAYS)
 EXCLUDE_EXTENSIONS = [".tmp", ".log", ".bak", ".db", ".lnk", ".~"]
 
 # --------------------- ASYNC LOGGING ---------------------
-log_queue = queue.Queue()
-
-def async_logger():
-    while True:
-        msg = log_queue.get()
-        if msg == "__EXIT__":
-            break
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_line = f"[{timestamp}] {msg}\n"
-        print(log_line, end="")
-        try:
-            log_dir = os.path.dirname(log_file)
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(log_line)
-        except Exception as e:
-            print(f"[LOG ERROR] {e}")
-
-log_thread = threading.Thread(target=async_logger, daemon=True)
-log_thread.start()
-
-def write_log(msg):
-    log_queue.put(msg)
+# ใช้ระบบ log กลาง (backup_logger): เปิดไฟล์ค้างไว้และเขียนเป็นชุดผ่าน thread เดียว
+setup_logger_from_config(config, log_file)
 
 # --------------------- GUI NOTIFY ---------------------
 def show_notification(title, message, duration=30):
@@ -66,25 +47,18 @@ def show_notification(title, message, duration=30):
         root.mainloop()
     threading.Thread(target=run, daemon=True).start()
 
-# --------------------- CLEANUP ---------------------
-def cleanup_old_backups(base_folders, max_age_days=MAX_BACKUP_AGE_DAYS):
-    now = datetime.now()
-    cutoff = now - timedelta(days=max_age_days)
-    for base_folder in base_folders:
-        if not os.path.exists(base_folder):
-            continue
-        for item in os.listdir(base_folder):
-            item_path = os.path.join(base_folder, item)
-            try:
-                if os.path.isdir(item_path):
-                    mod_time = datetime.fromtimestamp(os.path.getmtime(item_path))
-                    if mod_time < cutoff:
-                        shutil.rmtree(item_path)
-                        write_log(f"Deleted old backup: {item_path}")
-            except Exception as e:
-                write_log(f"[ERROR] ลบ backup เก่าไม่ได้: {item_path} → {e}")
-
 # --------------------- BACKUP ---------------------
+def exclude_args(source_dir):
+    # EXCLUDE_EXTENSIONS + กฎใน [Filters] ของไดรฟ์นี้ แปลงเป็น switch ของ robocopy
+    args = ["/XF", *(f"*{ext}" for ext in EXCLUDE_EXTENSIONS)]
+    file_filter = FileFilter.from_config(config, source_dir.strip("\\").replace(":", ""))
+    if file_filter is not None:
+        extra, unsupported = file_filter.robocopy_args()
+        args += extra
+        if unsupported:
+            write_log(f"[WARN] robocopy ใช้กฎเหล่านี้ใน [Filters] ไม่ได้ (ข้ามไป): {', '.join(unsupported)}")
+    return args
+
 def robocopy_backup(source_dir, destination_dir):
     try:
         os.makedirs(destination_dir, exist_ok=True)
@@ -96,12 +70,13 @@ def robocopy_backup(source_dir, destination_dir):
             "/FFT",        # loose timestamp
             "/Z",          # restartable mode
             # อยากเห็นรายละเอียดไฟล์ก็ไม่ต้องใส่ /NP, /NDL, /NJH, /NJS
+            *exclude_args(source_dir),
         ]
         process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
         for line in process.stdout:
             line = line.strip()
             if line:
-                write_log(f"[RoboCopy] {line}")
+                write_log(f"[RoboCopy] {line}", level="DEBUG")
         process.wait()
     except Exception as e:
         write_log(f"[ERROR] robocopy failed ({source_dir} → {destination_dir}): {e}")
@@ -123,7 +98,8 @@ def backup_drive(source_dir):
 
 def backup_all():
     write_log("📦 เริ่ม backup ทั้งหมด")
-    cleanup_old_backups(destination_bases)
+    # ลบ snapshot เก่า (ดูอายุจากชื่อโฟลเดอร์) เบื้องหลังขนานไปกับ robocopy
+    retention_thread = start_retention(destination_bases, retention_policy, write_log)
     with concurrent.futures.ThreadPoolExecutor(max_workers=min(4, len(mapped_drives))) as executor:
         futures = [executor.submit(backup_drive, drive) for drive in mapped_drives]
         for f in concurrent.futures.as_completed(futures):
@@ -131,6 +107,7 @@ def backup_all():
                 f.result()
             except Exception as e:
                 write_log(f"[ERROR] Backup thread crash: {e}")
+    retention_thread.join()
     write_log("📦 เสร็จสิ้น backup ทั้งหมด\n")
 
 # --------------------- SCHEDULE ---------------------
@@ -181,5 +158,4 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         write_log("🛑 หยุดโปรแกรมด้วยมือ")
     finally:
-        log_queue.put("__EXIT__")
-        log_thread.join()
+        close_logger()
@@ -1,6 +1,8 @@
+import argparse
+import itertools
 import os
 import shutil
-import filecmp
+import sys
 from datetime import datetime, timedelta
 import schedule
 import time
@@ -8,7 +10,33 @@ import time
 import configparser
 import threading
 import tkinter as tk
-from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import copy_engine
+import metrics
+from async_engine import AsyncEngine
+from autotune import AutoTuner
+from backup_logger import setup_logger_from_config, write_log
+from catalog import Catalog, CatalogWriter, catalog_path_for, read_catalog, snapshot_name
+from dest_writer import DestWriter
+from chunk_store import (
+    MANIFEST_SUFFIX, ChunkSink, ChunkStore, ManifestWriter, load_manifest, load_partial_manifest, manifest_path_for,
+)
+from filters import FileFilter
+from file_index import FileIndex, index_path_for, index_total_bytes
+from journal import Journal, journal_path_for, load_journal, tmp_dir_for
+from job_scheduler import JobScheduler, destination_disk_key, parse_share_groups, source_share_key
+from pipeline import CopyJob, CopyPipeline
+from planner import (
+    PlanEntries, compare_with_index, compare_with_previous, entries_path_for, estimate_seconds, fit_rates,
+    format_plan, iter_plan_entries, load_history, load_plan, makespan, record_run, write_plan,
+)
+from prescan import IndexedStat, Prescan
+from retention import finish_retention, policy_from_config, start_retention
+from scanner import scan_tree
+from segment_store import SegmentIndex, SegmentSink, SegmentWriter, available_compression
+from throttle import Throttle
+from verify import HashManifest
+from watcher import Watcher, methods_from_config
 
 config = configparser.ConfigParser()
 config.read("config.ini", encoding="utf-8")
@@ -19,20 +47,140 @@ mapped_drives = [d.strip() for d in mapped_drives_str.split(",") if d.strip()]
 destination_bases_str = config.get("BackupSettings", "destination_base", fallback=r"C:\Backup_AllMappedDrives")
 destination_bases = [d.strip() for d in destination_bases_str.split(",") if d.strip()]
 
+# รูปแบบปลายทาง เรียงตาม destination_base: tree (สำเนาไฟล์ตามปกติ), chunks (chunk store)
+# หรือ segments (ไฟล์เล็กรวมเป็น tar segment ดู segment_store.py)
+destination_formats_str = config.get("BackupSettings", "destination_format", fallback="")
+destination_formats = dict(zip(destination_bases, [f.strip().lower() or "tree" for f in destination_formats_str.split(",")]))
+
 log_file = config.get("BackupSettings", "log_file", fallback=r"C:\Backup_AllMappedDrives\backup_log.txt")
+setup_logger_from_config(config, log_file)
 
-MAX_DEPTH = config.getint("BackupSettings", "max_depth", fallback=50)
 MAX_BACKUP_AGE_DAYS = config.getint("BackupSettings", "max_backup_age_days", fallback=7)
 MAX_THREADS = config.getint("BackupSettings", "max_threads", fallback=8)
+COPY_QUEUE_SIZE = config.getint("BackupSettings", "copy_queue_size", fallback=MAX_THREADS * 4)
+SCAN_THREADS = max(1, config.getint("BackupSettings", "scan_threads", fallback=4))
+# engine ที่ใช้เดินต้นไม้และคัดลอก: threads (scanner + copy pipeline) หรือ async (asyncio + offload pool)
+ENGINE = config.get("BackupSettings", "engine", fallback="threads").strip().lower()
+INCREMENTAL = config.getboolean("BackupSettings", "incremental", fallback=True)
+RESUME = config.getboolean("BackupSettings", "resume", fallback=True)
+RESUME_MAX_AGE_HOURS = config.getint("BackupSettings", "resume_max_age_hours", fallback=12)
+# prescan: ไม่ list โฟลเดอร์ที่ mtime ไม่เปลี่ยนตั้งแต่รอบก่อน (ดู prescan.py) และสแกนเต็มทุก N วัน
+PRESCAN = config.getboolean("BackupSettings", "prescan", fallback=False)
+PRESCAN_FULL_EVERY_DAYS = config.getint("BackupSettings", "full_scan_every_days", fallback=2)
+PRESCAN_FORCE_FULL = False
+# --execute-plan: ใช้รายการไฟล์จาก plan ที่สร้างไม่เกินกี่ชั่วโมง (เก่ากว่านั้นสแกนใหม่)
+PLAN_MAX_AGE_HOURS = config.getint("BackupSettings", "plan_max_age_hours", fallback=12)
+NIGHTLY_AT = config.get("BackupSettings", "backup_time", fallback="01:00").strip()
+
+SNAPSHOT_TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+MTIME_TOLERANCE = 2  # วินาที (เทียบเท่า /FFT ของ robocopy)
+
+LARGE_FILE_THRESHOLD_MB = config.getint("CopyEngine", "large_file_threshold_mb", fallback=256)
+CHUNK_SIZE_MB = config.getint("CopyEngine", "chunk_size_mb", fallback=64)
+CHUNK_THREADS = config.getint("CopyEngine", "chunk_threads", fallback=4)
+BUFFER_SIZE_KB = config.getint("CopyEngine", "buffer_size_kb", fallback=1024)
+
+# คำนวณ hash ระหว่างคัดลอก (ไม่อ่านซ้ำ) เก็บในดัชนีและ manifest ต่อ snapshot สำหรับ python verify.py
+HASH_ON_COPY = config.getboolean("Verify", "hash_on_copy", fallback=True)
+# all = ทุกไฟล์มี hash (ไฟล์ที่ต้อง hash ไม่ใช้ zero-copy), fast = ไฟล์ตั้งแต่ fast_min_mb ยังใช้ zero-copy และไม่มี hash
+HASH_MODE = config.get("Verify", "hash_mode", fallback="all").strip().lower()
+HASH_FAST_MIN_MB = config.getint("Verify", "fast_min_mb", fallback=64)
+# catalog ของ snapshot สำหรับค้นหาไฟล์/เวอร์ชันข้าม snapshot (python catalog.py)
+CATALOG = config.getboolean("Catalog", "enabled", fallback=True)
+
+SEGMENT_SMALL_FILE_KB = config.getint("Segments", "small_file_kb", fallback=256)
+SEGMENT_SIZE_MB = config.getint("Segments", "segment_size_mb", fallback=64)
+SEGMENT_COMPRESSION = config.get("Segments", "compression", fallback="zstd").strip().lower()
+
+ASYNC_OFFLOAD_THREADS = max(1, config.getint("AsyncEngine", "offload_threads", fallback=64))
+ASYNC_MAX_IN_FLIGHT = max(1, config.getint("AsyncEngine", "max_in_flight_per_share", fallback=256))
+
+# ปรับจำนวนไฟล์ที่คัดลอกพร้อมกันต่อ share เอง (ดู autotune.py) เปิดแล้ว max_threads ไม่ใช้ ใช้ max_workers เป็นเพดานรวม
+AUTOTUNE = config.getboolean("AutoTune", "enabled", fallback=False)
+AUTOTUNE_INITIAL = config.getint("AutoTune", "initial_per_share", fallback=4)
+AUTOTUNE_MAX = config.getint("AutoTune", "max_per_share", fallback=64)
+AUTOTUNE_WORKERS = max(1, config.getint("AutoTune", "max_workers", fallback=64))
+AUTOTUNE_WINDOW_SECONDS = config.getfloat("AutoTune", "window_seconds", fallback=5)
+AUTOTUNE_STATE_FILE = config.get("AutoTune", "state_file", fallback="").strip() or os.path.join(
+    os.path.dirname(log_file), "autotune_state.json"
+)
+
+# โหมดต่อเนื่อง (ดู watcher.py): คัดลอกไฟล์ที่เปลี่ยนระหว่างวันเข้า snapshot ของรอบ backup_time ถัดไป
+WATCH = config.getboolean("Watch", "enabled", fallback=False)
+WATCH_POLL_SECONDS = max(1, config.getint("Watch", "poll_seconds", fallback=60))
+WATCH_SWEEP_MINUTES = config.getint("Watch", "sweep_minutes", fallback=15)
+WATCH_HOT_MINUTES = config.getint("Watch", "hot_minutes", fallback=30)
+WATCH_SETTLE_SECONDS = config.getint("Watch", "settle_seconds", fallback=10)
+
+METRICS_HTTP_PORT = config.getint("Metrics", "http_port", fallback=9108)
+METRICS_BIND = config.get("Metrics", "bind", fallback="127.0.0.1")
+METRICS_SUMMARY_INTERVAL = config.getint("Metrics", "summary_interval", fallback=60)
+
+MAX_CONCURRENT_JOBS = max(1, config.getint("Scheduler", "max_concurrent_jobs", fallback=4))
+MAX_JOBS_PER_SOURCE = max(1, config.getint("Scheduler", "max_jobs_per_source", fallback=1))
+MAX_JOBS_PER_DESTINATION = max(1, config.getint("Scheduler", "max_jobs_per_destination", fallback=4))
+share_groups = parse_share_groups(config)
+retention_policy = policy_from_config(config, MAX_BACKUP_AGE_DAYS)
 
 print("Mapped Drives:", mapped_drives)
 print("Destination Bases:", destination_bases)
+print("Destination Formats:", destination_formats)
 print("Log File:", log_file)
-print("Max Depth:", MAX_DEPTH)
 print("Max Backup Age Days:", MAX_BACKUP_AGE_DAYS)
+print("Retention:", retention_policy)
 print("Max Threads:", MAX_THREADS)
+print("Copy Queue Size:", COPY_QUEUE_SIZE)
+print("Scan Threads:", SCAN_THREADS)
+print("Incremental:", INCREMENTAL)
+print("Resume (max age hours):", RESUME, RESUME_MAX_AGE_HOURS)
+print("Prescan (full scan every days):", PRESCAN, PRESCAN_FULL_EVERY_DAYS)
+print("Copy Engine (threshold MB/chunk MB/chunk threads/buffer KB):", LARGE_FILE_THRESHOLD_MB, CHUNK_SIZE_MB, CHUNK_THREADS, BUFFER_SIZE_KB)
+print("Scheduler Limits (total/source/destination):", MAX_CONCURRENT_JOBS, MAX_JOBS_PER_SOURCE, MAX_JOBS_PER_DESTINATION)
+print("Async Engine (offload threads/in-flight per share):", ASYNC_OFFLOAD_THREADS, ASYNC_MAX_IN_FLIGHT)
+print("Hash On Copy (mode/fast min MB):", HASH_ON_COPY, HASH_MODE, HASH_FAST_MIN_MB)
+print("Catalog:", CATALOG)
+print("Segments (small file KB/segment MB/compression):", SEGMENT_SMALL_FILE_KB, SEGMENT_SIZE_MB, available_compression(SEGMENT_COMPRESSION))
+print("Metrics (port/summary interval):", METRICS_HTTP_PORT, METRICS_SUMMARY_INTERVAL)
+print("AutoTune (initial/max per share/max workers):", AUTOTUNE, AUTOTUNE_INITIAL, AUTOTUNE_MAX, AUTOTUNE_WORKERS)
+print("Watch (poll seconds/sweep minutes/hot minutes/settle seconds):", WATCH, WATCH_POLL_SECONDS, WATCH_SWEEP_MINUTES, WATCH_HOT_MINUTES, WATCH_SETTLE_SECONDS)
 
-file_copy_executor = ThreadPoolExecutor(max_workers=MAX_THREADS)
+copy_engine.configure(
+    large_file_threshold=LARGE_FILE_THRESHOLD_MB * 1024 * 1024,
+    chunk_size=CHUNK_SIZE_MB * 1024 * 1024,
+    chunk_threads=CHUNK_THREADS,
+    buffer_size=BUFFER_SIZE_KB * 1024,
+)
+if HASH_MODE not in ("all", "fast"):
+    write_log(f"[WARN] ไม่รู้จัก hash_mode '{HASH_MODE}' ใช้ all แทน")
+HASH_ZERO_COPY_MIN = HASH_FAST_MIN_MB * 1024 * 1024 if HASH_MODE == "fast" else None
+autotuner = None
+if AUTOTUNE:
+    autotuner = AutoTuner(
+        AUTOTUNE_STATE_FILE,
+        AUTOTUNE_INITIAL,
+        AUTOTUNE_MAX,
+        AUTOTUNE_WINDOW_SECONDS,
+        on_change=lambda share, old, new, rates, latency: write_log(
+            f"🎛️ autotune {share}: {old} → {new} งานพร้อมกัน "
+            f"({rates[0]:.1f} ไฟล์/s, {rates[1] / 1024 / 1024:.1f} MB/s, latency {latency * 1000:.0f} ms)"
+        ),
+    )
+copy_pipeline = CopyPipeline(
+    AUTOTUNE_WORKERS if AUTOTUNE else MAX_THREADS,
+    COPY_QUEUE_SIZE,
+    on_error=lambda e: write_log(f"[ERROR] copy worker: {e}"),
+)
+async_engine = AsyncEngine(ASYNC_OFFLOAD_THREADS, ASYNC_MAX_IN_FLIGHT, autotuner.limit if AUTOTUNE else None)
+metrics.set_queue_depth(copy_pipeline.depth)
+throttle = Throttle("config.ini", on_error=write_log)  # [Throttle] อ่านใหม่อัตโนมัติเมื่อ config.ini เปลี่ยน
+print("Throttle:", throttle.describe())
+stats_lock = threading.Lock()
+chunk_stores = {}
+chunk_stores_lock = threading.Lock()
+live_targets = {}  # โหมดต่อเนื่อง: source_dir -> targets ของ snapshot ที่กำลังเติมระหว่างวัน
+live_targets_lock = threading.Lock()
+watcher = None
+tmp_counter = itertools.count()
 
 
 def show_notification(title, message, duration=1800):
@@ -55,128 +203,888 @@ def show_notification(title, message, duration=1800):
     threading.Thread(target=run, daemon=True).start()
 
 
-def write_log(message):
-    log_dir = os.path.dirname(log_file)
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+def find_previous_snapshot(destination_dir, suffix=""):
+    """
+    หา snapshot ล่าสุดก่อนหน้าของไดรฟ์เดียวกัน โดยดูจาก timestamp ในชื่อโฟลเดอร์
+    suffix = MANIFEST_SUFFIX สำหรับปลายทางแบบ chunks (ค้นหาไฟล์ manifest แทนโฟลเดอร์)
+    """
+    parent, name = os.path.split(destination_dir)
+    prefix = name[:-len(datetime.now().strftime(SNAPSHOT_TIME_FORMAT))]
+    if not os.path.isdir(parent):
+        return None
 
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_line = f"[{timestamp}] {message}\n"
-    print(log_line, end="")
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(log_line)
+    latest = None
+    for item in os.listdir(parent):
+        if not item.startswith(prefix) or not item.endswith(suffix):
+            continue
+        stamp = item[len(prefix):len(item) - len(suffix)]
+        if prefix + stamp >= name:
+            continue
+        try:
+            datetime.strptime(stamp, SNAPSHOT_TIME_FORMAT)
+        except ValueError:
+            continue
+        is_match = os.path.isfile if suffix else os.path.isdir
+        if is_match(os.path.join(parent, item)) and (latest is None or item > latest):
+            latest = item
 
+    return os.path.join(parent, latest) if latest else None
 
-def cleanup_old_backups(base_folders, max_age_days=MAX_BACKUP_AGE_DAYS):
-    now = datetime.now()
-    cutoff = now - timedelta(days=max_age_days)
 
-    for base_folder in base_folders:
-        if not os.path.exists(base_folder):
-            continue
+def is_unchanged(s_stat, p_stat):
+    return s_stat.st_size == p_stat.st_size and abs(s_stat.st_mtime - p_stat.st_mtime) <= MTIME_TOLERANCE
+
+
+def link_from_previous(s_stat, d_path, p_path, known=False):
+    if p_path is None:
+        return False
+    try:
+        p_stat = os.stat(p_path)
+        # known = index ยืนยันแล้วว่าไฟล์ต้นทางไม่เปลี่ยน เหลือแค่เช็คขนาดของไฟล์ใน snapshot เดิม
+        if p_stat.st_size != s_stat.st_size or not (known or is_unchanged(s_stat, p_stat)):
+            return False
+        os.link(p_path, d_path)
+        return True
+    except OSError:
+        # ไม่มีไฟล์เดิม, อยู่คนละ volume หรือจำนวน link เต็ม → คัดลอกตามปกติ
+        return False
+
+
+def add_stat(target, key, amount=1):
+    with stats_lock:
+        target[key] += amount
+
+
+def take_live(target, rel_path):
+    """True ถ้าโหมดต่อเนื่องคัดลอกไฟล์นี้ไว้ (เอาออกจากรายการ ที่เหลือตอนจบรอบคือไฟล์ที่ไม่มีในต้นทางแล้ว)"""
+    live = target["live"]
+    if not live:
+        return False
+    key = rel_path.replace(os.sep, "/")
+    with stats_lock:
+        if key not in live:
+            return False
+        live.remove(key)
+    return True
+
+
+def remove_stale_live_files(target):
+    """ไฟล์ที่โหมดต่อเนื่องคัดลอกไว้แต่รอบนี้ไม่เจอในต้นทาง (ถูกลบ/ย้าย/ถูกตัดด้วยตัวกรอง) เอาออกจาก snapshot"""
+    removed = 0
+    for path in target["live"]:
+        try:
+            os.remove(os.path.join(target["dir"], path.replace("/", os.sep)))
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            write_log(f"[WARN] ลบไฟล์ที่ไม่มีในต้นทางแล้วออกจาก {target['dir']} ไม่ได้: {path}: {e}")
+    if removed:
+        write_log(f"🧹 ลบไฟล์ที่คัดลอกไว้ระหว่างวันแต่ไม่มีในต้นทางแล้ว {removed} ไฟล์ ({target['dir']})")
+
+
+def is_done(target, rel_path, s_stat):
+    """ไฟล์ที่รอบก่อน (ที่ค้าง) ทำเสร็จแล้ว และไฟล์ต้นทางยังไม่เปลี่ยนตั้งแต่นั้น"""
+    return target["done"].get(rel_path.replace(os.sep, "/")) == (s_stat.st_size, s_stat.st_mtime_ns)
+
+
+def next_tmp_path(target):
+    return os.path.join(target["tmp"], f"{next(tmp_counter)}.tmp")
+
 
-        for item in os.listdir(base_folder):
-            item_path = os.path.join(base_folder, item)
+def fanout_copy(s_path, s_stat, rel_path, pending):
+    """
+    อ่านไฟล์ต้นทางครั้งเดียว แล้วเขียนลงทุกปลายทางใน pending [(target, output), ...]
+    output เป็นไฟล์ชั่วคราว (ปลายทางแบบ tree, rename เข้าที่เมื่อเสร็จ) หรือ ChunkSink (ปลายทางแบบ chunks)
+    """
+    limit = None
+    if throttle.enabled():
+        source_key = pending[0][0]["source_key"]
+        destination_keys = [target["disk_key"] for target, _ in pending]
+        limit = lambda nbytes: throttle.charge_bytes(source_key, destination_keys, nbytes)
+    hasher = copy_engine.ContentHasher(HASH_ZERO_COPY_MIN) if HASH_ON_COPY else None
+    results = copy_engine.copy_file(s_path, s_stat, [output for _, output in pending], limit, hasher)
+    for target, output in pending:
+        error = results[output]
+        d_path = os.path.join(target["dir"], rel_path)
+        if error is None:
             try:
-                if os.path.isdir(item_path):
-                    mod_time = datetime.fromtimestamp(os.path.getmtime(item_path))
-                    if mod_time < cutoff:
-                        shutil.rmtree(item_path)
-                        write_log(f"Deleted old backup: {item_path}")
+                digest = hasher.hexdigest() if hasher is not None else None
+                add_snapshot_entry(target, rel_path, s_stat, digest)
+                if isinstance(output, str):
+                    target["writer"].apply_file_metadata(output, s_stat)
+                    os.replace(output, d_path)  # ไม่มีไฟล์ครึ่ง ๆ ค้างอยู่ใน snapshot
+                    target["journal"].file_done(rel_path, s_stat)
+                elif isinstance(output, SegmentSink):
+                    target["segments"].add(rel_path, s_stat, output.data)  # journal บันทึกตอน segment ปิด
+                else:
+                    target["manifest"].add_file(rel_path, s_stat, output.chunk_ids)
+                target["index"].record(rel_path, s_stat, digest)
             except Exception as e:
-                write_log(f"[ERROR] ไม่สามารถลบ backup เก่า {item_path}: {e}")
+                error = e
+        if error is not None:
+            add_stat(target, "errors")
+            write_log(f"[ERROR] คัดลอกไฟล์ล้มเหลว {s_path} → {d_path}: {error}")
+            continue
+        add_stat(target, "copied")
+        add_stat(target, "bytes", s_stat.st_size)
+        write_log(f"Copied: {s_path} → {d_path}", level="DEBUG")
 
 
-def copy_file_task(s_path, d_path):
-    try:
-        os.makedirs(os.path.dirname(d_path), exist_ok=True)
-        if not os.path.exists(d_path) or not filecmp.cmp(s_path, d_path, shallow=False):
-            shutil.copy2(s_path, d_path)
-            write_log(f"Copied: {s_path} → {d_path}")
-    except Exception as e:
-        write_log(f"[ERROR] คัดลอกไฟล์ล้มเหลว {s_path} → {d_path}: {e}")
+def reuse_previous_chunks(target, s_stat, rel_path, known):
+    """ปลายทางแบบ chunks: ถ้าไฟล์ไม่เปลี่ยนให้ใช้รายการ chunk จาก manifest ก่อนหน้าได้เลย ไม่ต้องอ่านไฟล์"""
+    prev = target["previous_entries"].get(rel_path.replace(os.sep, "/"))
+    if prev is None or prev.get("dir") or prev["size"] != s_stat.st_size:
+        return False
+    if not known and abs(prev["mtime_ns"] - s_stat.st_mtime_ns) > MTIME_TOLERANCE * 1_000_000_000:
+        return False
+    # s_stat อาจเป็น IndexedStat จาก prescan (ไม่มี st_mode) จึงใช้ mode จาก manifest ก่อนหน้า
+    target["manifest"].add_file(rel_path, s_stat, prev["chunks"], prev.get("mode"))
+    return True
 
 
-def sync_folders(source, destination, depth=0):
-    if depth > MAX_DEPTH:
-        write_log(f"[WARN] เกินความลึก {MAX_DEPTH} ที่: {source}")
-        return
+def reuse_previous_segment(target, s_stat, rel_path, known):
+    """ปลายทางแบบ segments: ไฟล์เล็กที่ไม่เปลี่ยนชี้ไปที่ segment ของ snapshot ก่อนหน้า ไม่ต้องอ่านไฟล์"""
+    previous = target["previous_segments"]
+    row = previous.get(rel_path) if previous is not None else None
+    if row is None or row[1] != s_stat.st_size:
+        return False
+    if not known and abs(row[2] - s_stat.st_mtime_ns) > MTIME_TOLERANCE * 1_000_000_000:
+        return False
+    target["segments"].link_previous(rel_path, s_stat, previous, row)
+    return True
+
 
-    tasks = []
+def add_snapshot_entry(target, rel_path, s_stat, digest):
+    """บันทึกไฟล์ที่อยู่ใน snapshot แล้วลง manifest ของ hash และ catalog"""
+    if target.get("hashes") is not None:
+        target["hashes"].add(rel_path, s_stat.st_size, digest)
+    if target.get("catalog") is not None:
+        target["catalog"].add(rel_path, s_stat, digest)
 
+
+def record_segment_files(journal, entries):
+    for rel_path, s_stat in entries:
+        journal.file_done(rel_path, s_stat)
+
+
+def copy_file_task(s_path, s_stat, targets, rel_path, progress=None):
+    if throttle.enabled():
+        throttle.charge_ops(targets[0]["source_key"], [target["disk_key"] for target in targets])
+    pending = []
+    for target in targets:
+        d_path = os.path.join(target["dir"], rel_path)
+        p_path = os.path.join(target["previous"], rel_path) if target["previous"] else None
+        index = target["index"]
+        index.seen(rel_path)
+        try:
+            live = take_live(target, rel_path)
+            if is_done(target, rel_path, s_stat):
+                if live:
+                    # คัดลอกไว้ระหว่างวันโดยยังไม่ได้บันทึก hash/catalog ใช้ hash จากดัชนีตอนคัดลอก
+                    add_snapshot_entry(target, rel_path, s_stat, index.get_hash(rel_path) if HASH_ON_COPY else None)
+                    target["journal"].file_done(rel_path, s_stat)
+                add_stat(target, "resumed")
+                continue
+            known = index.matches(rel_path, s_stat)
+            # ไฟล์ที่ไม่ได้คัดลอกใหม่ ใช้ hash เดิมจากดัชนี (ถ้ารอบก่อนคำนวณไว้)
+            digest = index.get_hash(rel_path) if HASH_ON_COPY else None
+            if target["format"] == "chunks":
+                if reuse_previous_chunks(target, s_stat, rel_path, known):
+                    if not known:
+                        index.record(rel_path, s_stat, digest)
+                    add_snapshot_entry(target, rel_path, s_stat, digest)
+                    add_stat(target, "linked")
+                else:
+                    pending.append((target, ChunkSink(target["store"])))
+                continue
+            if target["format"] == "segments" and s_stat.st_size < SEGMENT_SMALL_FILE_KB * 1024:
+                if reuse_previous_segment(target, s_stat, rel_path, known):
+                    if not known:
+                        index.record(rel_path, s_stat, digest)
+                    add_snapshot_entry(target, rel_path, s_stat, digest)
+                    add_stat(target, "linked")
+                else:
+                    pending.append((target, SegmentSink()))
+                continue
+            target["writer"].ensure_parent(rel_path)
+            if target["writer"].exists(rel_path):
+                if known and os.path.getsize(d_path) == s_stat.st_size:
+                    add_snapshot_entry(target, rel_path, s_stat, digest)
+                    target["journal"].file_done(rel_path, s_stat)
+                    continue
+            elif link_from_previous(s_stat, d_path, p_path, known):
+                if not known:
+                    index.record(rel_path, s_stat, digest)
+                add_snapshot_entry(target, rel_path, s_stat, digest)
+                target["journal"].file_done(rel_path, s_stat)
+                add_stat(target, "linked")
+                continue
+            pending.append((target, next_tmp_path(target)))
+        except Exception as e:
+            add_stat(target, "errors")
+            write_log(f"[ERROR] คัดลอกไฟล์ล้มเหลว {s_path} → {d_path}: {e}")
+
+    if pending and isinstance(s_stat, IndexedStat):
+        # stat จาก prescan มีแค่ขนาด/เวลา ต้องคัดลอกจริงจึง stat ไฟล์ต้นทางใหม่ (ได้ค่าล่าสุดและ mode/atime)
+        try:
+            s_stat = os.stat(s_path)
+        except OSError as e:
+            for target, output in pending:
+                add_stat(target, "errors")
+            write_log(f"[ERROR] อ่านข้อมูลไฟล์ไม่ได้ {s_path}: {e}")
+            pending = []
+    if pending:
+        fanout_copy(s_path, s_stat, rel_path, pending)
+    if progress is not None:
+        progress.processed(s_stat)
+
+
+def tuned_copy_task(s_path, s_stat, targets, rel_path, progress=None):
+    """copy_file_task ที่วัดเวลาให้ autotune (ผู้ส่งงานจองที่ของ share ไว้แล้วด้วย autotuner.acquire)"""
+    started = time.monotonic()
     try:
-        if not os.path.exists(destination):
-            os.makedirs(destination)
+        copy_file_task(s_path, s_stat, targets, rel_path, progress)
+    finally:
+        autotuner.release(targets[0]["source_key"], s_stat.st_size, time.monotonic() - started)
 
-        for item in os.listdir(source):
-            s_path = os.path.join(source, item)
-            d_path = os.path.join(destination, item)
 
-            if os.path.islink(s_path):
-                write_log(f"[SKIP] ละเว้น symlink: {s_path}")
+def make_target_dirs(targets, rel_dir, dir_stat=None):
+    """dir_stat = stat ของโฟลเดอร์ต้นทาง (เวลาแก้ไขถูกตั้งตอนจบรอบ) หรือ None ถ้าไม่รู้"""
+    for target in targets:
+        d_dir = os.path.join(target["dir"], rel_dir)
+        done = rel_dir.replace(os.sep, "/") in target["done_dirs"]
+        try:
+            if target["format"] == "chunks":
+                if rel_dir and not done:
+                    target["manifest"].add_dir(rel_dir)
                 continue
+            writer = target["writer"]
+            if dir_stat is not None:
+                writer.defer_dir_times(rel_dir, dir_stat)
+            if done:
+                writer.known_dir(rel_dir)
+            elif writer.make_dir(rel_dir):
+                target["journal"].dir_done(rel_dir)
+        except Exception as e:
+            add_stat(target, "errors")
+            write_log(f"[ERROR] สร้างโฟลเดอร์ไม่ได้ {d_dir}: {e}")
+
 
-            if os.path.isdir(s_path):
-                sync_folders(s_path, d_path, depth + 1)
+def make_skeleton(targets, entries_path):
+    """รู้รายการโฟลเดอร์ล่วงหน้า (plan): สร้างโครงโฟลเดอร์ทั้งหมดก่อนเริ่มส่งไฟล์ให้ worker"""
+    make_target_dirs(targets, "")
+    for rel_path, dir_stat, is_dir in iter_plan_entries(entries_path):
+        if is_dir:
+            make_target_dirs(targets, rel_path, dir_stat)
+
+
+def sync_folders(source, targets, progress=None, prescan=None, file_filter=None, entries=None):
+    """entries = รายการจาก plan (planner.iter_plan_entries) ใช้แทนการสแกน"""
+    job = CopyJob()
+    make_target_dirs(targets, "")
+
+    if entries is None:
+        entries = scan_tree(
+            source,
+            on_error=lambda path, e: write_log(f"[ERROR] เกิดข้อผิดพลาดที่ {path}: {e}"),
+            on_skip=lambda path: write_log(f"[SKIP] ละเว้น symlink: {path}"),
+            workers=SCAN_THREADS,
+            prescan=prescan,
+            file_filter=file_filter,
+        )
+    for rel_path, s_stat, is_dir in entries:
+        if is_dir:
+            make_target_dirs(targets, rel_path, s_stat)
+        else:
+            s_path = os.path.join(source, rel_path)
+            if progress is not None:
+                progress.scanned(s_stat)
+            if autotuner is not None:
+                # จองที่ก่อนใส่คิว worker จึงไม่ต้องรอ share ที่ช้าและทำงานของ share อื่นต่อได้
+                autotuner.acquire(targets[0]["source_key"])
+                copy_pipeline.submit(job, tuned_copy_task, s_path, s_stat, targets, rel_path, progress)
             else:
-                task = file_copy_executor.submit(copy_file_task, s_path, d_path)
-                tasks.append(task)
+                copy_pipeline.submit(job, copy_file_task, s_path, s_stat, targets, rel_path, progress)
 
-        for task in as_completed(tasks):
-            pass
-    except Exception as e:
-        write_log(f"[ERROR] เกิดข้อผิดพลาดที่ {source}: {e}")
+    job.wait()
 
 
-def backup_drive_to_destination(source_dir, destination_base):
-    drive_letter = source_dir.strip("\\").replace(":", "")
-    time_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+def sync_folders_async(source, targets, progress=None, prescan=None, file_filter=None):
+    """เหมือน sync_folders แต่เดินต้นไม้และคัดลอกผ่าน async_engine (จำกัดงานค้างต่อ share)"""
+    def on_file(s_path, s_stat, rel_path):
+        if progress is not None:
+            progress.scanned(s_stat)
+        started = time.monotonic()
+        copy_file_task(s_path, s_stat, targets, rel_path, progress)
+        if autotuner is not None:
+            autotuner.record(targets[0]["source_key"], s_stat.st_size, time.monotonic() - started)
 
-    destination_dir = os.path.join(destination_base, f"{drive_letter}_{time_str}")
-    write_log(f"🔁 เริ่มสำรองข้อมูลจาก {source_dir} → {destination_dir}")
+    make_target_dirs(targets, "")
+    async_engine.run_tree(
+        source,
+        source_share_key(source, share_groups),
+        on_dir=lambda rel_dir, dir_stat: make_target_dirs(targets, rel_dir, dir_stat),
+        on_file=on_file,
+        on_error=lambda path, e: write_log(f"[ERROR] เกิดข้อผิดพลาดที่ {path}: {e}"),
+        on_skip=lambda path: write_log(f"[SKIP] ละเว้น symlink: {path}"),
+        prescan=prescan,
+        file_filter=file_filter,
+    )
 
-    if os.path.exists(source_dir):
-        sync_folders(source_dir, destination_dir)
-        write_log(f"✅ เสร็จสิ้นสำรอง {source_dir} ที่ {destination_dir} เวลา {datetime.now()}")
-        msg = f"✅ เสร็จสิ้นสำรอง {source_dir} ที่ {destination_dir} เวลา {datetime.now()}"
-        show_notification("Backup Completed", msg)
-    else:
+
+ENGINES = {"threads": sync_folders, "async": sync_folders_async}
+
+
+def get_engine():
+    if ENGINE not in ENGINES:
+        write_log(f"[WARN] ไม่รู้จัก engine '{ENGINE}' ใช้ threads แทน")
+        return sync_folders
+    return ENGINES[ENGINE]
+
+
+def get_drive_letter(source_dir):
+    return source_dir.strip("\\").replace(":", "")
+
+
+def open_journal(destination_base, drive_letter, destination_format, time_str):
+    """
+    เปิด journal ของงาน (ไดรฟ์, ปลายทาง) ถ้ารอบก่อนค้างอยู่และยังไม่เก่าเกิน resume_max_age_hours
+    จะทำต่อใน snapshot เดิม คืน (journal, destination_dir, state ของรอบที่ค้าง หรือ None)
+    """
+    path = journal_path_for(destination_base, drive_letter)
+    state = load_journal(path) if RESUME else None
+    if state is not None:
+        destination_dir = os.path.join(destination_base, state["snapshot"])
+        try:
+            started = datetime.strptime(state.get("started", ""), SNAPSHOT_TIME_FORMAT)
+        except ValueError:
+            started = datetime.min
+        if state.get("format") == destination_format and datetime.now() - started <= timedelta(hours=RESUME_MAX_AGE_HOURS):
+            journal = Journal(path, state["snapshot"], destination_format, state["started"], resume=True)
+            return journal, destination_dir, state
+
+        write_log(f"[WARN] ไม่ทำต่อ snapshot ที่ค้างอยู่ {destination_dir} (เก่าเกินไปหรือเปลี่ยนรูปแบบปลายทาง) เริ่ม snapshot ใหม่")
+        if state.get("format") == "chunks" and os.path.exists(manifest_path_for(destination_dir) + ".partial"):
+            ManifestWriter(destination_dir).close()  # ปิด manifest ที่ค้างไว้ตามเดิม ให้ retention จัดการต่อ
+
+    snapshot = f"{drive_letter}_{time_str}"
+    journal = Journal(path, snapshot, destination_format, time_str)
+    return journal, os.path.join(destination_base, snapshot), None
+
+
+def open_targets(source_dir, bases, time_str, live=False):
+    """
+    เปิด journal, ดัชนี และไฟล์บันทึกของ snapshot ทุกปลายทางของไดรฟ์นี้ (ปลายทางที่เปิดไม่ได้ถูกข้าม)
+    live = โหมดต่อเนื่อง: ไฟล์ใน journal ถูกทำเครื่องหมาย live ไม่เขียน hash/catalog (รอบกลางคืนเขียนให้)
+    """
+    drive_letter = get_drive_letter(source_dir)
+    targets = []
+    for destination_base in bases:
+        destination_format = destination_formats.get(destination_base, "tree")
+        try:
+            journal, destination_dir, resume_state = open_journal(destination_base, drive_letter, destination_format, time_str)
+        except Exception as e:
+            write_log(f"[ERROR] เปิด journal ของ {destination_base} ไม่ได้: {e}")
+            continue
+        if live and resume_state is None and os.path.isdir(destination_dir):
+            # รอบก่อนปิด snapshot ชื่อนี้ไปแล้ว (เช่นสั่งรอบเต็มตอนเริ่มโปรแกรม) ไม่เขียนทับ รอรอบกลางคืน
+            journal.close(finished=True)
+            write_log(f"[WARN] snapshot {destination_dir} เสร็จไปแล้ว ไฟล์ที่เปลี่ยนจาก {source_dir} รอรอบกลางคืน")
+            continue
+        suffix = MANIFEST_SUFFIX if destination_format == "chunks" else ""
+        previous_dir = find_previous_snapshot(destination_dir, suffix) if INCREMENTAL else None
+        if live:
+            journal.live = True
+            write_log(f"🔭 คัดลอกไฟล์ที่เปลี่ยนระหว่างวันจาก {source_dir} → {destination_dir}")
+        else:
+            write_log(f"🔁 เริ่มสำรองข้อมูลจาก {source_dir} → {destination_dir} ({destination_format})")
+            if previous_dir:
+                write_log(f"🔗 ใช้ snapshot ก่อนหน้า {previous_dir} เป็นฐาน (hard-link ไฟล์ที่ไม่เปลี่ยน)")
+        target = {
+            "base": destination_base,
+            "format": destination_format,
+            "dir": destination_dir,
+            "previous": previous_dir,
+            "journal": journal,
+            "source_key": source_share_key(source_dir, share_groups),
+            "disk_key": destination_disk_key(destination_base),
+            "tmp": tmp_dir_for(destination_base, drive_letter),
+            "done": {},
+            "done_dirs": set(),
+            "live": None,  # ไฟล์ที่โหมดต่อเนื่องคัดลอกไว้และรอบนี้ยังไม่เจอ
+            "copied": 0,
+            "linked": 0,
+            "resumed": 0,
+            "errors": 0,
+            "bytes": 0,
+        }
+        try:
+            # ไฟล์ชั่วคราวที่ค้างจากรอบที่ถูกขัดจังหวะ ไม่มีใครอ้างถึงแล้ว
+            shutil.rmtree(target["tmp"], ignore_errors=True)
+            os.makedirs(target["tmp"], exist_ok=True)
+            if destination_format == "chunks":
+                target["previous"] = None
+                target["previous_entries"] = load_manifest(previous_dir)
+                target["store"] = get_chunk_store(destination_base)
+                if resume_state is not None:
+                    # ปลายทางแบบ chunks ใช้ manifest .partial เป็น journal ของไฟล์
+                    partial = load_partial_manifest(destination_dir, target["store"])
+                    target["done"] = {p: (e["size"], e["mtime_ns"]) for p, e in partial.items() if not e.get("dir")}
+                    target["done_dirs"] = {p for p, e in partial.items() if e.get("dir")}
+                target["manifest"] = ManifestWriter(destination_dir)
+            elif resume_state is not None:
+                target["done"] = resume_state["files"]
+                target["done_dirs"] = resume_state["dirs"]
+                if not live:
+                    target["live"] = resume_state["live"]
+            if destination_format == "segments":
+                # ไฟล์ใหญ่ลง tree ตามปกติ ไฟล์เล็กลง segment (journal บันทึกเมื่อ segment ปิดแล้วเท่านั้น)
+                target["segments"] = SegmentWriter(
+                    destination_dir,
+                    SEGMENT_COMPRESSION,
+                    SEGMENT_SIZE_MB * 1024 * 1024,
+                    on_committed=lambda entries, journal=journal: record_segment_files(journal, entries),
+                )
+                target["previous_segments"] = SegmentIndex(previous_dir) if previous_dir else None
+            target["index"] = FileIndex(index_path_for(destination_base, drive_letter))
+            if destination_format != "chunks":
+                # โหมดต่อเนื่องเติมไฟล์ชื่อเดิมซ้ำได้ จึงต้องเช็คไฟล์ปลายทางเสมอ
+                target["writer"] = DestWriter(destination_dir, fresh=resume_state is None and not live)
+            if HASH_ON_COPY and destination_format != "chunks" and not live:
+                # ปลายทางแบบ chunks ตรวจจาก SHA-256 ของ chunk อยู่แล้ว
+                target["hashes"] = HashManifest(destination_dir)
+            if CATALOG and not live:
+                target["catalog"] = CatalogWriter(destination_base, snapshot_name(destination_base, destination_dir))
+        except Exception as e:
+            write_log(f"[ERROR] เปิดปลายทาง {destination_base} ไม่ได้: {e}")
+            journal.close()
+            continue
+        if resume_state is not None and not live:
+            write_log(f"⏯️ ทำต่อจาก snapshot ที่ค้างไว้ {destination_dir} (เสร็จแล้ว {len(target['done'])} ไฟล์)")
+        targets.append(target)
+    return targets
+
+
+def close_targets(targets, finished):
+    for target in targets:
+        target["index"].close()
+        if target["format"] == "chunks":
+            target["store"].flush()
+            target["manifest"].close(finished)
+        if target.get("hashes") is not None:
+            target["hashes"].close(finished)
+        if target.get("catalog") is not None:
+            try:
+                target["catalog"].close(finished)
+            except Exception as e:
+                write_log(f"[WARN] บันทึก catalog ของ {target['dir']} ไม่ได้: {e}")
+        if target["format"] == "segments":
+            repacked = target["segments"].close(finished)
+            if target["previous_segments"] is not None:
+                target["previous_segments"].close()
+            if repacked:
+                write_log(f"📦 แพ็ก segment เก่าที่เหลือไฟล์ใช้อยู่น้อยใหม่ {repacked} segment ({target['dir']})")
+        target["journal"].close(finished)
+        shutil.rmtree(target["tmp"], ignore_errors=True)
+
+
+def backup_drive_to_destinations(source_dir, bases, planned=None):
+    """
+    เดิน source ครั้งเดียวแล้วกระจายไฟล์ไปทุก destination base พร้อมกัน
+    planned = ข้อมูลไดรฟ์นี้ใน plan (--execute-plan) ใช้รายการไฟล์จาก plan แทนการสแกน
+    """
+    drive_letter = get_drive_letter(source_dir)
+    time_str = datetime.now().strftime(SNAPSHOT_TIME_FORMAT)
+
+    if not os.path.exists(source_dir):
         write_log(f"❌ ไม่สามารถเข้าถึงไดรฟ์ {source_dir} หรือไม่ได้เชื่อมต่อ")
         msg = f"❌ ไม่สามารถเข้าถึงไดรฟ์ {source_dir} หรือไม่ได้เชื่อมต่อ"
         show_notification("Backup Error", msg)
+        return
+
+    targets = open_targets(source_dir, bases, time_str)
+    entries = None
+    if planned is not None and targets:
+        scanned_at = datetime.strptime(planned["scanned_at"], SNAPSHOT_TIME_FORMAT)
+        if datetime.now() - scanned_at > timedelta(hours=PLAN_MAX_AGE_HOURS):
+            write_log(f"[WARN] plan ของ {source_dir} สแกนไว้ตั้งแต่ {scanned_at} เก่าเกิน {PLAN_MAX_AGE_HOURS} ชั่วโมง สแกนใหม่")
+        else:
+            entries = iter_plan_entries(planned["entries_path"])
+            write_log(f"📋 ใช้รายการไฟล์จาก plan ({planned['files']} ไฟล์ สแกนเมื่อ {scanned_at}) ไม่สแกน {source_dir} ใหม่")
+
+    # ขนาดจากดัชนีรอบก่อนใช้ประมาณ ETA ระหว่างที่ยังสแกนไม่จบ
+    expected_bytes = max((index_total_bytes(index_path_for(t["base"], drive_letter)) for t in targets), default=0)
+    if entries is not None:
+        expected_bytes = planned["bytes"]
+    progress = metrics.start_drive(source_dir, targets, expected_bytes)
+    finished = False
+    try:
+        if targets:
+            # fingerprint ของโฟลเดอร์เก็บในดัชนีของปลายทางแรก ปลายทางอื่นที่ไม่มีไฟล์ใน snapshot ก่อนจะคัดลอกตามปกติ
+            prescan = None
+            if entries is not None:
+                # รายการใน plan ผ่านตัวกรองมาแล้วตอนสแกน
+                file_filter = None
+                make_skeleton([t for t in targets if t["format"] != "chunks"], planned["entries_path"])
+                sync_folders(source_dir, targets, progress, entries=entries)
+            else:
+                file_filter = FileFilter.from_config(config, drive_letter)
+                if PRESCAN:
+                    prescan = Prescan(source_dir, targets[0]["index"], PRESCAN_FULL_EVERY_DAYS, PRESCAN_FORCE_FULL,
+                                      file_filter.signature() if file_filter else "")
+                get_engine()(source_dir, targets, progress, prescan, file_filter)
+            # ไดรฟ์หลุดระหว่างทาง → ถือว่ายังไม่เสร็จ เก็บ journal ไว้ทำต่อรอบหน้า
+            finished = os.path.exists(source_dir)
+            if finished and prescan is not None:
+                write_log(f"{prescan.finish()} ({source_dir})")
+            if file_filter is not None:
+                write_log(f"{file_filter.summary()} ({source_dir})")
+    finally:
+        metrics.finish_drive(progress)
+        for target in targets:
+            if finished:
+                try:
+                    # ประวัติความเร็วสำหรับประมาณเวลาใน plan
+                    record_run(target["index"], time.monotonic() - progress.started, progress.files_done, target["bytes"])
+                except Exception as e:
+                    write_log(f"[WARN] บันทึกประวัติความเร็วของ {target['dir']} ไม่ได้: {e}")
+                if target["live"]:
+                    remove_stale_live_files(target)
+                try:
+                    # เดินครบทั้งไดรฟ์แล้ว: ลบแถวของไฟล์ที่ถูกลบจากต้นทาง (ขนาดรวมในดัชนีไม่โตเกินจริง)
+                    removed_files, removed_dirs = target["index"].sweep()
+                    if removed_files or removed_dirs:
+                        write_log(f"🧹 ดัชนี {target['dir']}: ลบ {removed_files} ไฟล์ {removed_dirs} โฟลเดอร์ที่ไม่มีที่ต้นทางแล้ว")
+                except Exception as e:
+                    write_log(f"[WARN] เก็บกวาดดัชนีของ {target['dir']} ไม่ได้: {e}")
+                if target.get("writer") is not None:
+                    failed = target["writer"].finish()
+                    if failed:
+                        write_log(f"[WARN] ตั้งเวลาแก้ไขของโฟลเดอร์ใน {target['dir']} ไม่ได้ {failed} โฟลเดอร์")
+                    write_log(target["writer"].summary())
+        close_targets(targets, finished)
 
+    for target in targets:
+        destination_dir = target["dir"]
+        if not finished:
+            write_log(f"[WARN] สำรอง {source_dir} ที่ {destination_dir} ยังไม่เสร็จ จะทำต่อในรอบถัดไป")
+            continue
+        write_log(
+            f"✅ เสร็จสิ้นสำรอง {source_dir} ที่ {destination_dir} เวลา {datetime.now()} "
+            f"(copied {target['copied']}, linked {target['linked']}, resumed {target['resumed']}, "
+            f"errors {target['errors']})"
+        )
+        msg = f"✅ เสร็จสิ้นสำรอง {source_dir} ที่ {destination_dir} เวลา {datetime.now()}"
+        show_notification("Backup Completed", msg)
 
-def backup_drive(source_dir):
-    cleanup_old_backups(destination_bases)
 
-    with ThreadPoolExecutor(max_workers=len(destination_bases)) as dest_executor:
-        futures = []
-        for dest_base in destination_bases:
-            futures.append(dest_executor.submit(backup_drive_to_destination, source_dir, dest_base))
+def get_chunk_store(destination_base):
+    # หนึ่ง store ต่อ destination base ใช้ร่วมกันทุกไดรฟ์ (chunk ซ้ำข้ามไดรฟ์ก็เก็บครั้งเดียว)
+    with chunk_stores_lock:
+        if destination_base not in chunk_stores:
+            chunk_stores[destination_base] = ChunkStore(destination_base)
+        return chunk_stores[destination_base]
 
-        for f in as_completed(futures):
-            pass
 
+def sync_catalogs():
+    # หลัง retention: ลบ snapshot ที่ถูกลบไปแล้วออกจาก catalog รวม
+    for destination_base in destination_bases:
+        try:
+            catalog = Catalog(destination_base)
+            try:
+                imported, removed = catalog.sync()
+            finally:
+                catalog.close()
+        except Exception as e:
+            write_log(f"[WARN] sync catalog ของ {destination_base} ไม่ได้: {e}")
+            continue
+        if imported or removed:
+            write_log(f"🗂️ catalog {destination_base}: import {imported} snapshot, ลบ {removed} snapshot")
 
-def backup_all():
-    write_log(f"🕒 เริ่มกระบวนการสำรองข้อมูลทั้งหมด")
 
-    with ThreadPoolExecutor(max_workers=len(mapped_drives)) as drive_executor:
-        futures = []
-        for drive in mapped_drives:
-            futures.append(drive_executor.submit(backup_drive, drive))
+def backup_drive(source_dir, planned=None):
+    backup_drive_to_destinations(source_dir, destination_bases, planned)
 
-        for f in as_completed(futures):
-            pass
+
+def drive_jobs(func, *args, writes=True):
+    """งานต่อไดรฟ์สำหรับ JobScheduler เรียก func(drive, *args) writes=False: งานไม่เขียนปลายทาง ไม่ใช้ช่องของปลายทาง"""
+    destination_keys = {destination_disk_key(base) for base in destination_bases} if writes else set()
+    jobs = []
+    for drive in mapped_drives:
+        # ใช้ขนาดจากดัชนีรอบที่แล้วเป็นลำดับความสำคัญ: ไดรฟ์ใหญ่เริ่มก่อน
+        drive_letter = get_drive_letter(drive)
+        size = max((index_total_bytes(index_path_for(base, drive_letter)) for base in destination_bases), default=0)
+        jobs.append({
+            "name": drive,
+            "source_key": source_share_key(drive, share_groups),
+            "destination_keys": destination_keys,
+            "priority": size,
+            "func": func,
+            "args": (drive, *args),
+        })
+    return jobs
+
+
+def run_jobs(jobs):
+    scheduler = JobScheduler(
+        MAX_CONCURRENT_JOBS,
+        MAX_JOBS_PER_SOURCE,
+        MAX_JOBS_PER_DESTINATION,
+        on_error=lambda job, e: write_log(f"[ERROR] งานสำรอง {job['name']} ล้มเหลว: {e}"),
+    )
+    scheduler.run(jobs)
+
+
+def free_bytes(path):
+    # ปลายทางที่ยังไม่ถูกสร้าง ดูที่โฟลเดอร์แม่ที่มีอยู่
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return 0
+        path = parent
+    return shutil.disk_usage(path).free
+
+
+def plan_drive(source_dir, plan_dir, results):
+    """สแกนไดรฟ์อย่างเดียว เก็บรายการลง plan และเทียบกับ snapshot ก่อนหน้าของทุกปลายทาง"""
+    drive_letter = get_drive_letter(source_dir)
+    if not os.path.exists(source_dir):
+        write_log(f"❌ ไม่สามารถเข้าถึงไดรฟ์ {source_dir} หรือไม่ได้เชื่อมต่อ (ไม่อยู่ใน plan)")
+        return
+    time_str = datetime.now().strftime(SNAPSHOT_TIME_FORMAT)
+    started = time.monotonic()
+    errors = []
+
+    def on_error(path, e):
+        errors.append(path)
+        write_log(f"[ERROR] เกิดข้อผิดพลาดที่ {path}: {e}")
+
+    indexes = {base: FileIndex(index_path_for(base, drive_letter)) for base in destination_bases}
+    entries = PlanEntries(entries_path_for(plan_dir, drive_letter))
+    finished = False
+    try:
+        file_filter = FileFilter.from_config(config, drive_letter)
+        prescan = None
+        if PRESCAN:
+            # ใช้ fingerprint รอบก่อนได้ แต่ไม่บันทึกใหม่ เพราะไฟล์ยังไม่ได้ถูกคัดลอก
+            prescan = Prescan(source_dir, indexes[destination_bases[0]], PRESCAN_FULL_EVERY_DAYS, PRESCAN_FORCE_FULL,
+                              file_filter.signature() if file_filter else "", read_only=True)
+        for rel_path, s_stat, is_dir in scan_tree(
+            source_dir,
+            on_error=on_error,
+            on_skip=lambda path: write_log(f"[SKIP] ละเว้น symlink: {path}"),
+            workers=SCAN_THREADS,
+            prescan=prescan,
+            file_filter=file_filter,
+        ):
+            entries.add(rel_path, s_stat, is_dir)
+        finished = True
+
+        drive = {
+            "drive": source_dir,
+            "entries": os.path.basename(entries.path),
+            "scanned_at": time_str,
+            "scan_seconds": round(time.monotonic() - started, 1),
+            "scan_errors": len(errors),
+            "files": entries.files,
+            "dirs": entries.dirs,
+            "bytes": entries.bytes,
+            "destinations": [],
+        }
+        for base in destination_bases:
+            destination_format = destination_formats.get(base, "tree")
+            suffix = MANIFEST_SUFFIX if destination_format == "chunks" else ""
+            previous = None
+            if INCREMENTAL:
+                previous = find_previous_snapshot(os.path.join(base, f"{drive_letter}_{time_str}"), suffix)
+            previous_name = snapshot_name(base, previous)[:-len(suffix) or None] if previous else None
+            if previous is None:
+                counts = compare_with_previous(entries.sorted_files(), [], 0)
+                compared_with = "ไม่มี snapshot ก่อนหน้า"
+            elif os.path.exists(catalog_path_for(base, previous_name)):
+                counts = compare_with_previous(entries.sorted_files(),
+                                               read_catalog(catalog_path_for(base, previous_name)),
+                                               MTIME_TOLERANCE * 1_000_000_000)
+                compared_with = "catalog"
+            else:
+                counts = compare_with_index(entries.sorted_files(), indexes[base])
+                compared_with = "index"
+            copy_bytes = counts["new_bytes"] + counts["changed_bytes"]
+            drive["destinations"].append({
+                "base": base,
+                "format": destination_format,
+                "previous": previous_name,
+                "compared_with": compared_with,
+                **counts,
+                "copy_bytes": copy_bytes,
+                "estimated_seconds": estimate_seconds(fit_rates(load_history(indexes[base])), drive["files"], copy_bytes),
+            })
+        # อ่านครั้งเดียวเขียนทุกปลายทาง เวลาของไดรฟ์จึงเท่ากับปลายทางที่ช้าที่สุด
+        estimates = [d["estimated_seconds"] for d in drive["destinations"] if d["estimated_seconds"] is not None]
+        drive["estimated_seconds"] = max(estimates) if estimates else None
+        results[source_dir] = drive
+    finally:
+        entries.close(finished)
+        for index in indexes.values():
+            index.close()
+
+
+def plan_all(plan_dir):
+    """plan mode: สแกนทุกไดรฟ์แต่ไม่คัดลอก สรุปงาน พื้นที่ว่าง และเวลาโดยประมาณลง {plan_dir}/plan.json"""
+    write_log(f"📋 เริ่มสร้าง plan ที่ {plan_dir}")
+    results = {}
+    run_jobs(drive_jobs(plan_drive, plan_dir, results, writes=False))
+
+    drives = [results[drive] for drive in mapped_drives if drive in results]
+    destinations = []
+    for base in destination_bases:
+        required = sum(d["copy_bytes"] for drive in drives for d in drive["destinations"] if d["base"] == base)
+        free = free_bytes(base)
+        destinations.append({"base": base, "required_bytes": required, "free_bytes": free, "fits": required <= free})
+    estimates = [drive["estimated_seconds"] for drive in drives if drive["estimated_seconds"] is not None]
+    plan = {
+        "version": 1,
+        "created": datetime.now().strftime(SNAPSHOT_TIME_FORMAT),
+        "drives": drives,
+        "destinations": destinations,
+        "estimated_seconds": makespan(estimates, MAX_CONCURRENT_JOBS) if estimates else None,
+        "fits": all(d["fits"] for d in destinations),
+    }
+    write_plan(plan_dir, plan)
+    for line in format_plan(plan):
+        write_log(line)
+    return plan
+
+
+def backup_all(plan=None):
+    write_log(f"🕒 เริ่มกระบวนการสำรองข้อมูลทั้งหมด")
+    metrics.start(METRICS_HTTP_PORT, METRICS_BIND, METRICS_SUMMARY_INTERVAL, write_log)
+    if throttle.enabled():
+        write_log(f"🚦 จำกัดความเร็ว: {throttle.describe()}")
+    if "segments" in destination_formats.values() and available_compression(SEGMENT_COMPRESSION) != SEGMENT_COMPRESSION:
+        write_log(f"[WARN] [Segments] compression = {SEGMENT_COMPRESSION} ใช้ไม่ได้ (zstd ต้องติดตั้ง zstandard) ใช้ gzip แทน")
+    # ลบ snapshot เก่าครั้งเดียวต่อรอบ ทำงานเบื้องหลังขนานไปกับการคัดลอก
+    retention_thread = start_retention(destination_bases, retention_policy, write_log)
+
+    jobs = drive_jobs(backup_drive)
+    if plan is not None:
+        planned = {drive["drive"]: drive for drive in plan["drives"]}
+        for job in jobs:
+            job["args"] = (job["name"], planned.get(job["name"]))
+            if job["name"] not in planned:
+                write_log(f"[WARN] ไม่มี {job['name']} ใน plan จะสแกนตามปกติ")
+    run_jobs(jobs)
+    finish_retention(retention_thread, destination_bases, write_log, chunk_stores)
+    if CATALOG:
+        sync_catalogs()
+    if autotuner is not None:
+        try:
+            autotuner.save()
+            write_log(f"🎛️ autotune งานพร้อมกันต่อ share: {autotuner.describe()}")
+        except OSError as e:
+            write_log(f"[WARN] บันทึกค่า autotune ไม่ได้: {e}")
 
     write_log(f"🕒 กระบวนการสำรองข้อมูลทั้งหมดเสร็จสิ้น\n")
 
 
-schedule.every().day.at("01:00").do(backup_all)
+def next_nightly_time():
+    """เวลา backup_time ถัดไป (ชื่อ snapshot ที่โหมดต่อเนื่องเติมไว้ให้รอบกลางคืนทำต่อ)"""
+    now = datetime.now()
+    hour, minute = (int(part) for part in NIGHTLY_AT.split(":")[:2])
+    planned = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if planned <= now:
+        planned += timedelta(days=1)
+    return planned.strftime(SNAPSHOT_TIME_FORMAT)
+
+
+def trickle_copy(source_dir, files):
+    """โหมดต่อเนื่อง: คัดลอกไฟล์ที่เปลี่ยน [(rel_path, stat)] เข้า snapshot ของรอบกลางคืนถัดไป (เฉพาะปลายทางแบบ tree)"""
+    with live_targets_lock:
+        targets = live_targets.get(source_dir)
+        if targets is None:
+            bases = [base for base in destination_bases if destination_formats.get(base, "tree") == "tree"]
+            targets = live_targets[source_dir] = open_targets(source_dir, bases, next_nightly_time(), live=True)
+    if not targets:
+        return
+    before = [(t["copied"], t["linked"], t["errors"]) for t in targets]
+    job = CopyJob()
+    for rel_path, s_stat in files:
+        copy_pipeline.submit(job, copy_file_task, os.path.join(source_dir, rel_path), s_stat, targets, rel_path)
+    job.wait()
+    for target, (copied, linked, errors) in zip(targets, before):
+        target["journal"].flush()
+        write_log(
+            f"🔭 {source_dir} → {target['dir']}: ไฟล์ที่เปลี่ยน {len(files)} ไฟล์ "
+            f"(copied {target['copied'] - copied}, linked {target['linked'] - linked}, errors {target['errors'] - errors})"
+        )
+
+
+def close_live_targets():
+    with live_targets_lock:
+        for targets in live_targets.values():
+            close_targets(targets, finished=False)
+        live_targets.clear()
+
+
+def start_watcher():
+    if not RESUME:
+        write_log("[WARN] โหมดต่อเนื่องต้องใช้ resume = true (รอบกลางคืนทำต่อจาก snapshot ที่เติมไว้) ไม่เปิดโหมดต่อเนื่อง")
+        return None
+    started = Watcher(
+        mapped_drives,
+        trickle_copy,
+        filters={d: FileFilter.from_config(config, get_drive_letter(d)) for d in mapped_drives},
+        methods=methods_from_config(config, mapped_drives),
+        poll_seconds=WATCH_POLL_SECONDS,
+        sweep_seconds=WATCH_SWEEP_MINUTES * 60,
+        hot_seconds=WATCH_HOT_MINUTES * 60,
+        settle_seconds=WATCH_SETTLE_SECONDS,
+        on_log=write_log,
+    )
+    started.start()
+    write_log(f"🔭 โหมดต่อเนื่อง: {started.describe()}")
+    return started
+
+
+def nightly_backup():
+    """รอบตามเวลา: โหมดต่อเนื่องหยุดคัดลอกระหว่างนี้ รอบนี้ทำต่อจาก snapshot ที่เติมไว้ระหว่างวันแล้วปิด snapshot"""
+    if watcher is not None:
+        watcher.pause()
+        close_live_targets()
+    try:
+        backup_all()
+    finally:
+        if watcher is not None:
+            watcher.resume()
+
+
+schedule.every().day.at(NIGHTLY_AT).do(nightly_backup)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="สำรองข้อมูลจาก mapped drive ตาม config.ini")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=None, help="ทับค่า engine ใน config.ini")
+    parser.add_argument("--full-scan", action="store_true", help="prescan: list ทุกโฟลเดอร์ในรอบนี้")
+    parser.add_argument("--plan", metavar="PLAN_DIR", help="สแกนอย่างเดียว สรุปงานลง PLAN_DIR แล้วจบ (ไม่คัดลอก)")
+    parser.add_argument("--execute-plan", metavar="PLAN_DIR", help="สำรองครั้งเดียวตาม plan โดยไม่สแกนใหม่ แล้วจบ")
+    parser.add_argument("--watch", action="store_true", help="โหมดต่อเนื่อง: คัดลอกไฟล์ที่เปลี่ยนระหว่างวัน (ดู [Watch])")
+    args = parser.parse_args()
+    if args.engine:
+        ENGINE = args.engine
+    PRESCAN_FORCE_FULL = args.full_scan
+    print("Engine:", ENGINE)
+
+    if args.plan:
+        # exit code 1 = พื้นที่ปลายทางไม่พอ
+        sys.exit(0 if plan_all(args.plan)["fits"] else 1)
+    if args.execute_plan:
+        backup_all(load_plan(args.execute_plan))
+        sys.exit(0)
+
     write_log("🚀 โปรแกรมสำรองข้อมูลทำงานอยู่... (รอเวลา)")
     backup_all()
+    if WATCH or args.watch:
+        watcher = start_watcher()
     while True:
         schedule.run_pending()
         time.sleep(60)
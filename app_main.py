@@ -1,7 +1,7 @@
 import os
 import shutil
 import filecmp
-from datetime import datetime, timedelta
+from datetime import datetime
 import schedule
 import time
 
@@ -10,6 +10,9 @@ import configparser
 import threading
 import tkinter as tk
 
+from backup_logger import setup_logger_from_config, write_log
+from filters import FileFilter
+from retention import policy_from_config, start_retention
 
 config = configparser.ConfigParser()
 config.read("config.ini", encoding="utf-8")
@@ -21,15 +24,23 @@ destination_bases_str = config.get("BackupSettings", "destination_base", fallbac
 destination_bases = [d.strip() for d in destination_bases_str.split(",") if d.strip()]
 
 log_file = config.get("BackupSettings", "log_file", fallback=r"C:\Backup_AllMappedDrives\backup_log.txt")
+setup_logger_from_config(config, log_file)  # log กลาง: เขียนเป็นชุดผ่าน thread เดียว
 
 MAX_DEPTH = config.getint("BackupSettings", "max_depth", fallback=50)
 MAX_BACKUP_AGE_DAYS = config.getint("BackupSettings", "max_backup_age_days", fallback=7)
+INCREMENTAL = config.getboolean("BackupSettings", "incremental", fallback=True)
+retention_policy = policy_from_config(config, MAX_BACKUP_AGE_DAYS)
+
+SNAPSHOT_TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+MTIME_TOLERANCE = 2  # วินาที (เทียบเท่า /FFT ของ robocopy)
 
 print("Mapped Drives:", mapped_drives)
 print("Destination Bases:", destination_bases)
 print("Log File:", log_file)
 print("Max Depth:", MAX_DEPTH)
 print("Max Backup Age Days:", MAX_BACKUP_AGE_DAYS)
+print("Retention:", retention_policy)
+print("Incremental:", INCREMENTAL)
 
 
 def show_notification(title, message, duration=1800):
@@ -63,38 +74,45 @@ def show_notification(title, message, duration=1800):
     threading.Thread(target=run, daemon=True).start()
 
 
-def write_log(message):
-    # สร้างโฟลเดอร์ไฟล์ log ถ้ายังไม่มี
-    log_dir = os.path.dirname(log_file)
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_line = f"[{timestamp}] {message}\n"
-    print(log_line, end="")  # พิมพ์ออก console ด้วย
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(log_line)
-
-def cleanup_old_backups(base_folders, max_age_days=MAX_BACKUP_AGE_DAYS):
-    now = datetime.now()
-    cutoff = now - timedelta(days=max_age_days)
-
-    for base_folder in base_folders:
-        if not os.path.exists(base_folder):
+def find_previous_snapshot(destination_dir):
+    """
+    หา snapshot ล่าสุดก่อนหน้าของไดรฟ์เดียวกันในโฟลเดอร์ปลายทาง
+    โดยดูจาก timestamp ในชื่อโฟลเดอร์ {drive}_{timestamp}
+    """
+    parent, name = os.path.split(destination_dir)
+    prefix = name[:-len(datetime.now().strftime(SNAPSHOT_TIME_FORMAT))]
+    if not os.path.isdir(parent):
+        return None
+
+    latest = None
+    for item in os.listdir(parent):
+        if not item.startswith(prefix) or item >= name:
+            continue
+        try:
+            datetime.strptime(item[len(prefix):], SNAPSHOT_TIME_FORMAT)
+        except ValueError:
             continue
+        if os.path.isdir(os.path.join(parent, item)) and (latest is None or item > latest):
+            latest = item
 
-        for item in os.listdir(base_folder):
-            item_path = os.path.join(base_folder, item)
-            try:
-                if os.path.isdir(item_path):
-                    mod_time = datetime.fromtimestamp(os.path.getmtime(item_path))
-                    if mod_time < cutoff:
-                        shutil.rmtree(item_path)
-                        write_log(f"Deleted old backup: {item_path}")
-            except Exception as e:
-                write_log(f"[ERROR] ไม่สามารถลบ backup เก่า {item_path}: {e}")
-
-def sync_folders(source, destination, depth=0):
+    return os.path.join(parent, latest) if latest else None
+
+def link_from_previous(s_path, d_path, p_path):
+    # hard-link จาก snapshot ก่อนหน้า ถ้าขนาดและเวลาแก้ไขไม่เปลี่ยน
+    if p_path is None:
+        return False
+    try:
+        s_stat = os.stat(s_path)
+        p_stat = os.stat(p_path)
+        if s_stat.st_size != p_stat.st_size or abs(s_stat.st_mtime - p_stat.st_mtime) > MTIME_TOLERANCE:
+            return False
+        os.link(p_path, d_path)
+        return True
+    except OSError:
+        # ไม่มีไฟล์เดิม, อยู่คนละ volume หรือจำนวน link เต็ม → คัดลอกตามปกติ
+        return False
+
+def sync_folders(source, destination, previous=None, depth=0, file_filter=None, rel_dir=""):
     if depth > MAX_DEPTH:
         write_log(f"[WARN] เกินความลึก {MAX_DEPTH} ที่: {source}")
         return
@@ -106,34 +124,43 @@ def sync_folders(source, destination, depth=0):
         for item in os.listdir(source):
             s_path = os.path.join(source, item)
             d_path = os.path.join(destination, item)
+            p_path = os.path.join(previous, item) if previous else None
 
             if os.path.islink(s_path):
                 write_log(f"[SKIP] ละเว้น symlink: {s_path}")
                 continue
 
-            if os.path.isdir(s_path):
-                sync_folders(s_path, d_path, depth + 1)
+            is_dir = os.path.isdir(s_path)
+            rel_path = os.path.join(rel_dir, item) if rel_dir else item
+            if file_filter is not None and file_filter.excluded(rel_path, None if is_dir else os.stat(s_path), is_dir):
+                continue
+
+            if is_dir:
+                sync_folders(s_path, d_path, p_path, depth + 1, file_filter, rel_path)
             else:
                 os.makedirs(os.path.dirname(d_path), exist_ok=True)
 
+                if not os.path.exists(d_path) and link_from_previous(s_path, d_path, p_path):
+                    continue
+
                 if not os.path.exists(d_path) or not filecmp.cmp(s_path, d_path, shallow=False):
                     shutil.copy2(s_path, d_path)
-                    write_log(f"Copied: {s_path} → {d_path}")
+                    write_log(f"Copied: {s_path} → {d_path}", level="DEBUG")
     except Exception as e:
         write_log(f"[ERROR] เกิดข้อผิดพลาดที่ {source}: {e}")
 
 def backup_drive(source_dir):
-    # ลบ backup เก่าก่อนสำรองใหม่ ทุกโฟลเดอร์ปลายทาง
-    cleanup_old_backups(destination_bases)
-
     drive_letter = source_dir.strip("\\").replace(":", "")
-    time_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    time_str = datetime.now().strftime(SNAPSHOT_TIME_FORMAT)
 
     for destination_base in destination_bases:
         destination_dir = os.path.join(destination_base, f"{drive_letter}_{time_str}")
+        previous_dir = find_previous_snapshot(destination_dir) if INCREMENTAL else None
         write_log(f"🔁 เริ่มสำรองข้อมูลจาก {source_dir} → {destination_dir}")
+        if previous_dir:
+            write_log(f"🔗 ใช้ snapshot ก่อนหน้า {previous_dir} เป็นฐาน (hard-link ไฟล์ที่ไม่เปลี่ยน)")
         if os.path.exists(source_dir):
-            sync_folders(source_dir, destination_dir)
+            sync_folders(source_dir, destination_dir, previous_dir, file_filter=FileFilter.from_config(config, drive_letter))
             write_log(f"✅ เสร็จสิ้นสำรอง {source_dir} ที่ {destination_dir} เวลา {datetime.now()}")
             msg = f"✅ เสร็จสิ้นสำรอง {source_dir} ที่ {destination_dir} เวลา {datetime.now()}"
             show_notification("Backup Completed", msg)
@@ -144,8 +171,11 @@ def backup_drive(source_dir):
 
 def backup_all():
     write_log(f"🕒 เริ่มกระบวนการสำรองข้อมูลทั้งหมด")
+    # ลบ snapshot เก่าครั้งเดียวต่อรอบ ทำงานเบื้องหลังขนานไปกับการคัดลอก
+    retention_thread = start_retention(destination_bases, retention_policy, write_log)
     for drive in mapped_drives:
         backup_drive(drive)
+    retention_thread.join()
     write_log(f"🕒 กระบวนการสำรองข้อมูลทั้งหมดเสร็จสิ้น\n")
 
 schedule.every().day.at("01:00").do(backup_all)
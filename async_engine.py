@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scanner import list_level
+
+# engine แบบ asyncio สำหรับ share ที่ latency สูงและมีไฟล์เล็กจำนวนมาก (engine = async)
+# - event loop เดียวใน thread ของตัวเอง ใช้ร่วมกันทุกไดรฟ์ที่สำรองพร้อมกัน
+# - งานที่บล็อก (scandir, stat, open, copy) ส่งไปทำใน offload pool
+# - จำนวนงานที่ค้างอยู่ต่อ share ต้นทางคุมด้วย asyncio.Semaphore แทนการเพิ่มจำนวน thread
+# ทั้งการ list โฟลเดอร์และการคัดลอกไฟล์ของทั้งต้นไม้จึงซ้อนทับกันได้ ไม่ต้องรอกันทีละโฟลเดอร์
+
+
+class AsyncEngine:
+    def __init__(self, offload_threads=64, max_in_flight_per_share=256, file_limit=None):
+        self.offload = ThreadPoolExecutor(max_workers=offload_threads, thread_name_prefix="async-offload")
+        self.max_in_flight = max(1, max_in_flight_per_share)
+        # file_limit(share_key) → จำนวนไฟล์ที่คัดลอกพร้อมกันได้ตอนนี้ (autotune.py) None = คุมด้วย semaphore อย่างเดียว
+        self.file_limit = file_limit
+        self.loop = None
+        self.semaphores = {}  # share key → asyncio.Semaphore (ใช้ใน thread ของ loop เท่านั้น)
+        self.file_slots = {}  # share key → [asyncio.Condition, จำนวนไฟล์ที่กำลังคัดลอก]
+        self.lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="async-engine", daemon=True).start()
+            return self.loop
+
+    def _semaphore(self, share_key):
+        sem = self.semaphores.get(share_key)
+        if sem is None:
+            sem = self.semaphores[share_key] = asyncio.Semaphore(self.max_in_flight)
+        return sem
+
+    def run_tree(self, source, share_key, on_dir, on_file, on_error=None, on_skip=None, prescan=None,
+                 file_filter=None):
+        """
+        เดินต้นไม้ใต้ source แล้วเรียก on_dir(rel_dir, dir_stat) และ on_file(s_path, s_stat, rel_path) ใน offload pool
+        โฟลเดอร์ถูกส่งให้ on_dir ก่อนไฟล์ข้างในเสมอ (ไม่รวม root) บล็อกจนกว่าทั้งต้นไม้จะเสร็จ
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._run_tree(source, share_key, on_dir, on_file, on_error, on_skip, prescan, file_filter),
+            self._ensure_loop(),
+        )
+        return future.result()
+
+    async def _offload(self, sem, func, *args):
+        # เรียกหลังจาก acquire sem แล้วเท่านั้น คืน permit เมื่องานใน pool เสร็จ
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.offload, func, *args)
+        finally:
+            sem.release()
+
+    async def _acquire_file_slot(self, share_key):
+        slot = self.file_slots.get(share_key)
+        if slot is None:
+            slot = self.file_slots[share_key] = [asyncio.Condition(), 0]
+        async with slot[0]:
+            # ค่า limit เปลี่ยนได้ระหว่างรอ เช็คใหม่ทุกครั้งที่มีไฟล์เสร็จ
+            await slot[0].wait_for(lambda: slot[1] < self.file_limit(share_key))
+            slot[1] += 1
+        return slot
+
+    async def _copy_file(self, sem, slot, on_file, *args):
+        try:
+            await self._offload(sem, on_file, *args)
+        finally:
+            if slot is not None:
+                async with slot[0]:
+                    slot[1] -= 1
+                    slot[0].notify_all()
+
+    async def _run_tree(self, source, share_key, on_dir, on_file, on_error, on_skip, prescan, file_filter):
+        sem = self._semaphore(share_key)
+        tasks = set()
+
+        def spawn(coro, path):
+            async def guarded():
+                try:
+                    await coro
+                except Exception as e:
+                    if on_error:
+                        on_error(path, e)
+
+            task = asyncio.ensure_future(guarded())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        async def walk(rel_dir, dir_stat):
+            await sem.acquire()
+            items, _ = await self._offload(
+                sem, list_level, source, rel_dir, dir_stat, on_error, on_skip, prescan, file_filter
+            )
+            for rel_path, s_stat, is_dir in items:
+                path = os.path.join(source, rel_path)
+                slot = None
+                if not is_dir and self.file_limit is not None:
+                    slot = await self._acquire_file_slot(share_key)
+                await sem.acquire()  # เต็มแล้วรอ = backpressure ไม่สร้าง task ค้างไว้ไม่จำกัด
+                if is_dir:
+                    spawn(enter(rel_path, s_stat), path)
+                else:
+                    spawn(self._copy_file(sem, slot, on_file, path, s_stat, rel_path), path)
+
+        async def enter(rel_dir, dir_stat):
+            await self._offload(sem, on_dir, rel_dir, dir_stat)
+            await walk(rel_dir, dir_stat)
+
+        root_stat = prescan.root_stat() if prescan is not None else None
+        spawn(walk("", root_stat), source)
+        while tasks:
+            await asyncio.gather(*list(tasks))
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+
+# ปรับจำนวนงานคัดลอกที่ทำพร้อมกันต่อ share ต้นทางเอง (AIMD) แทนการเดา max_threads ค่าเดียวทุก share
+# - วัด throughput (ไฟล์/วินาที และไบต์/วินาที) และ latency เฉลี่ยต่อไฟล์ เป็นช่วง ๆ ละ window_seconds
+# - throughput ดีขึ้น → เพิ่มทีละ 1 (additive increase)
+# - latency สูงขึ้นเกิน LATENCY_FACTOR เท่าของค่าต่ำสุดที่เคยเห็น → ลดเหลือ DECREASE เท่า (multiplicative decrease)
+# - เพิ่มแล้ว throughput ไม่ดีขึ้น → กลับไปค่าที่ดีที่สุด รอ HOLD_WINDOWS ช่วงแล้วค่อยลองเพิ่มใหม่
+# ค่าที่ดีที่สุดของแต่ละ share เก็บลง state_file รอบถัดไปเริ่มจากค่านั้น
+
+MIN_GAIN = 0.01  # throughput ต้องดีขึ้นอย่างน้อยเท่านี้ (สัดส่วน) จึงนับว่าดีขึ้น
+LATENCY_FACTOR = 1.5
+DECREASE = 0.75
+HOLD_WINDOWS = 6
+MIN_OPS = 8  # ช่วงที่มีไฟล์น้อยกว่านี้ยังไม่ตัดสิน
+
+
+class ShareState:
+    def __init__(self, limit):
+        self.limit = limit
+        self.best_limit = limit
+        self.in_flight = 0
+        self.window_start = time.monotonic()
+        self.ops = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.last_rates = None  # (ไฟล์/วินาที, ไบต์/วินาที) ของช่วงก่อน
+        self.best_rates = None
+        self.base_latency = None
+        self.hold = 0
+        self.direction = 1  # 1 = กำลังเพิ่ม, -1 = กำลังลด, 0 = พักที่ค่าที่ดีที่สุด
+        self.probe_down = True
+        self.settling = False  # ช่วงแรกหลังเปลี่ยนค่ายังมีงานที่เริ่มตอนค่าเดิมปนอยู่ ไม่ใช้ตัดสิน
+
+
+class AutoTuner:
+    def __init__(self, state_path, initial=4, maximum=64, window_seconds=5.0, on_change=None):
+        self.state_path = state_path
+        self.initial = max(1, initial)
+        self.maximum = max(self.initial, maximum)
+        self.window_seconds = window_seconds
+        self.on_change = on_change
+        self.cond = threading.Condition()
+        self.shares = {}
+        self.saved = self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return {share: int(entry["limit"]) for share, entry in json.load(f).items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _state(self, share_key):
+        state = self.shares.get(share_key)
+        if state is None:
+            limit = min(self.maximum, max(1, self.saved.get(share_key, self.initial)))
+            state = self.shares[share_key] = ShareState(limit)
+        return state
+
+    def limit(self, share_key):
+        with self.cond:
+            return self._state(share_key).limit
+
+    def acquire(self, share_key):
+        """จองที่ของงานหนึ่งงาน บล็อกจนกว่างานที่ค้างของ share นี้จะน้อยกว่าค่าที่ปรับไว้"""
+        with self.cond:
+            state = self._state(share_key)
+            while state.in_flight >= state.limit:
+                self.cond.wait()
+            state.in_flight += 1
+
+    def release(self, share_key, nbytes, seconds):
+        with self.cond:
+            self._state(share_key).in_flight -= 1
+            self._record_locked(share_key, nbytes, seconds)
+            self.cond.notify_all()
+
+    def record(self, share_key, nbytes, seconds):
+        """บันทึกผลของงานที่ไม่ได้ผ่าน acquire (engine ที่คุมจำนวนงานเองโดยถาม limit())"""
+        with self.cond:
+            self._record_locked(share_key, nbytes, seconds)
+            self.cond.notify_all()
+
+    def _record_locked(self, share_key, nbytes, seconds):
+        state = self._state(share_key)
+        state.ops += 1
+        state.bytes += nbytes
+        state.busy += seconds
+        elapsed = time.monotonic() - state.window_start
+        if elapsed < self.window_seconds or state.ops < MIN_OPS:
+            return
+        rates = (state.ops / elapsed, state.bytes / elapsed)
+        latency = state.busy / state.ops
+        old = state.limit
+        if state.settling:
+            state.settling = False
+        else:
+            self._adjust(state, rates, latency)
+            state.settling = state.limit != old
+        state.window_start = time.monotonic()
+        state.ops = state.bytes = 0
+        state.busy = 0.0
+        if state.limit != old and self.on_change:
+            self.on_change(share_key, old, state.limit, rates, latency)
+
+    def _adjust(self, state, rates, latency):
+        # เพิ่มหนึ่งงานควรได้ throughput เพิ่มราว 1/limit ถ้า share ยังไม่อิ่มตัว ใช้ครึ่งหนึ่งของนั้นเป็นเกณฑ์
+        gain = max(MIN_GAIN, 0.5 / state.limit)
+        last, best = state.last_rates, state.best_rates
+        better = last is None or any(new > old * (1 + gain) for new, old in zip(rates, last))
+        kept = last is None or all(new >= old * (1 - gain) for new, old in zip(rates, last))
+        if best is None or any(new > old * (1 + gain) for new, old in zip(rates, best)):
+            state.best_rates = rates
+            state.best_limit = state.limit
+        elif state.limit < state.best_limit and all(new >= old * (1 - gain) for new, old in zip(rates, best)):
+            state.best_limit = state.limit  # ได้เท่ากันด้วยงานพร้อมกันน้อยกว่า ใช้ค่าที่น้อยกว่า
+        # ค่าต่ำสุดที่เคยเห็น ค่อย ๆ ขยับขึ้นได้ (งานแต่ละช่วงมีขนาดไฟล์ไม่เท่ากัน)
+        state.base_latency = latency if state.base_latency is None else min(latency, state.base_latency * 1.02)
+        state.last_rates = rates
+
+        if latency > state.base_latency * LATENCY_FACTOR and not better:
+            # share เริ่มแน่น: ลดแบบทวีคูณแล้วค่อย ๆ เพิ่มใหม่ (ค่าที่ดีที่สุดเดิมใช้ไม่ได้แล้ว)
+            state.limit = state.best_limit = max(1, int(state.limit * DECREASE))
+            state.best_rates = state.last_rates = None
+            state.direction = 1
+            state.hold = 0
+        elif state.direction > 0 and better and state.limit < self.maximum:
+            state.limit += 1
+        elif state.direction < 0 and kept and state.limit > 1:
+            state.limit -= 1
+        elif state.hold < HOLD_WINDOWS:
+            state.direction = 0
+            state.limit = state.best_limit
+            state.hold += 1
+        else:
+            # ครบช่วงพักแล้วลองขยับอีกครั้ง สลับลด/เพิ่ม (งานและเครือข่ายเปลี่ยนได้ และอาจได้เท่าเดิมด้วยค่าที่น้อยกว่า)
+            state.hold = 0
+            state.direction = -1 if state.probe_down else 1
+            state.probe_down = not state.probe_down
+            state.limit = min(self.maximum, max(1, state.limit + state.direction))
+
+    def save(self):
+        """เก็บค่าที่ดีที่สุดของทุก share (รวม share ที่รอบนี้ไม่ได้ใช้) ลง state_file"""
+        with self.cond:
+            limits = dict(self.saved)
+            limits.update({share: state.best_limit for share, state in self.shares.items()})
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({share: {"limit": limit} for share, limit in sorted(limits.items())}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.state_path)
+        self.saved = limits
+
+    def describe(self):
+        with self.cond:
+            limits = {share: state.best_limit for share, state in self.shares.items()} or self.saved
+        return ", ".join(f"{share}={limit}" for share, limit in sorted(limits.items())) or "-"
@@ -0,0 +1,190 @@
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+# ระบบ log กลางที่ใช้ร่วมกันทั้ง V2.py, V5.py และ app_main.py
+# - write_log แค่ใส่ข้อความลงคิวที่จำกัดขนาด ไม่บล็อก worker ที่กำลังคัดลอกไฟล์
+# - มี writer thread เดียวที่เปิดไฟล์ค้างไว้ และ flush เป็นชุดตามจำนวนหรือเวลา
+# - หมุนไฟล์ log ตามขนาด และตั้งระดับ log ได้ (บรรทัดต่อไฟล์เป็น DEBUG สุ่มเก็บหรือปิดได้)
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40}
+
+_settings = {
+    "log_file": None,
+    "level": LEVELS["DEBUG"],
+    "sample_every": 1,
+    "max_bytes": 10 * 1024 * 1024,
+    "backup_count": 5,
+    "batch_size": 200,
+    "flush_interval": 1.0,
+}
+_queue = queue.Queue(maxsize=10000)
+_thread = None
+_lock = threading.Lock()
+_debug_counter = 0
+_dropped = 0
+
+
+def setup_logger(log_file, level="DEBUG", sample_every=1, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 batch_size=200, flush_interval=1.0, queue_size=10000):
+    global _queue, _thread
+    _settings.update(
+        log_file=log_file,
+        level=LEVELS.get(str(level).upper(), LEVELS["DEBUG"]),
+        sample_every=max(0, sample_every),
+        max_bytes=max_bytes,
+        backup_count=backup_count,
+        batch_size=max(1, batch_size),
+        flush_interval=flush_interval,
+    )
+    with _lock:
+        if _thread is None:
+            _queue = queue.Queue(maxsize=queue_size)
+            _thread = threading.Thread(target=_writer, name="log-writer", daemon=True)
+            _thread.start()
+            atexit.register(close_logger)
+
+
+def setup_logger_from_config(config, log_file):
+    setup_logger(
+        log_file,
+        level=config.get("Logging", "log_level", fallback="DEBUG"),
+        sample_every=config.getint("Logging", "log_sample_every", fallback=1),
+        max_bytes=config.getint("Logging", "log_max_mb", fallback=10) * 1024 * 1024,
+        backup_count=config.getint("Logging", "log_backup_count", fallback=5),
+        batch_size=config.getint("Logging", "log_batch_size", fallback=200),
+        flush_interval=config.getfloat("Logging", "log_flush_interval", fallback=1.0),
+        queue_size=config.getint("Logging", "log_queue_size", fallback=10000),
+    )
+
+
+def _infer_level(message):
+    if message.startswith("[ERROR]"):
+        return "ERROR"
+    if message.startswith("[WARN]"):
+        return "WARN"
+    return "INFO"
+
+
+def write_log(message, level=None):
+    """
+    ใส่ข้อความลงคิว log ถ้าไม่ระบุ level จะดูจาก prefix [ERROR]/[WARN]
+    บรรทัดระดับ DEBUG (เช่น Copied: ต่อไฟล์) จะเก็บทุก ๆ log_sample_every บรรทัด และถูกทิ้งถ้าคิวเต็ม
+    """
+    global _debug_counter, _dropped
+    level = level or _infer_level(message)
+    if LEVELS[level] < _settings["level"]:
+        return
+    if level == "DEBUG":
+        every = _settings["sample_every"]
+        if every == 0:
+            return
+        with _lock:
+            _debug_counter += 1
+            if _debug_counter % every:
+                return
+
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    log_line = f"[{timestamp}] {message}\n"
+    if _thread is None:
+        print(log_line, end="")
+        return
+    if level == "DEBUG":
+        try:
+            _queue.put_nowait(log_line)
+        except queue.Full:
+            with _lock:
+                _dropped += 1
+    else:
+        _queue.put(log_line)
+
+
+def _rotate(f, log_file):
+    f.close()
+    count = _settings["backup_count"]
+    if count > 0:
+        for i in range(count - 1, 0, -1):
+            src = f"{log_file}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{log_file}.{i + 1}")
+        os.replace(log_file, f"{log_file}.1")
+    else:
+        os.remove(log_file)
+    return open(log_file, "a", encoding="utf-8")
+
+
+def _write_batch(f, batch):
+    global _dropped
+    with _lock:
+        dropped, _dropped = _dropped, 0
+    if dropped:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        batch.append(f"[{timestamp}] [WARN] คิว log เต็ม ทิ้งบรรทัด DEBUG ไป {dropped} บรรทัด\n")
+    text = "".join(batch)
+    sys.stdout.write(text)
+    sys.stdout.flush()
+    if f is not None:
+        f.write(text)
+        f.flush()
+
+
+def _open_log():
+    log_file = _settings["log_file"]
+    log_dir = os.path.dirname(log_file)
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    return open(log_file, "a", encoding="utf-8")
+
+
+def _writer():
+    f = None
+    batch = []
+    last_flush = time.monotonic()
+    running = True
+    while running:
+        timeout = max(0.0, _settings["flush_interval"] - (time.monotonic() - last_flush))
+        try:
+            item = _queue.get(timeout=timeout)
+            if item is None:
+                running = False
+            else:
+                batch.append(item)
+        except queue.Empty:
+            pass
+
+        if batch and (not running or len(batch) >= _settings["batch_size"]
+                      or time.monotonic() - last_flush >= _settings["flush_interval"]):
+            try:
+                if f is None:
+                    f = _open_log()
+                _write_batch(f, batch)
+                if _settings["max_bytes"] and f.tell() >= _settings["max_bytes"]:
+                    f = _rotate(f, _settings["log_file"])
+            except Exception as e:
+                print(f"[LOG ERROR] {e}")
+                if f is not None:
+                    try:
+                        f.close()
+                    except Exception:
+                        pass
+                f = None
+            batch = []
+        if not batch:
+            last_flush = time.monotonic()
+
+    if f is not None:
+        f.close()
+
+
+def close_logger():
+    """flush ข้อความที่ค้างอยู่ทั้งหมดแล้วหยุด writer thread"""
+    global _thread
+    with _lock:
+        thread, _thread = _thread, None
+    if thread is not None:
+        _queue.put(None)
+        thread.join()
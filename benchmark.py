@@ -0,0 +1,333 @@
+import argparse
+import builtins
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+# ชุดวัดความเร็วของ engine สำรองข้อมูล (รันบน Linux ได้ ไม่ต้องมี share จริง)
+# - สร้างต้นไม้ต้นทางสังเคราะห์แบบทำซ้ำได้ (seed เดิม = ไฟล์เดิม เนื้อหาเดิม เวลาแก้ไขเดิม)
+# - ใส่ latency ต่อการเรียก scandir/stat/open บนต้นทางเพื่อจำลอง SMB ได้
+# - แต่ละ engine รันใน process แยก รายงาน files/s, MB/s, จำนวน syscall, peak RSS และเวลาเป็น JSON
+#   (dest_calls = จำนวนการเรียก stat/mkdir/utime/chmod/... บนปลายทาง แยกตามชนิด)
+#
+# การใช้งาน:
+#   python benchmark.py run --profile mixed --engines threads,async,sequential --latency-ms 2 --workdir /tmp/bench
+#   python benchmark.py generate /tmp/bench/src --profile tiny --seed 1
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINES = ["threads", "async", "sequential", "robocopy"]
+DEST_CALLS = ["stat", "lstat", "mkdir", "utime", "chmod", "link", "replace", "rename", "remove", "scandir", "open"]
+KB = 1024
+MB = 1024 * 1024
+
+# (จำนวนไฟล์, จำนวนโฟลเดอร์, ความลึก, ขนาดเล็กสุด, ขนาดใหญ่สุด) ต่อกลุ่ม ที่ scale = 1.0
+PROFILES = {
+    "tiny": [(20000, 400, 3, 0, 4 * KB)],
+    "deep": [(2000, 40, 40, 1 * KB, 64 * KB)],
+    "huge": [(3, 1, 1, 256 * MB, 512 * MB)],
+    "mixed": [
+        (10000, 200, 3, 0, 4 * KB),
+        (1000, 20, 30, 1 * KB, 64 * KB),
+        (200, 20, 4, 1 * MB, 8 * MB),
+        (2, 1, 1, 256 * MB, 256 * MB),
+    ],
+}
+
+
+def _write_random(path, size, rng):
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            n = min(remaining, MB)
+            f.write(rng.randbytes(n))
+            remaining -= n
+
+
+def generate_tree(root, profile, seed=1, scale=1.0):
+    """สร้างต้นไม้ตาม profile คืน (จำนวนไฟล์, จำนวนไบต์)"""
+    rng = random.Random(seed)
+    base_time = 1_700_000_000
+    files = total = 0
+    for group, (n_files, n_dirs, depth, min_size, max_size) in enumerate(PROFILES[profile]):
+        n_files = max(1, int(n_files * scale))
+        n_dirs = max(1, min(n_dirs, n_files))
+        dirs = []
+        for d in range(n_dirs):
+            # ความลึกกระจายตั้งแต่ 1 ถึง depth ชั้น
+            parts = [f"g{group}"] + [f"d{d}_{level}" for level in range(rng.randint(1, depth))]
+            dirs.append(os.path.join(root, *parts))
+        for i in range(n_files):
+            directory = dirs[i % n_dirs]
+            os.makedirs(directory, exist_ok=True)
+            size = rng.randint(min_size, max_size)
+            if max_size >= MB and scale < 1:
+                size = int(size * scale)  # ย่อ profile: ไฟล์ใหญ่เล็กลงด้วย ไม่ใช่แค่จำนวนไฟล์
+            path = os.path.join(directory, f"f{i}.bin")
+            _write_random(path, size, rng)
+            mtime = base_time + rng.randint(0, 86400 * 365)
+            os.utime(path, (mtime, mtime))
+            files += 1
+            total += size
+    return files, total
+
+
+def tree_totals(root):
+    files = total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            files += 1
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return files, total
+
+
+# --------------------- WORKER (process แยกต่อ engine) ---------------------
+
+def inject_latency(roots, delay):
+    """หน่วงทุกการเรียก scandir/stat/lstat/open ที่ path อยู่ใต้ต้นทาง (จำลอง round-trip ของ SMB)"""
+    prefixes = tuple(root.rstrip(os.sep) + os.sep for root in roots)
+
+    def wrap(func):
+        def wrapper(path, *args, **kwargs):
+            if not isinstance(path, int):
+                p = os.fspath(path)
+                if p in roots or p.startswith(prefixes):
+                    time.sleep(delay)
+            return func(path, *args, **kwargs)
+        return wrapper
+
+    os.scandir = wrap(os.scandir)
+    os.stat = wrap(os.stat)
+    os.lstat = wrap(os.lstat)
+    builtins.open = wrap(builtins.open)
+
+
+def count_dest_calls(roots):
+    """
+    นับการเรียก os.* และ open ที่ path อยู่ใต้ปลายทาง คืน dict ตัวนับที่เพิ่มขึ้นระหว่างรัน
+    (syscr/syscw ของ /proc นับแค่ read/write ไม่เห็น syscall ของ metadata)
+    """
+    prefixes = tuple(root.rstrip(os.sep) + os.sep for root in roots)
+    counts = dict.fromkeys(DEST_CALLS, 0)
+    lock = threading.Lock()
+
+    def wrap(name, func):
+        def wrapper(path, *args, **kwargs):
+            if not isinstance(path, int):
+                p = os.fspath(path)
+                if p in roots or p.startswith(prefixes):
+                    with lock:
+                        counts[name] += 1
+            return func(path, *args, **kwargs)
+        return wrapper
+
+    for name in DEST_CALLS:
+        module = builtins if name == "open" else os
+        setattr(module, name, wrap(name, getattr(module, name)))
+    return counts
+
+
+def read_proc_io():
+    """ตัวนับ I/O ของ process จาก /proc/self/io (Linux) คืน {} ถ้าไม่มี"""
+    try:
+        with open("/proc/self/io") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak = max(usage, children)
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_worker(engine, workdir, latency_ms, out_path):
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    source = "src"
+
+    # import ก่อนใส่ latency และไม่นับเวลา import (อ่าน config.ini, สร้าง pool)
+    if engine in ("threads", "async"):
+        import V5 as module
+        module.ENGINE = engine
+    elif engine == "sequential":
+        import app_main as module
+    else:
+        import V2 as module
+    module.show_notification = lambda *args, **kwargs: None
+
+    if latency_ms:
+        inject_latency((source, os.path.abspath(source)), latency_ms / 1000)
+    dest_calls = count_dest_calls(tuple(os.path.abspath(base) for base in getattr(module, "destination_bases", [])))
+
+    io_before = read_proc_io()
+    started = time.perf_counter()
+    if engine in ("threads", "async"):
+        module.backup_drive_to_destinations(source, module.destination_bases)
+    else:
+        module.backup_drive(source)
+    wall = time.perf_counter() - started
+    io_after = read_proc_io()
+
+    from backup_logger import close_logger
+    close_logger()
+
+    result = {
+        "wall_s": round(wall, 3),
+        "peak_rss_kb": peak_rss_kb(),
+        "syscalls_read": io_after.get("syscr", 0) - io_before.get("syscr", 0) if io_after else None,
+        "syscalls_write": io_after.get("syscw", 0) - io_before.get("syscw", 0) if io_after else None,
+        "bytes_read": io_after.get("rchar", 0) - io_before.get("rchar", 0) if io_after else None,
+        "bytes_written": io_after.get("wchar", 0) - io_before.get("wchar", 0) if io_after else None,
+        "dest_calls": {name: count for name, count in dest_calls.items() if count},
+        "dest_calls_total": sum(dest_calls.values()),
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+# --------------------- RUNNER ---------------------
+
+def write_config(workdir, engine, destination, threads):
+    lines = [
+        "[BackupSettings]",
+        "mapped_drives = src",
+        f"destination_base = {destination}",
+        f"log_file = {os.path.join(workdir, 'benchmark_log.txt')}",
+        f"max_threads = {threads}",
+        f"scan_threads = {max(1, threads // 2)}",
+        f"engine = {'async' if engine == 'async' else 'threads'}",
+        "incremental = true",
+        "",
+        "[Logging]",
+        "log_level = INFO",
+        "",
+    ]
+    with open(os.path.join(workdir, "config.ini"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def run_engine(engine, workdir, destination, latency_ms, timeout):
+    out_path = os.path.join(workdir, f"result_{engine}.json")
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "worker", engine, workdir, str(latency_ms), out_path],
+        cwd=workdir, capture_output=True, text=True, timeout=timeout,
+    )
+    if proc.returncode != 0 or not os.path.exists(out_path):
+        return {"error": (proc.stderr or proc.stdout).strip().splitlines()[-5:]}
+    with open(out_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_benchmark(args):
+    workdir = os.path.abspath(args.workdir)
+    source = os.path.join(workdir, "src")
+    marker = os.path.join(workdir, "src.profile.json")
+    wanted = {"profile": args.profile, "seed": args.seed, "scale": args.scale}
+
+    # สร้างต้นไม้ใหม่เฉพาะเมื่อ profile/seed/scale เปลี่ยน
+    current = None
+    if os.path.exists(marker):
+        with open(marker, encoding="utf-8") as f:
+            current = json.load(f)
+    if current != wanted or not os.path.isdir(source):
+        shutil.rmtree(source, ignore_errors=True)
+        print(f"กำลังสร้างต้นไม้ {args.profile} (seed {args.seed}, scale {args.scale}) ที่ {source}", file=sys.stderr)
+        generate_tree(source, args.profile, args.seed, args.scale)
+        with open(marker, "w", encoding="utf-8") as f:
+            json.dump(wanted, f)
+    files, total = tree_totals(source)
+
+    report = {
+        "profile": args.profile,
+        "seed": args.seed,
+        "scale": args.scale,
+        "latency_ms": args.latency_ms,
+        "threads": args.threads,
+        "files": files,
+        "bytes": total,
+        "results": {},
+    }
+    for engine in args.engines:
+        if engine == "robocopy" and shutil.which("robocopy") is None:
+            report["results"][engine] = {"skipped": "ไม่พบ robocopy (ใช้ได้บน Windows เท่านั้น)"}
+            continue
+        destination = os.path.join(workdir, f"dst_{engine}")
+        shutil.rmtree(destination, ignore_errors=True)
+        write_config(workdir, engine, destination, args.threads)
+        passes = {}
+        for name in ["full"] + (["incremental"] if args.incremental else []):
+            if name == "incremental":
+                time.sleep(1)  # ชื่อ snapshot ละเอียดถึงวินาที ต้องไม่ชนกับรอบแรก
+            print(f"รัน {engine} ({name})", file=sys.stderr)
+            result = run_engine(engine, workdir, destination, args.latency_ms, args.timeout)
+            if "wall_s" in result:
+                wall = max(result["wall_s"], 1e-9)
+                result["files_per_s"] = round(files / wall, 1)
+                result["mb_per_s"] = round(total / MB / wall, 2)
+            passes[name] = result
+        report["results"][engine] = passes
+        if not args.keep:
+            shutil.rmtree(destination, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="วัดความเร็วของ engine สำรองข้อมูลบนต้นไม้สังเคราะห์")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="สร้างต้นไม้ต้นทางสังเคราะห์")
+    gen.add_argument("root")
+    gen.add_argument("--profile", choices=sorted(PROFILES), default="mixed")
+    gen.add_argument("--seed", type=int, default=1)
+    gen.add_argument("--scale", type=float, default=1.0)
+
+    run = sub.add_parser("run", help="สร้างต้นไม้ (ถ้ายังไม่มี) แล้ววัดทุก engine")
+    run.add_argument("--profile", choices=sorted(PROFILES), default="mixed")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--scale", type=float, default=1.0, help="คูณจำนวนไฟล์ (และขนาดไฟล์ใหญ่) ของ profile")
+    run.add_argument("--engines", default="threads,async,sequential,robocopy",
+                     type=lambda s: [e.strip() for e in s.split(",") if e.strip() in ENGINES])
+    run.add_argument("--latency-ms", type=float, default=0.0, help="หน่วงต่อ scandir/stat/open บนต้นทาง")
+    run.add_argument("--threads", type=int, default=8, help="max_threads ที่ใช้กับ engine threads")
+    run.add_argument("--incremental", action="store_true", help="รันซ้ำบนปลายทางเดิมอีกรอบ (ไม่มีไฟล์เปลี่ยน)")
+    run.add_argument("--workdir", default="benchmark_work")
+    run.add_argument("--output", help="เขียนผล JSON ลงไฟล์นี้ด้วย")
+    run.add_argument("--timeout", type=int, default=3600)
+    run.add_argument("--keep", action="store_true", help="ไม่ลบโฟลเดอร์ปลายทางหลังวัดเสร็จ")
+
+    worker = sub.add_parser("worker")  # ใช้ภายใน: รัน engine เดียวใน process นี้
+    worker.add_argument("engine", choices=ENGINES)
+    worker.add_argument("workdir")
+    worker.add_argument("latency_ms", type=float)
+    worker.add_argument("out_path")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        files, total = generate_tree(args.root, args.profile, args.seed, args.scale)
+        print(f"✅ สร้าง {files} ไฟล์ ({total / MB:.1f} MB) ที่ {args.root}")
+    elif args.command == "run":
+        run_benchmark(args)
+    else:
+        run_worker(args.engine, args.workdir, args.latency_ms, args.out_path)
+
+
+if __name__ == "__main__":
+    main()
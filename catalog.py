@@ -0,0 +1,334 @@
+import argparse
+import gzip
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from chunk_store import MANIFEST_SUFFIX
+from filters import drive_key
+from journal import trim_torn_tail
+from retention import SNAPSHOT_RE, SNAPSHOT_TIME_FORMAT
+
+# catalog ของ snapshot: ค้นหาไฟล์ข้าม snapshot ได้ทันทีโดยไม่ต้องเดินต้นไม้ของ backup
+# - ระหว่างสำรอง ทุกไฟล์ที่อยู่ใน snapshot ถูกบันทึกลง {destination_base}/.catalog/{snapshot}.tsv.partial
+#   เมื่อ snapshot เสร็จจะเรียงตาม path แล้วบีบอัดเป็น {snapshot}.tsv.gz (path, size, mtime_ns, hash ต่อบรรทัด)
+# - ทุก catalog ถูกรวมไว้ใน .catalog/catalog.sqlite (คีย์หลัก path + snapshot) ใช้ตอบคำถาม:
+#   ทุกเวอร์ชันของไฟล์, ไฟล์ที่ตรง glob ในช่วงวันที่, และความต่างระหว่างสอง snapshot
+# - snapshot ที่ retention ลบไปแล้วจะถูกลบออกจาก catalog ตอน sync (ท้ายรอบสำรองของ V5.py)
+# - ชื่อ snapshot คือ path สัมพัทธ์กับ destination_base ใช้ / (แบบเดียวกับ retention.find_snapshots)
+#   เช่น Y_2026-01-31_01-00-00 หรือ Y/_2026-01-31_01-00-00 ของไดรฟ์ Y:/ (catalog อยู่ที่ .catalog/Y/_2026-...tsv.gz)
+#
+# การใช้งาน:
+#   python catalog.py <destination_base> list [--drive Y]
+#   python catalog.py <destination_base> versions <path>
+#   python catalog.py <destination_base> find <glob> [--since 2026-01-01] [--until 2026-01-31] [--drive Y]
+#   python catalog.py <destination_base> diff <snapshot_a> <snapshot_b>
+#   python catalog.py <destination_base> sync
+
+CATALOG_DIR_NAME = ".catalog"
+CATALOG_DB_NAME = "catalog.sqlite"
+CATALOG_SUFFIX = ".tsv.gz"
+NO_HASH = "-"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    drive TEXT NOT NULL,
+    taken_at TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT NOT NULL,
+    snapshot INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    PRIMARY KEY (path, snapshot)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_by_snapshot ON files (snapshot, path);
+"""
+
+
+def catalog_dir_for(destination_base):
+    return os.path.join(destination_base, CATALOG_DIR_NAME)
+
+
+def snapshot_name(destination_base, snapshot_path):
+    """ชื่อ snapshot ใน catalog: path สัมพัทธ์กับ destination_base คั่นด้วย /"""
+    return os.path.relpath(snapshot_path, destination_base).replace(os.sep, "/")
+
+
+def _normalize_name(snapshot):
+    return snapshot.replace("\\", "/").strip("/")
+
+
+def catalog_path_for(destination_base, snapshot):
+    return os.path.join(catalog_dir_for(destination_base), *_normalize_name(snapshot).split("/")) + CATALOG_SUFFIX
+
+
+def _catalog_names(folder):
+    """ชื่อ snapshot ของทุก catalog ใน .catalog (รวมแบบ {drive}/_{timestamp} ที่อยู่ลึกลงไปหนึ่งชั้น)"""
+    names = set()
+    for entry in os.scandir(folder):
+        if entry.is_dir(follow_symlinks=False):
+            names.update(f"{entry.name}/{sub.name[:-len(CATALOG_SUFFIX)]}" for sub in os.scandir(entry.path)
+                         if sub.name.endswith(CATALOG_SUFFIX))
+        elif entry.name.endswith(CATALOG_SUFFIX):
+            names.add(entry.name[:-len(CATALOG_SUFFIX)])
+    return names
+
+
+def read_catalog(path):
+    """อ่าน catalog ของ snapshot คืน (path, size, mtime_ns, hash หรือ None) เรียงตาม path"""
+    with gzip.open(path, "rt", encoding="utf-8", newline="\n") as f:
+        for line in f:
+            rel_path, size, mtime_ns, digest = line.rstrip("\n").split("\t")
+            yield rel_path, int(size), int(mtime_ns), None if digest == NO_HASH else digest
+
+
+class CatalogWriter:
+    """บันทึกไฟล์ของ snapshot ลง .partial (ทำต่อได้เหมือน journal) แล้วเขียน catalog ที่เรียงแล้วเมื่อเสร็จ"""
+
+    def __init__(self, destination_base, snapshot):
+        self.destination_base = destination_base
+        self.snapshot = snapshot
+        self.path = catalog_path_for(destination_base, snapshot)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.partial_path = self.path[:-len(CATALOG_SUFFIX)] + ".tsv.partial"
+        self.lock = threading.Lock()
+        trim_torn_tail(self.partial_path)
+        # line buffered: บรรทัดต้องถึงไฟล์ก่อน journal บันทึกว่าไฟล์เสร็จ (รอบที่ทำต่อจะข้ามไฟล์นั้น)
+        self.f = open(self.partial_path, "a", encoding="utf-8", newline="\n", buffering=1)
+
+    def add(self, rel_path, s_stat, digest):
+        line = f"{rel_path.replace(os.sep, '/')}\t{s_stat.st_size}\t{s_stat.st_mtime_ns}\t{digest or NO_HASH}\n"
+        with self.lock:
+            self.f.write(line)
+
+    def close(self, finished=True):
+        """finished=True: เรียง, บีบอัด และรวมเข้า catalog.sqlite (finished=False เก็บ .partial ไว้ทำต่อ)"""
+        with self.lock:
+            self.f.close()
+        if not finished:
+            return
+        entries = {}
+        with open(self.partial_path, encoding="utf-8", newline="\n") as f:
+            for line in f:
+                entries[line.split("\t", 1)[0]] = line  # บรรทัดหลังทับบรรทัดก่อน (รอบที่ทำต่อ)
+        with gzip.open(self.path + ".tmp", "wt", encoding="utf-8", newline="\n") as f:
+            f.writelines(entries[path] for path in sorted(entries))
+        os.replace(self.path + ".tmp", self.path)
+        os.remove(self.partial_path)
+        catalog = Catalog(self.destination_base)
+        try:
+            catalog.import_snapshot(self.snapshot)
+        finally:
+            catalog.close()
+
+
+def _parse_snapshot(name):
+    """(ไดรฟ์, เวลา) จากชื่อ snapshot เช่น Y_2026-... หรือ Y/_2026-... ได้ไดรฟ์ Y ทั้งคู่"""
+    parent, _, leaf = name.rpartition("/")
+    m = SNAPSHOT_RE.match(leaf)
+    if not m or m.group("suffix"):
+        return None
+    try:
+        when = datetime.strptime(m.group("stamp"), SNAPSHOT_TIME_FORMAT)
+    except ValueError:
+        return None
+    drive = "/".join(part for part in (parent, m.group("prefix")) if part)
+    return drive, when.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class Catalog:
+    """catalog รวมของ destination base (อ่านอย่างเดียวจาก .catalog/catalog.sqlite ไม่แตะต้นไม้ของ backup)"""
+
+    def __init__(self, destination_base):
+        self.destination_base = destination_base
+        db_path = os.path.join(catalog_dir_for(destination_base), CATALOG_DB_NAME)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # หลายไดรฟ์อาจ import พร้อมกัน รอ lock ได้นาน
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def import_snapshot(self, snapshot):
+        """นำ catalog ของ snapshot เข้า catalog รวม (ทำซ้ำได้ ของเดิมจะถูกแทนที่)"""
+        snapshot = _normalize_name(snapshot)
+        parsed = _parse_snapshot(snapshot)
+        if parsed is None:
+            raise ValueError(f"ชื่อ snapshot ไม่ถูกต้อง: {snapshot}")
+        drive, taken_at = parsed
+        entries = list(read_catalog(catalog_path_for(self.destination_base, snapshot)))
+        with self.conn:
+            self._delete(snapshot)
+            snapshot_id = self.conn.execute(
+                "INSERT INTO snapshots (name, drive, taken_at, files, bytes) VALUES (?, ?, ?, ?, ?)",
+                (snapshot, drive, taken_at, len(entries), sum(e[1] for e in entries)),
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT INTO files (path, snapshot, size, mtime_ns, hash) VALUES (?, ?, ?, ?, ?)",
+                ((path, snapshot_id, size, mtime_ns, digest) for path, size, mtime_ns, digest in entries),
+            )
+        return len(entries)
+
+    def _delete(self, snapshot):
+        row = self.conn.execute("SELECT id FROM snapshots WHERE name = ?", (snapshot,)).fetchone()
+        if row is not None:
+            self.conn.execute("DELETE FROM files WHERE snapshot = ?", (row[0],))
+            self.conn.execute("DELETE FROM snapshots WHERE id = ?", (row[0],))
+
+    def _exists(self, snapshot):
+        path = os.path.join(self.destination_base, *snapshot.split("/"))
+        return os.path.isdir(path) or os.path.isfile(path + MANIFEST_SUFFIX)
+
+    def sync(self):
+        """
+        ลบ snapshot ที่ไม่มีอยู่แล้ว (retention ลบไป) ออกจาก catalog และ import catalog ที่ยังไม่ได้รวม
+        คืน (จำนวนที่ import, จำนวนที่ลบ)
+        """
+        known = {name for name, in self.conn.execute("SELECT name FROM snapshots")}
+        on_disk = _catalog_names(catalog_dir_for(self.destination_base))
+        removed = 0
+        for snapshot in sorted(known | on_disk):
+            if self._exists(snapshot):
+                continue
+            with self.conn:
+                self._delete(snapshot)
+            if snapshot in on_disk:
+                os.remove(catalog_path_for(self.destination_base, snapshot))
+            removed += 1
+        imported = 0
+        for snapshot in sorted(on_disk - known):
+            if self._exists(snapshot):
+                self.import_snapshot(snapshot)
+                imported += 1
+        return imported, removed
+
+    def snapshots(self, drive=None):
+        """[(ชื่อ, ไดรฟ์, เวลา, จำนวนไฟล์, ขนาดรวม)] เรียงตามเวลา"""
+        sql = "SELECT name, drive, taken_at, files, bytes FROM snapshots"
+        args = ()
+        if drive:
+            sql += " WHERE drive = ? COLLATE NOCASE"
+            args = (drive_key(drive),)
+        return self.conn.execute(sql + " ORDER BY taken_at, name", args).fetchall()
+
+    def versions(self, rel_path):
+        """ทุกเวอร์ชันของไฟล์ [(snapshot, เวลา, size, mtime_ns, hash)] เรียงจากเก่าไปใหม่"""
+        return self.conn.execute(
+            "SELECT s.name, s.taken_at, f.size, f.mtime_ns, f.hash FROM files f "
+            "JOIN snapshots s ON s.id = f.snapshot WHERE f.path = ? ORDER BY s.taken_at, s.name",
+            (rel_path.replace("\\", "/").strip("/"),),
+        ).fetchall()
+
+    def find(self, pattern, since=None, until=None, drive=None):
+        """
+        ไฟล์ที่ path ตรง glob (ไม่สนตัวพิมพ์เล็ก/ใหญ่ ไม่มี / = เทียบทั้ง path เช่น *.xlsx)
+        ใน snapshot ช่วง since..until (YYYY-mm-dd) คืน [(snapshot, เวลา, path, size, mtime_ns)]
+        """
+        pattern = pattern.replace("\\", "/").lower()
+        sql = ("SELECT s.name, s.taken_at, f.path, f.size, f.mtime_ns FROM files f "
+               "JOIN snapshots s ON s.id = f.snapshot WHERE lower(f.path) GLOB ?")
+        args = [pattern]
+        if since:
+            sql += " AND s.taken_at >= ?"
+            args.append(since)
+        if until:
+            sql += " AND s.taken_at < date(?, '+1 day')"
+            args.append(until)
+        if drive:
+            sql += " AND s.drive = ? COLLATE NOCASE"
+            args.append(drive_key(drive))
+        return self.conn.execute(sql + " ORDER BY f.path, s.taken_at", args).fetchall()
+
+    def _snapshot_id(self, snapshot):
+        row = self.conn.execute("SELECT id FROM snapshots WHERE name = ?", (_normalize_name(snapshot),)).fetchone()
+        if row is None:
+            raise KeyError(f"ไม่พบ snapshot ใน catalog: {snapshot}")
+        return row[0]
+
+    def diff(self, snapshot_a, snapshot_b):
+        """ความต่างจาก a ไป b คืน {"added": [...], "removed": [...], "changed": [...]} (รายชื่อ path)"""
+        a, b = self._snapshot_id(snapshot_a), self._snapshot_id(snapshot_b)
+        only_in = (
+            "SELECT x.path FROM files x LEFT JOIN files y ON y.path = x.path AND y.snapshot = ? "
+            "WHERE x.snapshot = ? AND y.path IS NULL ORDER BY x.path"
+        )
+        changed = (
+            "SELECT x.path FROM files x JOIN files y ON y.path = x.path AND y.snapshot = ? "
+            "WHERE x.snapshot = ? AND (x.size != y.size OR x.mtime_ns != y.mtime_ns "
+            "OR (x.hash IS NOT NULL AND y.hash IS NOT NULL AND x.hash != y.hash)) ORDER BY x.path"
+        )
+        return {
+            "added": [path for path, in self.conn.execute(only_in, (a, b))],
+            "removed": [path for path, in self.conn.execute(only_in, (b, a))],
+            "changed": [path for path, in self.conn.execute(changed, (a, b))],
+        }
+
+
+def _format_mtime(mtime_ns):
+    return datetime.fromtimestamp(mtime_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ค้นหาไฟล์ข้าม snapshot จาก catalog")
+    parser.add_argument("destination_base")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("list", help="รายชื่อ snapshot ใน catalog")
+    p.add_argument("--drive")
+    p = commands.add_parser("versions", help="ทุกเวอร์ชันของไฟล์")
+    p.add_argument("path", help="path สัมพัทธ์กับรากของไดรฟ์ เช่น งาน/รายงาน.xlsx")
+    p = commands.add_parser("find", help="ไฟล์ที่ตรง glob ในช่วงวันที่")
+    p.add_argument("pattern")
+    p.add_argument("--since", help="YYYY-mm-dd")
+    p.add_argument("--until", help="YYYY-mm-dd (รวมวันนั้น)")
+    p.add_argument("--drive")
+    p = commands.add_parser("diff", help="ความต่างระหว่างสอง snapshot")
+    p.add_argument("snapshot_a")
+    p.add_argument("snapshot_b")
+    commands.add_parser("sync", help="รวม catalog ใหม่และลบ snapshot ที่ไม่มีแล้ว")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.destination_base)
+    try:
+        if args.command == "list":
+            for name, drive, taken_at, files, size in catalog.snapshots(args.drive):
+                print(f"{name}\t{taken_at}\t{files} ไฟล์\t{size / 1024 / 1024:.1f} MB")
+        elif args.command == "versions":
+            rows = catalog.versions(args.path)
+            previous = None
+            for name, taken_at, size, mtime_ns, digest in rows:
+                mark = "*" if (size, mtime_ns, digest) != previous else " "  # * = เวอร์ชันที่ต่างจาก snapshot ก่อน
+                previous = (size, mtime_ns, digest)
+                print(f"{mark} {name}\t{size}\t{_format_mtime(mtime_ns)}\t{digest or ''}")
+            if not rows:
+                print("ไม่พบไฟล์ใน catalog")
+                sys.exit(1)
+        elif args.command == "find":
+            for name, taken_at, path, size, mtime_ns in catalog.find(args.pattern, args.since, args.until, args.drive):
+                print(f"{name}\t{path}\t{size}\t{_format_mtime(mtime_ns)}")
+        elif args.command == "diff":
+            try:
+                changes = catalog.diff(args.snapshot_a, args.snapshot_b)
+            except KeyError as e:
+                print(e.args[0])
+                sys.exit(1)
+            for kind, mark in (("added", "+"), ("removed", "-"), ("changed", "~")):
+                for path in changes[kind]:
+                    print(f"{mark} {path}")
+            print(f"เพิ่ม {len(changes['added'])}, ลบ {len(changes['removed'])}, เปลี่ยน {len(changes['changed'])}")
+        elif args.command == "sync":
+            imported, removed = catalog.sync()
+            print(f"import {imported} snapshot, ลบ {removed} snapshot")
+    finally:
+        catalog.close()
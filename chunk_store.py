@@ -0,0 +1,403 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+from collections import Counter
+
+from journal import trim_torn_tail
+
+# รูปแบบปลายทางแบบ content-addressed chunk store
+# - ตัดไฟล์เป็น chunk ด้วย rolling hash (gear hash แบบ FastCDC) ขอบ chunk ขึ้นกับเนื้อหา
+#   แก้ไขกลางไฟล์แล้ว chunk อื่น ๆ ยังเหมือนเดิม
+# - key ของ chunk คือ SHA-256 เก็บต่อท้ายใน packfile ขนาดใหญ่ + ดัชนี SQLite
+# - แต่ละ snapshot มี manifest (JSON lines) บอกว่าไฟล์ไหนประกอบด้วย chunk อะไร
+# ที่เก็บโตตามข้อมูลที่ไม่ซ้ำ ไม่ใช่ตามจำนวน snapshot (ไฟล์ซ้ำข้ามวัน/ข้ามไดรฟ์เก็บครั้งเดียว)
+# - prune (mark-and-sweep) หลัง retention ลบ manifest: chunk ที่ไม่มี manifest ใดอ้างถึงถูกลบออกจากดัชนี
+#   pack ที่ไม่เหลือ chunk ที่ใช้อยู่ลบทิ้ง pack ที่เหลือน้อยกว่า MIN_LIVE_RATIO เขียนใหม่
+#
+# การใช้งาน:
+#   python chunk_store.py list <destination_base>
+#   python chunk_store.py restore <destination_base> <snapshot> <target_dir>
+#   python chunk_store.py prune <destination_base>   (ห้ามรันระหว่างที่มีการสำรองเขียนลง destination_base นี้)
+
+STORE_DIR_NAME = ".chunkstore"
+MANIFEST_SUFFIX = ".chunks.jsonl"
+
+MIN_CHUNK = 256 * 1024
+AVG_CHUNK = 1024 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+PACK_SIZE = 256 * 1024 * 1024
+COMMIT_EVERY = 500
+MIN_LIVE_RATIO = 0.5
+
+_rng = random.Random(0x5EED)
+GEAR = [_rng.getrandbits(64) for _ in range(256)]
+MASK_64 = (1 << 64) - 1
+# normalized chunking: ก่อนถึง AVG ใช้ mask ที่เข้มกว่า หลังจากนั้นใช้ mask ที่หลวมกว่า
+# ใช้บิตบนของ hash เพราะ gear hash เลื่อนซ้าย บิตบนจึงขึ้นกับ 64 ไบต์ล่าสุด
+AVG_BITS = AVG_CHUNK.bit_length() - 1
+MASK_HARD = ((1 << (AVG_BITS + 1)) - 1) << (64 - AVG_BITS - 1)
+MASK_EASY = ((1 << (AVG_BITS - 1)) - 1) << (64 - AVG_BITS + 1)
+
+
+def find_boundary(data, eof):
+    """คืนความยาว chunk แรกใน data หรือ None ถ้ายังต้องการข้อมูลเพิ่ม"""
+    n = len(data)
+    if n <= MIN_CHUNK:
+        return n if eof and n else None
+    h = 0
+    gear = GEAR
+    limit = min(n, MAX_CHUNK)
+    normal = min(limit, AVG_CHUNK)
+    i = MIN_CHUNK
+    while i < normal:
+        h = ((h << 1) + gear[data[i]]) & MASK_64
+        if not h & MASK_HARD:
+            return i + 1
+        i += 1
+    while i < limit:
+        h = ((h << 1) + gear[data[i]]) & MASK_64
+        if not h & MASK_EASY:
+            return i + 1
+        i += 1
+    if limit == MAX_CHUNK or eof:
+        return limit
+    return None
+
+
+class ChunkStore:
+    def __init__(self, destination_base):
+        self.root = os.path.join(destination_base, STORE_DIR_NAME)
+        os.makedirs(os.path.join(self.root, "packs"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.root, "chunks.sqlite"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, pack INTEGER, offset INTEGER, length INTEGER)"
+        )
+        self.conn.commit()
+        self.pack_no = self.conn.execute("SELECT COALESCE(MAX(pack), 0) FROM chunks").fetchone()[0] or 1
+        self.pack = None
+        self.uncommitted = 0
+
+    def _pack_path(self, pack_no):
+        return os.path.join(self.root, "packs", f"pack-{pack_no:06d}.pack")
+
+    def _open_pack(self):
+        if self.pack is None:
+            self.pack = open(self._pack_path(self.pack_no), "ab")
+        if self.pack.tell() >= PACK_SIZE:
+            self.pack.close()
+            self.pack_no += 1
+            self.pack = open(self._pack_path(self.pack_no), "ab")
+        return self.pack
+
+    def has(self, digest):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM chunks WHERE hash = ?", (digest,)).fetchone() is not None
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM chunks WHERE hash = ?", (digest,)).fetchone():
+                return digest
+            pack = self._open_pack()
+            offset = pack.tell()
+            pack.write(data)
+            self.conn.execute(
+                "INSERT INTO chunks (hash, pack, offset, length) VALUES (?, ?, ?, ?)",
+                (digest, self.pack_no, offset, len(data)),
+            )
+            self.uncommitted += 1
+            if self.uncommitted >= COMMIT_EVERY:
+                self._commit_locked()
+        return digest
+
+    def _commit_locked(self):
+        # เขียน packfile ลงดิสก์ก่อน แล้วค่อย commit ดัชนี (crash แล้วเหลือแค่ข้อมูลขยะใน pack)
+        if self.pack is not None:
+            self.pack.flush()
+            os.fsync(self.pack.fileno())
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def flush(self):
+        with self.lock:
+            self._commit_locked()
+
+    def get(self, digest):
+        with self.lock:
+            row = self.conn.execute("SELECT pack, offset, length FROM chunks WHERE hash = ?", (digest,)).fetchone()
+            if self.pack is not None:
+                self.pack.flush()
+        if row is None:
+            raise KeyError(f"ไม่พบ chunk {digest}")
+        pack_no, offset, length = row
+        with open(self._pack_path(pack_no), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def _pack_files(self):
+        packs = {}
+        for name in os.listdir(os.path.join(self.root, "packs")):
+            if name.startswith("pack-") and name.endswith(".pack"):
+                try:
+                    packs[int(name[5:-5])] = os.path.join(self.root, "packs", name)
+                except ValueError:
+                    continue
+        return packs
+
+    def _rewrite_pack_locked(self, pack_no, path):
+        # ย้าย chunk ที่ยังใช้อยู่ไปต่อท้าย pack ปัจจุบัน fsync แล้วค่อยชี้ดัชนีไปที่ใหม่ แล้วจึงลบ pack เดิม
+        # (crash ก่อน commit: pack เดิมยังใช้ได้ ข้อมูลที่ต่อท้ายไปเป็นขยะที่ prune รอบหน้าเก็บ)
+        moved = []
+        rows = self.conn.execute("SELECT hash, offset, length FROM chunks WHERE pack = ? ORDER BY offset", (pack_no,))
+        with open(path, "rb") as src:
+            for digest, offset, length in rows.fetchall():
+                src.seek(offset)
+                data = src.read(length)
+                if len(data) != length:
+                    raise OSError(f"chunk {digest} ใน {path} ไม่ครบ")
+                pack = self._open_pack()
+                moved.append((self.pack_no, pack.tell(), digest))
+                pack.write(data)
+        self.pack.flush()
+        os.fsync(self.pack.fileno())
+        self.conn.executemany("UPDATE chunks SET pack = ?, offset = ? WHERE hash = ?", moved)
+        self.conn.commit()
+        os.remove(path)
+
+    def prune(self, manifests):
+        """
+        mark-and-sweep: เก็บเฉพาะ chunk ที่ manifest ใน manifests (path ของไฟล์ manifest) อ้างถึง
+        ห้ามเรียกระหว่างที่มีการสำรองเขียน store อยู่ (chunk ของไฟล์ที่กำลังคัดลอกยังไม่อยู่ใน manifest ใด)
+        คืน Counter ของ chunks_removed, packs_removed, packs_rewritten, bytes_freed
+        """
+        stats = Counter()
+        with self.lock:
+            self._commit_locked()
+            if self.pack is not None:
+                self.pack.close()
+                self.pack = None
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS live (hash TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM live")
+            for path in manifests:
+                self.conn.executemany("INSERT OR IGNORE INTO live (hash) VALUES (?)",
+                                      ((digest,) for digest in _manifest_chunks(path)))
+            stats["chunks_removed"] = self.conn.execute(
+                "DELETE FROM chunks WHERE hash NOT IN (SELECT hash FROM live)").rowcount
+            self.conn.execute("DELETE FROM live")
+            self.conn.commit()
+            live_bytes = dict(self.conn.execute("SELECT pack, SUM(length) FROM chunks GROUP BY pack"))
+            packs = self._pack_files()
+            # chunk ที่เหลือเขียนลง pack ใหม่ ทุก pack เดิม (รวมอันที่เพิ่งต่อท้าย) จึงเป็นตัวเลือกได้หมด
+            self.pack_no = max(packs, default=0) + 1
+            for pack_no, path in sorted(packs.items()):
+                size = os.path.getsize(path)
+                live = live_bytes.get(pack_no, 0)
+                if not live:
+                    os.remove(path)
+                    stats["packs_removed"] += 1
+                    stats["bytes_freed"] += size
+                elif live < size * MIN_LIVE_RATIO:
+                    self._rewrite_pack_locked(pack_no, path)
+                    stats["packs_rewritten"] += 1
+                    stats["bytes_freed"] += size - live
+            if self.pack is not None:
+                self.pack.close()
+                self.pack = None
+        return stats
+
+    def close(self):
+        with self.lock:
+            self._commit_locked()
+            if self.pack is not None:
+                self.pack.close()
+                self.pack = None
+            self.conn.close()
+
+
+class ChunkSink:
+    """ปลายทางแบบ stream สำหรับ copy_engine.copy_file: รับข้อมูลทีละ buffer แล้วตัดเป็น chunk ลง store"""
+
+    def __init__(self, store):
+        self.store = store
+        self.pending = bytearray()
+        self.chunk_ids = []
+
+    def _drain(self, eof):
+        while self.pending:
+            cut = find_boundary(self.pending, eof)
+            if cut is None:
+                return
+            self.chunk_ids.append(self.store.put(bytes(self.pending[:cut])))
+            del self.pending[:cut]
+
+    def write(self, data):
+        self.pending += data
+        if len(self.pending) >= MAX_CHUNK:
+            self._drain(eof=False)
+
+    def close(self):
+        self._drain(eof=True)
+
+    def abort(self):
+        self.pending = bytearray()
+        self.chunk_ids = []
+
+
+def manifest_path_for(snapshot_path):
+    return snapshot_path + MANIFEST_SUFFIX
+
+
+def load_manifest(path):
+    entries = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                entries[entry["path"]] = entry
+    return entries
+
+
+def load_partial_manifest(snapshot_path, store):
+    """
+    รายการไฟล์ใน manifest ที่ยังไม่เสร็จ (.partial) ของ snapshot ที่ถูกขัดจังหวะ
+    เก็บเฉพาะรายการที่ chunk อยู่ใน store ครบ (ดัชนี chunk อาจยังไม่ได้ commit ตอนเครื่องดับ)
+    """
+    entries = {}
+    path = manifest_path_for(snapshot_path) + ".partial"
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if entry.get("dir") or all(store.has(digest) for digest in entry["chunks"]):
+                entries[entry["path"]] = entry
+    return entries
+
+
+class ManifestWriter:
+    """เขียน manifest ของ snapshot ลงไฟล์ .partial ก่อน แล้ว rename เมื่อสำรองเสร็จ"""
+
+    def __init__(self, snapshot_path):
+        self.path = manifest_path_for(snapshot_path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        trim_torn_tail(self.path + ".partial")  # เขียนต่อจาก .partial ของรอบที่ค้าง
+        self.f = open(self.path + ".partial", "a", encoding="utf-8")
+
+    def _write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.f.write(line)
+
+    def add_dir(self, rel_path):
+        self._write({"path": rel_path.replace(os.sep, "/"), "dir": True})
+
+    def add_file(self, rel_path, s_stat, chunk_ids, mode=None):
+        self._write({
+            "path": rel_path.replace(os.sep, "/"),
+            "size": s_stat.st_size,
+            "mtime_ns": s_stat.st_mtime_ns,
+            "mode": s_stat.st_mode & 0o7777 if mode is None else mode,
+            "chunks": chunk_ids,
+        })
+
+    def close(self, finished=True):
+        """finished=False: เก็บ .partial ไว้ให้รอบถัดไปเขียนต่อ"""
+        with self.lock:
+            self.f.close()
+        if finished:
+            os.replace(self.path + ".partial", self.path)
+
+
+def _manifest_chunks(path):
+    """digest ของ chunk ทุกตัวใน manifest (บรรทัดท้ายที่เขียนไม่ครบของ .partial ถูกข้าม)"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            yield from entry.get("chunks", ())
+
+
+def manifest_files(destination_base):
+    """manifest ทุกไฟล์ใต้ destination_base รวม .partial ของ snapshot ที่ยังไม่เสร็จ ไม่รวมที่ retention กำลังลบ (.deleting-*)"""
+    for dirpath, dirnames, filenames in os.walk(destination_base):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            if not name.startswith(".") and name.endswith((MANIFEST_SUFFIX, MANIFEST_SUFFIX + ".partial")):
+                yield os.path.join(dirpath, name)
+
+
+def prune_store(destination_base, store=None):
+    """prune chunk store ของ destination_base (store = ChunkStore ที่เปิดอยู่แล้ว ถ้ามี)"""
+    own = store is None
+    if own:
+        store = ChunkStore(destination_base)
+    try:
+        return store.prune(manifest_files(destination_base))
+    finally:
+        if own:
+            store.close()
+
+
+def list_snapshots(destination_base):
+    snapshots = []
+    for dirpath, dirnames, filenames in os.walk(destination_base):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            if name.endswith(MANIFEST_SUFFIX) and not name.startswith("."):
+                path = os.path.join(dirpath, name)
+                snapshots.append(os.path.relpath(path, destination_base)[:-len(MANIFEST_SUFFIX)])
+    return sorted(snapshots)
+
+
+def restore_snapshot(destination_base, snapshot, target_dir):
+    """สร้างต้นไม้ของ snapshot กลับขึ้นมาที่ target_dir"""
+    store = ChunkStore(destination_base)
+    restored = 0
+    try:
+        manifest = load_manifest(manifest_path_for(os.path.join(destination_base, snapshot)))
+        if not manifest:
+            raise FileNotFoundError(f"ไม่พบ manifest ของ snapshot {snapshot}")
+        for rel_path, entry in sorted(manifest.items()):
+            out_path = os.path.join(target_dir, *rel_path.split("/"))
+            if entry.get("dir"):
+                os.makedirs(out_path, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with open(out_path, "wb") as out:
+                for digest in entry["chunks"]:
+                    out.write(store.get(digest))
+            os.utime(out_path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+            os.chmod(out_path, entry["mode"])
+            restored += 1
+    finally:
+        store.close()
+    return restored
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "list":
+        for name in list_snapshots(sys.argv[2]):
+            print(name)
+    elif len(sys.argv) == 5 and sys.argv[1] == "restore":
+        count = restore_snapshot(sys.argv[2], sys.argv[3], sys.argv[4])
+        print(f"✅ กู้คืน {count} ไฟล์จาก {sys.argv[3]} ไปที่ {sys.argv[4]}")
+    elif len(sys.argv) == 3 and sys.argv[1] == "prune":
+        stats = prune_store(sys.argv[2])
+        print(f"🧹 ลบ {stats['chunks_removed']} chunk, ลบ {stats['packs_removed']} pack, "
+              f"เขียนใหม่ {stats['packs_rewritten']} pack, คืนพื้นที่ {stats['bytes_freed'] / 1024 / 1024:.1f} MB")
+    else:
+        print("usage: chunk_store.py list <destination_base> | restore <destination_base> <snapshot> <target_dir> "
+              "| prune <destination_base>")
+        sys.exit(1)
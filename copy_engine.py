@@ -0,0 +1,358 @@
+import errno
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# เครื่องมือคัดลอกไฟล์สำหรับ copy_file_task
+# - ไฟล์ใหญ่ (>= LARGE_FILE_THRESHOLD) แบ่งเป็น chunk แล้วคัดลอกขนานกันที่ offset ต่างกัน
+# - ปลายทางเดียวใช้ os.copy_file_range / os.sendfile (zero-copy) ถ้าระบบรองรับ
+# - นอกนั้นใช้ buffer ขนาดใหญ่ที่ใช้ซ้ำต่อ thread และอ่านต้นทางครั้งเดียวเขียนได้หลายปลายทาง
+# - ส่ง ContentHasher มาด้วยจะคำนวณ hash จากข้อมูลที่อ่านผ่าน buffer ระหว่างคัดลอก (ไม่อ่านไฟล์ซ้ำ)
+#   ปกติไฟล์ที่ต้องมี hash ไม่ใช้ zero-copy ถ้าตั้ง zero_copy_min ไฟล์ตั้งแต่ขนาดนั้นขึ้นไปยังใช้ zero-copy
+#   และไม่มี hash (hexdigest() คืน None) ไฟล์เล็กกว่านั้นอ่านผ่าน buffer ซึ่งแทบไม่ต่างจาก zero-copy
+# - ต้นทางสั้นกว่าขนาดที่ stat ไว้ (ถูกแก้/ตัดระหว่างคัดลอก) ถือว่าล้มเหลว ไม่ปล่อยให้ปลายทางมีส่วนท้ายเป็นศูนย์
+
+LARGE_FILE_THRESHOLD = 256 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024 * 1024
+CHUNK_THREADS = 4
+BUFFER_SIZE = 1024 * 1024
+
+HAS_COPY_FILE_RANGE = hasattr(os, "copy_file_range")
+HAS_SENDFILE = hasattr(os, "sendfile") and os.name == "posix"
+HAS_PREAD = hasattr(os, "pread") and hasattr(os, "pwrite")
+
+# errno ที่แปลว่า "ทางลัดนี้ใช้ไม่ได้" → ถอยไปใช้ buffer ปกติ
+FALLBACK_ERRNOS = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EBADF, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+chunk_executor = None
+_local = threading.local()
+
+
+def configure(large_file_threshold=None, chunk_size=None, chunk_threads=None, buffer_size=None):
+    global LARGE_FILE_THRESHOLD, CHUNK_SIZE, CHUNK_THREADS, BUFFER_SIZE, chunk_executor
+    if buffer_size is not None:
+        BUFFER_SIZE = buffer_size
+    if large_file_threshold is not None:
+        LARGE_FILE_THRESHOLD = large_file_threshold
+    if chunk_size is not None:
+        CHUNK_SIZE = max(BUFFER_SIZE, chunk_size)
+    if chunk_threads is not None:
+        CHUNK_THREADS = chunk_threads
+    chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_THREADS) if CHUNK_THREADS > 1 else None
+
+
+class ContentHasher:
+    """
+    hash ของเนื้อไฟล์ที่คำนวณระหว่างคัดลอก
+    - อ่านตามลำดับ: "sha256:<hex>"
+    - คัดลอกขนานเป็น chunk: "sha256-c<chunk_size>:<hex>" = sha256 ของ sha256 แต่ละ chunk เรียงตาม offset
+    """
+
+    def __init__(self, zero_copy_min=None):
+        self.whole = hashlib.sha256()
+        self.chunks = {}
+        self.chunk_size = None
+        self.zero_copy_min = zero_copy_min  # None = ทุกไฟล์ต้องมี hash
+        self.skipped = False  # ข้อมูลบางส่วนคัดลอกแบบ zero-copy ไม่ผ่าน hasher
+        self.lock = threading.Lock()
+
+    def allows_zero_copy(self, size):
+        """True ถ้ายอมให้ไฟล์ขนาดนี้คัดลอกแบบ zero-copy โดยไม่มี hash"""
+        return self.zero_copy_min is not None and size >= self.zero_copy_min
+
+    def update(self, data):
+        self.whole.update(data)
+
+    def chunk(self, offset):
+        h = hashlib.sha256()
+        with self.lock:
+            self.chunk_size = CHUNK_SIZE
+            self.chunks[offset] = h
+        return h
+
+    def hexdigest(self):
+        if self.skipped:
+            return None
+        if self.chunk_size is None:
+            return "sha256:" + self.whole.hexdigest()
+        combined = hashlib.sha256()
+        for offset in sorted(self.chunks):
+            combined.update(self.chunks[offset].digest())
+        return f"sha256-c{self.chunk_size}:{combined.hexdigest()}"
+
+
+def hash_stream(f, spec):
+    """คำนวณ hash แบบเดียวกับ spec ("sha256:..." หรือ "sha256-c<n>:...") จากไฟล์ที่เปิดอยู่"""
+    kind = spec.split(":", 1)[0]
+    chunk_size = int(kind[len("sha256-c"):]) if kind.startswith("sha256-c") else None
+    whole = hashlib.sha256()
+    combined = hashlib.sha256()
+    while True:
+        if chunk_size is None:
+            data = f.read(BUFFER_SIZE)
+            if not data:
+                return "sha256:" + whole.hexdigest()
+            whole.update(data)
+            continue
+        h = hashlib.sha256()
+        remaining = chunk_size
+        while remaining > 0:
+            data = f.read(min(BUFFER_SIZE, remaining))
+            if not data:
+                break
+            h.update(data)
+            remaining -= len(data)
+        if remaining == chunk_size:
+            return f"{kind}:{combined.hexdigest()}"
+        combined.update(h.digest())
+
+
+def _short_read(s_path, copied, size):
+    return EOFError(f"{s_path}: อ่านได้ {copied} จาก {size} ไบต์ (ไฟล์ถูกแก้ระหว่างคัดลอก)")
+
+
+def _buffer():
+    buf = getattr(_local, "buf", None)
+    if buf is None or len(buf) != BUFFER_SIZE:
+        buf = _local.buf = bytearray(BUFFER_SIZE)
+    return buf
+
+
+def _write_all(fd, view, offset):
+    while len(view):
+        n = os.pwrite(fd, view, offset)
+        view = view[n:]
+        offset += n
+
+
+def _zero_copy(src, dst, size, throttle=None):
+    """คัดลอกทั้งไฟล์แบบ zero-copy คืน False ถ้าระบบไม่รองรับ (ยังไม่ได้เขียนอะไร)"""
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    copied = 0
+    step = BUFFER_SIZE if throttle else CHUNK_SIZE  # ถูกจำกัดความเร็ว: ทยอยทีละ buffer ไม่กระตุกเป็นก้อนใหญ่
+    for name in ("copy_file_range", "sendfile"):
+        if name == "copy_file_range" and not HAS_COPY_FILE_RANGE:
+            continue
+        if name == "sendfile" and not HAS_SENDFILE:
+            continue
+        try:
+            while copied < size:
+                if name == "copy_file_range":
+                    n = os.copy_file_range(src_fd, dst_fd, min(size - copied, step))
+                else:
+                    n = os.sendfile(dst_fd, src_fd, copied, min(size - copied, step))
+                if n == 0:
+                    if not copied:
+                        break  # บาง filesystem คืน 0 แทน error → ลองวิธีถัดไป
+                    raise _short_read(src.name, copied, size)
+                copied += n
+                if throttle:
+                    throttle(n)
+            if copied:
+                return True
+        except OSError as e:
+            if copied or e.errno not in FALLBACK_ERRNOS:
+                raise
+    return False
+
+
+def _copy_buffered(src, outputs, errors, size, throttle=None, hasher=None):
+    buf = _buffer()
+    view = memoryview(buf)
+    copied = 0
+    while any(errors[d] is None for d in outputs):
+        n = src.readinto(buf)
+        if not n:
+            if copied < size:
+                raise _short_read(src.name, copied, size)
+            break
+        copied += n
+        if throttle:
+            throttle(n)
+        if hasher is not None:
+            hasher.update(view[:n])
+        for d_path, f in outputs.items():
+            if errors[d_path] is not None:
+                continue
+            try:
+                f.write(view[:n])
+            except Exception as e:
+                # ปลายทางนี้พัง แต่ปลายทางอื่นยังเขียนต่อได้
+                errors[d_path] = e
+
+
+def _copy_chunk(s_path, src_fd, outputs, errors, offset, length, throttle=None, hasher=None, zero_copy=True):
+    live = [d for d in outputs if errors[d] is None]
+    if not live:
+        return
+    h = hasher.chunk(offset) if hasher is not None else None
+
+    if HAS_PREAD:
+        if len(live) == 1 and HAS_COPY_FILE_RANGE and zero_copy:
+            dst_fd = outputs[live[0]].fileno()
+            step = BUFFER_SIZE if throttle else length
+            done = 0
+            try:
+                while done < length:
+                    n = os.copy_file_range(src_fd, dst_fd, min(step, length - done), offset + done, offset + done)
+                    if n == 0:
+                        if not done:
+                            break  # ลองอ่านด้วย pread ด้านล่าง
+                        raise _short_read(s_path, offset + done, offset + length)
+                    done += n
+                    if throttle:
+                        throttle(n)
+                if done:
+                    if hasher is not None:
+                        hasher.skipped = True
+                    return
+            except OSError as e:
+                if done or e.errno not in FALLBACK_ERRNOS:
+                    raise
+
+        buf = _buffer()
+        pos, end = offset, offset + length
+        while pos < end:
+            n = _pread_into(src_fd, buf, min(len(buf), end - pos), pos)
+            if n == 0:
+                raise _short_read(s_path, pos, end)
+            if throttle:
+                throttle(n)
+            if h is not None:
+                h.update(memoryview(buf)[:n])
+            for d_path in live:
+                if errors[d_path] is None:
+                    try:
+                        _write_all(outputs[d_path].fileno(), memoryview(buf)[:n], pos)
+                    except Exception as e:
+                        errors[d_path] = e
+            pos += n
+        return
+
+    # ไม่มี pread/pwrite (Windows): แต่ละ chunk เปิด handle ของตัวเองแล้ว seek ไปที่ offset
+    handles = {}
+    try:
+        with open(s_path, "rb") as src:
+            src.seek(offset)
+            for d_path in live:
+                try:
+                    handles[d_path] = open(d_path, "r+b")
+                    handles[d_path].seek(offset)
+                except Exception as e:
+                    errors[d_path] = e
+            buf = _buffer()
+            view = memoryview(buf)
+            remaining = length
+            while remaining > 0:
+                n = src.readinto(view[:min(len(buf), remaining)])
+                if not n:
+                    raise _short_read(s_path, offset + length - remaining, offset + length)
+                if throttle:
+                    throttle(n)
+                if h is not None:
+                    h.update(view[:n])
+                for d_path, f in handles.items():
+                    if errors[d_path] is None:
+                        try:
+                            f.write(view[:n])
+                        except Exception as e:
+                            errors[d_path] = e
+                remaining -= n
+    finally:
+        for f in handles.values():
+            f.close()
+
+
+def _pread_into(fd, buf, length, offset):
+    view = memoryview(buf)[:length]
+    if hasattr(os, "preadv"):
+        return os.preadv(fd, [view], offset)
+    data = os.pread(fd, length, offset)
+    view[:len(data)] = data
+    return len(data)
+
+
+def _copy_chunked(s_path, src, outputs, errors, size, throttle=None, hasher=None):
+    for d_path, f in outputs.items():
+        try:
+            f.truncate(size)
+            f.flush()
+        except Exception as e:
+            errors[d_path] = e
+
+    zero_copy = hasher is None or hasher.allows_zero_copy(size)
+    futures = [
+        chunk_executor.submit(
+            _copy_chunk, s_path, src.fileno(), outputs, errors, offset, min(CHUNK_SIZE, size - offset), throttle, hasher,
+            zero_copy,
+        )
+        for offset in range(0, size, CHUNK_SIZE)
+    ]
+    first_error = None
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            first_error = first_error or e
+    if first_error:
+        raise first_error
+
+
+def copy_file(s_path, s_stat, d_paths, throttle=None, hasher=None):
+    """
+    คัดลอก s_path ไปทุกไฟล์ใน d_paths โดยอ่านต้นทางครั้งเดียว
+    d_paths อาจเป็น sink object (มี write/close/abort เช่น chunk_store.ChunkSink) แทน path ได้
+    throttle(nbytes) ถูกเรียกทุกครั้งที่อ่านได้ข้อมูล (บล็อกเพื่อจำกัดความเร็ว ดู throttle.py)
+    hasher (ContentHasher) ได้รับข้อมูลทั้งหมดที่อ่าน ใช้ได้เมื่อไม่มีปลายทางไหนล้มเหลว
+    (None ถ้า hasher ยอมให้ไฟล์ขนาดนี้คัดลอกแบบ zero-copy ดู ContentHasher.allows_zero_copy)
+    คืน dict {d_path: exception หรือ None} ปลายทางที่ล้มเหลวจะถูกลบทิ้ง ไม่ทิ้งไฟล์ครึ่ง ๆ ไว้
+    """
+    errors = {d_path: None for d_path in d_paths}
+    try:
+        src = open(s_path, "rb")
+    except Exception as e:
+        return {d_path: e for d_path in d_paths}
+
+    outputs = {}
+    for d_path in d_paths:
+        try:
+            outputs[d_path] = open(d_path, "wb") if isinstance(d_path, str) else d_path
+        except Exception as e:
+            errors[d_path] = e
+    files_only = all(isinstance(d_path, str) for d_path in outputs)
+
+    try:
+        size = s_stat.st_size
+        if not outputs:
+            pass
+        elif size >= LARGE_FILE_THRESHOLD and chunk_executor is not None and files_only:
+            _copy_chunked(s_path, src, outputs, errors, size, throttle, hasher)
+        elif (len(outputs) == 1 and size and files_only and (hasher is None or hasher.allows_zero_copy(size))
+              and _zero_copy(src, next(iter(outputs.values())), size, throttle)):
+            if hasher is not None:
+                hasher.skipped = True
+        else:
+            _copy_buffered(src, outputs, errors, size, throttle, hasher)
+    except Exception as e:
+        # อ่านต้นทางไม่ได้ → ทุกปลายทางที่ยังค้างอยู่ล้มเหลว
+        for d_path in outputs:
+            errors[d_path] = errors[d_path] or e
+    finally:
+        src.close()
+        for d_path, f in outputs.items():
+            try:
+                f.close()
+            except Exception as e:
+                errors[d_path] = errors[d_path] or e
+
+    for d_path, error in errors.items():
+        if error is not None and d_path in outputs:
+            try:
+                if isinstance(d_path, str):
+                    os.remove(d_path)
+                else:
+                    d_path.abort()
+            except OSError:
+                pass
+    return errors
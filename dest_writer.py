@@ -0,0 +1,107 @@
+import os
+import stat
+import threading
+from collections import Counter
+
+# ตัวจัดการ metadata ฝั่งปลายทางของ snapshot แบบ tree (หนึ่งตัวต่อ target)
+# - จำโฟลเดอร์ที่สร้างแล้ว ไฟล์ต่อ ๆ ไปในโฟลเดอร์เดียวกันไม่ต้อง makedirs ซ้ำ (makedirs ที่มีอยู่แล้ว = stat + mkdir + stat)
+#   โฟลเดอร์มาก่อนไฟล์ข้างในเสมอ จึงสร้างด้วย mkdir ครั้งเดียวต่อโฟลเดอร์
+# - รู้รายการโฟลเดอร์ล่วงหน้า (--execute-plan) สร้างโครงโฟลเดอร์ทั้งหมดก่อนเริ่มคัดลอก (V5.make_skeleton)
+# - snapshot ใหม่ยังไม่มีไฟล์ใด ๆ ไม่ต้อง stat เช็คว่าไฟล์ปลายทางมีอยู่แล้วหรือไม่
+# - chmod ไฟล์เฉพาะเมื่อสิทธิ์ของต้นทางต่างจากสิทธิ์ที่ไฟล์ใหม่ได้อยู่แล้ว
+# - เวลาแก้ไขของโฟลเดอร์ตั้งรวดเดียวตอนจบรอบ (ถ้าตั้งตอนสร้าง การเขียนไฟล์ข้างในจะทับเวลาไปอีก)
+#   ไม่ตั้งสิทธิ์ของโฟลเดอร์ (โฟลเดอร์อ่านอย่างเดียวทำให้ retention ลบ snapshot ไม่ได้)
+# - นับ syscall ของ metadata ที่ทำจริงและที่ประหยัดได้ ไว้สรุปใน log
+
+
+def _default_file_mode():
+    if os.name == "nt":
+        return 0o666  # chmod บน Windows เปลี่ยนแค่ read-only และไฟล์ใหม่เขียนได้เสมอ
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+DEFAULT_FILE_MODE = _default_file_mode()  # สิทธิ์ของไฟล์ที่ open(..., "wb") สร้างใหม่
+
+
+class DestWriter:
+    def __init__(self, root, fresh=False):
+        self.root = root
+        self.fresh = fresh  # snapshot ที่เพิ่งเริ่ม (ไม่ได้ทำต่อจากรอบที่ค้าง)
+        self.lock = threading.Lock()
+        self.dirs = set()
+        self.dir_times = {}
+        self.calls = Counter()
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.calls[key] += amount
+
+    def make_dir(self, rel_dir):
+        """สร้างโฟลเดอร์ (ครั้งเดียวต่อโฟลเดอร์ต่อรอบ) คืน False ถ้าสร้างไว้แล้วในรอบนี้ โฟลเดอร์แม่ปกติถูกสร้างมาก่อนแล้ว"""
+        if rel_dir in self.dirs:
+            self._count("mkdir_saved")
+            return False
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        try:
+            os.mkdir(path)
+            self._count("mkdir")
+        except FileExistsError:
+            self._count("mkdir")
+        except FileNotFoundError:
+            os.makedirs(path, exist_ok=True)  # โฟลเดอร์แม่ยังไม่มี (เช่นโหมดต่อเนื่องที่ส่งมาแค่ไฟล์)
+            self._count("makedirs")
+        with self.lock:
+            self.dirs.add(rel_dir)
+        return True
+
+    def known_dir(self, rel_dir):
+        """โฟลเดอร์ที่รู้ว่ามีอยู่แล้ว (journal ของรอบที่ค้างบันทึกไว้)"""
+        with self.lock:
+            self.dirs.add(rel_dir)
+
+    def ensure_parent(self, rel_path):
+        self.make_dir(os.path.dirname(rel_path))
+
+    def exists(self, rel_path):
+        if self.fresh:
+            self._count("stat_saved")
+            return False
+        self._count("stat")
+        return os.path.exists(os.path.join(self.root, rel_path))
+
+    def apply_file_metadata(self, path, s_stat):
+        """ตั้งเวลาแก้ไขและสิทธิ์ตามต้นทาง โดยใช้ stat ที่มีอยู่แล้ว ไม่ต้อง stat ต้นทางซ้ำ"""
+        os.utime(path, ns=(s_stat.st_atime_ns, s_stat.st_mtime_ns))
+        self._count("utime")
+        mode = stat.S_IMODE(s_stat.st_mode)
+        if mode == DEFAULT_FILE_MODE:
+            self._count("chmod_saved")
+            return
+        os.chmod(path, mode)
+        self._count("chmod")
+
+    def defer_dir_times(self, rel_dir, dir_stat):
+        """เก็บเวลาของโฟลเดอร์ต้นทางไว้ตั้งตอน finish()"""
+        mtime_ns = dir_stat.st_mtime_ns
+        with self.lock:
+            self.dir_times[rel_dir] = (getattr(dir_stat, "st_atime_ns", mtime_ns), mtime_ns)
+
+    def finish(self):
+        """ตั้งเวลาแก้ไขของทุกโฟลเดอร์รวดเดียว (เรียกเมื่อรอบนี้เขียนไฟล์เสร็จแล้ว) คืนจำนวนที่ตั้งไม่ได้"""
+        failed = 0
+        for rel_dir, times in self.dir_times.items():
+            try:
+                os.utime(os.path.join(self.root, rel_dir) if rel_dir else self.root, ns=times)
+                self._count("dir_utime")
+            except OSError:
+                failed += 1
+        self.dir_times.clear()
+        return failed
+
+    def summary(self):
+        c = self.calls
+        return (f"🗂️ metadata ปลายทาง {self.root}: mkdir {c['mkdir'] + c['makedirs']} (ข้าม {c['mkdir_saved']}), "
+                f"stat {c['stat']} (ข้าม {c['stat_saved']}), utime {c['utime']}, "
+                f"chmod {c['chmod']} (ข้าม {c['chmod_saved']}), เวลาโฟลเดอร์ {c['dir_utime']}")
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+
+# ดัชนีสถานะไฟล์ต่อไดรฟ์ต้นทาง เก็บไว้ข้าง ๆ backup ที่ {destination_base}/.backup_index/
+# ใช้เทียบผล stat ของไฟล์ต้นทางกับรอบที่สำเร็จล่าสุด โดยไม่ต้องอ่านเนื้อไฟล์ผ่าน SMB
+# - path ที่เห็นในรอบนี้จดไว้ใน temp table (ไม่เขียนดัชนีบนปลายทางเพิ่มสำหรับไฟล์ที่ไม่เปลี่ยน)
+#   รอบที่เดินครบทั้งไดรฟ์และสำเร็จเรียก sweep() ลบแถวของไฟล์/โฟลเดอร์ที่ถูกลบจากต้นทางไปแล้ว
+
+INDEX_DIR_NAME = ".backup_index"
+FLUSH_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    hash TEXT
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    entries INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    children TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+)
+"""
+
+
+def index_path_for(destination_base, drive_letter):
+    name = drive_letter.replace("/", "_").replace("\\", "_").strip("_") or "root"
+    return os.path.join(destination_base, INDEX_DIR_NAME, f"{name}.sqlite")
+
+
+def index_total_bytes(db_path):
+    """ขนาดรวมของไฟล์ในดัชนีรอบที่แล้ว (ใช้ประมาณขนาดงาน) คืน 0 ถ้ายังไม่มีดัชนี"""
+    if not os.path.exists(db_path):
+        return 0
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+
+
+class FileIndex:
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.pending = []
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("CREATE TEMP TABLE seen_files (path TEXT PRIMARY KEY)")
+        self.conn.execute("CREATE TEMP TABLE seen_dirs (path TEXT PRIMARY KEY)")
+        self.conn.commit()
+        self.seen_pending = []
+        self.dirs_tracked = False
+
+    def get(self, rel_path):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT size, mtime_ns, inode, hash FROM files WHERE path = ?", (rel_path,)
+            ).fetchone()
+
+    def get_hash(self, rel_path):
+        row = self.get(rel_path)
+        return row[3] if row else None
+
+    def matches(self, rel_path, st):
+        """True ถ้า size, mtime_ns และ inode/file-id ตรงกับรอบก่อน"""
+        row = self.get(rel_path)
+        if row is None:
+            return False
+        size, mtime_ns, inode, _ = row
+        return size == st.st_size and mtime_ns == st.st_mtime_ns and (not inode or not st.st_ino or inode == st.st_ino)
+
+    def record(self, rel_path, st, digest=None):
+        with self.lock:
+            self.pending.append((rel_path, st.st_size, st.st_mtime_ns, st.st_ino, digest))
+            if len(self.pending) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def seen(self, rel_path):
+        """ไฟล์นี้ยังอยู่ที่ต้นทางในรอบนี้ (record() นับเป็นเห็นแล้วด้วย)"""
+        with self.lock:
+            self.seen_pending.append((rel_path,))
+            if len(self.seen_pending) >= FLUSH_EVERY:
+                self._flush_seen_locked()
+
+    def seen_dir(self, rel_dir):
+        with self.lock:
+            self.dirs_tracked = True
+            self.conn.execute("INSERT OR IGNORE INTO seen_dirs (path) VALUES (?)", (rel_dir,))
+
+    def sweep(self):
+        """
+        ลบแถวของ path ที่ไม่เห็นในรอบนี้ เรียกเฉพาะรอบที่เดินครบทั้งไดรฟ์และสำเร็จเท่านั้น
+        โฟลเดอร์ลบเฉพาะเมื่อรอบนี้จดโฟลเดอร์ไว้ (prescan) คืน (จำนวนไฟล์, จำนวนโฟลเดอร์) ที่ลบ
+        """
+        with self.lock:
+            self._flush_locked()
+            files = self.conn.execute("DELETE FROM files WHERE path NOT IN (SELECT path FROM seen_files)").rowcount
+            dirs = 0
+            if self.dirs_tracked:
+                dirs = self.conn.execute("DELETE FROM dirs WHERE path NOT IN (SELECT path FROM seen_dirs)").rowcount
+            self.conn.commit()
+        return files, dirs
+
+    def get_dir(self, rel_dir):
+        """fingerprint ของโฟลเดอร์จากรอบก่อน (mtime_ns, entries, digest, children JSON) หรือ None"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT mtime_ns, entries, digest, children FROM dirs WHERE path = ?", (rel_dir,)
+            ).fetchone()
+
+    def record_dir(self, rel_dir, mtime_ns, entries, digest, children):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, mtime_ns, entries, digest, children) VALUES (?, ?, ?, ?, ?)",
+                (rel_dir, mtime_ns, entries, digest, children),
+            )
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+            self.conn.commit()
+
+    def _flush_seen_locked(self):
+        self.conn.executemany("INSERT OR IGNORE INTO seen_files (path) VALUES (?)", self.seen_pending)
+        self.seen_pending = []
+
+    def _flush_locked(self):
+        if self.pending:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, hash) VALUES (?, ?, ?, ?, ?)",
+                self.pending,
+            )
+            self.seen_pending.extend((row[0],) for row in self.pending)
+            self.pending = []
+        self._flush_seen_locked()
+        self.conn.commit()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def close(self):
+        with self.lock:
+            self._flush_locked()
+            self.conn.close()
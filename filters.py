@@ -0,0 +1,145 @@
+import fnmatch
+import hashlib
+import os
+import re
+import threading
+import time
+
+# ตัวกรองไฟล์/โฟลเดอร์ระหว่างเดินต้นไม้ ตั้งใน [Filters] ของ config.ini
+#   exclude_glob = *.tmp, ~$*        (ชื่อไฟล์ หรือ path สัมพัทธ์ถ้ามี / เช่น Temp/*.dmp)
+#   exclude_regex = ...              (regex เทียบกับ path สัมพัทธ์ ใช้ / เป็นตัวคั่น คั่นหลายอันด้วย ;)
+#   include_glob = *.docx, *.xlsx    (ถ้าตั้ง: เก็บเฉพาะไฟล์ที่ตรง)
+#   exclude_dirs = $RECYCLE.BIN, node_modules   (ชื่อโฟลเดอร์ หรือ path สัมพัทธ์ โฟลเดอร์ที่ตรงจะไม่ถูก list เลย)
+#   max_size_mb = 0, max_age_days = 0           (0 = ไม่จำกัด; อายุดูจากเวลาแก้ไขล่าสุด)
+# ตั้งเฉพาะไดรฟ์ได้ด้วย key@drive เช่น exclude_glob@Y = *.bak (รายการต่อท้ายค่ากลาง ค่าตัวเลขใช้แทนค่ากลาง)
+#   ชื่อไดรฟ์เทียบผ่าน drive_key: @Y ตรงกับ Y:/, Y:\ และ Y: ส่วน UNC \\nas1\share เขียนเป็น @nas1/share
+# ทุก pattern ถูก compile รวมเป็น regex เดียวต่อชนิดตอนเริ่ม และเทียบแบบไม่สนตัวพิมพ์เล็ก/ใหญ่ (เหมือน Windows)
+
+LIST_KEYS = ["exclude_glob", "exclude_regex", "include_glob", "exclude_dirs"]
+NUMBER_KEYS = ["max_size_mb", "max_age_days"]
+
+
+def drive_key(drive):
+    """ชื่อไดรฟ์สำหรับเทียบกับ key@ไดรฟ์ (ตัด / \\ : ไม่สนตัวพิมพ์) เช่น Y:/, Y:\\ และ Y ได้ y"""
+    return "/".join(part for part in re.split(r"[/\\:]+", drive) if part).lower()
+
+
+def drive_option(config, section, key, drive, fallback=None):
+    """ค่า key@ไดรฟ์ ของไดรฟ์นี้ ถ้าไม่ได้ตั้งใช้ key ปกติ"""
+    if config.has_section(section):
+        for option, value in config.items(section):
+            name, _, target = option.partition("@")
+            if name == key and target and drive_key(target) == drive_key(drive):
+                return value
+    return config.get(section, key, fallback=fallback)
+
+
+def _split(text, sep=","):
+    return [part.strip() for part in text.split(sep) if part.strip()]
+
+
+def _compile_globs(patterns):
+    """(regex สำหรับชื่อ, regex สำหรับ path สัมพัทธ์) หรือ None ถ้าไม่มี pattern ชนิดนั้น"""
+    names = [fnmatch.translate(p) for p in patterns if "/" not in p]
+    paths = [fnmatch.translate(p.strip("/")) for p in patterns if "/" in p]
+    compile_any = lambda parts: re.compile("|".join(parts), re.IGNORECASE) if parts else None
+    return compile_any(names), compile_any(paths)
+
+
+class FileFilter:
+    def __init__(self, exclude_glob=(), exclude_regex=(), include_glob=(), exclude_dirs=(),
+                 max_size_mb=0, max_age_days=0):
+        self.rules = {
+            "exclude_glob": list(exclude_glob),
+            "exclude_regex": list(exclude_regex),
+            "include_glob": list(include_glob),
+            "exclude_dirs": list(exclude_dirs),
+            "max_size_mb": max_size_mb,
+            "max_age_days": max_age_days,
+        }
+        self.exclude_name, self.exclude_path = _compile_globs(exclude_glob)
+        self.include_name, self.include_path = _compile_globs(include_glob)
+        self.exclude_dir_name, self.exclude_dir_path = _compile_globs(exclude_dirs)
+        self.exclude_re = re.compile("|".join(f"(?:{r})" for r in exclude_regex), re.IGNORECASE) if exclude_regex else None
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.min_mtime = time.time() - max_age_days * 86400 if max_age_days else None
+        self.lock = threading.Lock()
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.skipped_dirs = 0
+
+    @classmethod
+    def from_config(cls, config, drive=None, section="Filters"):
+        """FileFilter ของไดรฟ์ (drive = ชื่อไดรฟ์ในรูปไหนก็ได้ เช่น Y:/ หรือ Y/) หรือ None ถ้าไม่มีกฎ"""
+        if not config.has_section(section):
+            return None
+        drive = drive_key(drive) if drive is not None else None
+        values = {key: [] for key in LIST_KEYS}
+        values.update({key: 0 for key in NUMBER_KEYS})
+        for option, value in config.items(section):
+            key, _, target = option.partition("@")
+            if target and (drive is None or drive_key(target) != drive):
+                continue
+            if key in LIST_KEYS:
+                values[key].extend(_split(value, ";" if key == "exclude_regex" else ","))
+            elif key in NUMBER_KEYS and value.strip():
+                values[key] = float(value)
+        if not any(values.values()):
+            return None
+        return cls(**values)
+
+    def signature(self):
+        """ค่า hash ของกฎ (prescan ใช้ตรวจว่ากฎเปลี่ยนตั้งแต่รอบก่อนหรือไม่)"""
+        rules = dict(self.rules, max_age_days=0)  # อายุเลื่อนไปทุกวัน ไม่นับเป็นการเปลี่ยนกฎ
+        return hashlib.sha1(repr(sorted(rules.items())).encode("utf-8")).hexdigest()
+
+    def excluded(self, rel_path, st, is_dir):
+        """True ถ้าไม่ต้องสำรองรายการนี้ (โฟลเดอร์ที่ไม่เอาจะไม่ถูกเดินลงไปเลย)"""
+        name = os.path.basename(rel_path)
+        path = rel_path.replace(os.sep, "/")
+        if is_dir:
+            skip = bool((self.exclude_dir_name and self.exclude_dir_name.match(name))
+                        or (self.exclude_dir_path and self.exclude_dir_path.match(path))
+                        or (self.exclude_re and self.exclude_re.search(path + "/")))
+            if skip:
+                with self.lock:
+                    self.skipped_dirs += 1
+            return skip
+
+        skip = bool((self.exclude_name and self.exclude_name.match(name))
+                    or (self.exclude_path and self.exclude_path.match(path))
+                    or (self.exclude_re and self.exclude_re.search(path))
+                    or (self.max_size and st.st_size > self.max_size)
+                    or (self.min_mtime and st.st_mtime < self.min_mtime))
+        if not skip and (self.include_name or self.include_path):
+            skip = not ((self.include_name and self.include_name.match(name))
+                        or (self.include_path and self.include_path.match(path)))
+        if skip:
+            with self.lock:
+                self.skipped_files += 1
+                self.skipped_bytes += st.st_size
+        return skip
+
+    def robocopy_args(self):
+        """
+        แปลงกฎเป็น switch ของ robocopy (/XF, /XD, /MAX, /MAXAGE) คืน (args, กฎที่แปลงไม่ได้)
+        robocopy เทียบแค่ชื่อ ไม่รองรับ regex, include และ pattern ที่เป็น path
+        """
+        args, unsupported = [], []
+        names = [p for p in self.rules["exclude_glob"] if "/" not in p]
+        dirs = [p for p in self.rules["exclude_dirs"] if "/" not in p]
+        if names:
+            args += ["/XF", *names]
+        if dirs:
+            args += ["/XD", *dirs]
+        if self.max_size:
+            args.append(f"/MAX:{self.max_size}")
+        if self.rules["max_age_days"]:
+            args.append(f"/MAXAGE:{int(self.rules['max_age_days'])}")
+        unsupported += [p for p in self.rules["exclude_glob"] + self.rules["exclude_dirs"] if "/" in p]
+        unsupported += self.rules["exclude_regex"] + self.rules["include_glob"]
+        return args, unsupported
+
+    def summary(self):
+        return (f"🧹 ตัวกรอง: ข้าม {self.skipped_files} ไฟล์ ({self.skipped_bytes / 1024 / 1024:.1f} MB), "
+                f"{self.skipped_dirs} โฟลเดอร์")
@@ -0,0 +1,100 @@
+import os
+import threading
+
+# ตัวจัดคิวงานสำรองกลาง (ไดรฟ์ × ปลายทาง)
+# จำกัดจำนวนงานพร้อมกันทั้งหมด / ต่อ share ต้นทาง / ต่อดิสก์ปลายทาง
+# และเริ่มงานที่ใหญ่ที่สุดก่อน เพื่อให้เวลารวมทั้งคืนสั้นลง
+# ข้อจำกัด: งานหนึ่งไดรฟ์อ่านครั้งเดียวแล้วเขียนทุกปลายทางไปพร้อมกัน (ไม่มีช่วงเขียนแยกต่อปลายทาง)
+# งานสำรองทุกงานจึงถือทุก key ปลายทาง และ max_per_destination มีผลแค่เป็นเพดานรวมอีกตัว
+# (= min(max_total, max_per_destination)) งานที่ไม่เขียนปลายทาง (plan) ส่ง destination_keys ว่าง
+
+
+def source_share_key(source_dir, share_groups):
+    """หา share ที่ไดรฟ์นี้อยู่ ตาม [SourceShares] ใน config ถ้าไม่ได้กำหนดให้ถือว่าแต่ละไดรฟ์แยกกัน"""
+    normalized = os.path.normcase(os.path.normpath(source_dir))
+    for share, drives in share_groups.items():
+        if normalized in drives:
+            return share
+    if normalized.startswith("\\\\"):
+        # UNC path \\server\share\... → แยกตาม server
+        return normalized.split("\\")[2]
+    return normalized
+
+
+def destination_disk_key(destination_base):
+    """ปลายทางที่อยู่บนดิสก์เดียวกันจะได้ key เดียวกัน (ใช้ st_dev / volume serial)"""
+    path = destination_base
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return os.path.normcase(destination_base)
+        path = parent
+    return f"dev:{os.stat(path).st_dev}"
+
+
+def parse_share_groups(config, section="SourceShares"):
+    groups = {}
+    if config.has_section(section):
+        for share, drives in config.items(section):
+            groups[share] = {
+                os.path.normcase(os.path.normpath(d.strip())) for d in drives.split(",") if d.strip()
+            }
+    return groups
+
+
+class JobScheduler:
+    def __init__(self, max_total, max_per_source, max_per_destination, on_error=None):
+        self.max_total = max_total
+        self.max_per_source = max_per_source
+        self.max_per_destination = max_per_destination
+        self.on_error = on_error
+        self.cond = threading.Condition()
+        self.running = 0
+        self.per_source = {}
+        self.per_destination = {}
+
+    def _can_start(self, job):
+        if self.running >= self.max_total:
+            return False
+        if self.per_source.get(job["source_key"], 0) >= self.max_per_source:
+            return False
+        return all(self.per_destination.get(k, 0) < self.max_per_destination for k in job["destination_keys"])
+
+    def _acquire(self, job, delta):
+        self.running += delta
+        self.per_source[job["source_key"]] = self.per_source.get(job["source_key"], 0) + delta
+        for k in job["destination_keys"]:
+            self.per_destination[k] = self.per_destination.get(k, 0) + delta
+
+    def _run_job(self, job):
+        try:
+            job["func"](*job["args"])
+        except Exception as e:
+            if self.on_error:
+                self.on_error(job, e)
+        finally:
+            with self.cond:
+                self._acquire(job, -1)
+                self.cond.notify_all()
+
+    def run(self, jobs):
+        """
+        jobs: list ของ dict {name, source_key, destination_keys, priority, func, args}
+        priority มากเริ่มก่อน (เช่น ขนาดไดรฟ์จากรอบที่แล้ว) และรอจนทุกงานเสร็จ
+        """
+        waiting = sorted(jobs, key=lambda j: j["priority"], reverse=True)
+        threads = []
+        with self.cond:
+            while waiting:
+                job = next((j for j in waiting if self._can_start(j)), None)
+                if job is None:
+                    self.cond.wait()
+                    continue
+                waiting.remove(job)
+                self._acquire(job, 1)
+                t = threading.Thread(target=self._run_job, args=(job,), name=f"job-{job['name']}", daemon=True)
+                t.start()
+                threads.append(t)
+
+        for t in threads:
+            t.join()
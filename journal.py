@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+
+# journal แบบ write-ahead ต่องาน (ไดรฟ์, ปลายทาง) เก็บที่ {destination_base}/.backup_journal/
+# - บรรทัดแรกบอกว่ากำลังเขียน snapshot ไหน บรรทัดถัดไปคือโฟลเดอร์/ไฟล์ที่เสร็จแล้ว (JSON lines)
+# - ไฟล์ถูกบันทึกหลังจาก rename เข้าที่แล้วเท่านั้น journal จึงไม่เคยอ้างถึงไฟล์ครึ่ง ๆ
+# - รอบสำเร็จจะลบ journal ทิ้ง ถ้ายังเหลืออยู่แปลว่ารอบก่อนค้าง → รอบถัดไปทำต่อจาก snapshot เดิม
+# - ไฟล์ที่โหมดต่อเนื่อง (watcher.py) คัดลอกไว้ระหว่างวันมี "live": 1 รอบกลางคืนใช้แยกไฟล์ที่ถูกลบจากต้นทางไปแล้ว
+
+JOURNAL_DIR_NAME = ".backup_journal"
+TMP_DIR_NAME = ".backup_tmp"
+FLUSH_EVERY = 200
+
+
+def _job_name(drive_letter):
+    return drive_letter.replace("/", "_").replace("\\", "_").strip("_") or "root"
+
+
+def journal_path_for(destination_base, drive_letter):
+    return os.path.join(destination_base, JOURNAL_DIR_NAME, f"{_job_name(drive_letter)}.jsonl")
+
+
+def tmp_dir_for(destination_base, drive_letter):
+    """โฟลเดอร์ไฟล์ชั่วคราวของงาน อยู่บน volume เดียวกับ snapshot เพื่อให้ rename เป็น atomic"""
+    return os.path.join(destination_base, TMP_DIR_NAME, _job_name(drive_letter))
+
+
+def active_snapshots(destination_base):
+    """path ของ snapshot ที่มี journal ค้างอยู่ (ยังเขียนไม่เสร็จ หรือโหมดต่อเนื่องกำลังเติมอยู่)"""
+    journal_dir = os.path.join(destination_base, JOURNAL_DIR_NAME)
+    if not os.path.isdir(journal_dir):
+        return set()
+    active = set()
+    for name in os.listdir(journal_dir):
+        if not name.endswith(".jsonl"):
+            continue
+        try:
+            with open(os.path.join(journal_dir, name), encoding="utf-8") as f:
+                header = json.loads(f.readline())
+            active.add(os.path.normpath(os.path.join(destination_base, header["snapshot"])))
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+    return active
+
+
+def trim_torn_tail(path):
+    """ตัดบรรทัดสุดท้ายที่เขียนไม่ครบ (ไม่มี newline) ทิ้ง ก่อนเปิดไฟล์ JSON lines เขียนต่อท้าย"""
+    if os.path.exists(path):
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+
+def load_journal(path):
+    """
+    อ่าน journal ที่ค้างอยู่ คืน dict {snapshot, format, started, files, dirs, live} หรือ None ถ้าไม่มี
+    live = path ของไฟล์ที่โหมดต่อเนื่องคัดลอกไว้และรอบกลางคืนยังไม่ได้บันทึกซ้ำ
+    บรรทัดสุดท้ายที่เขียนไม่ครบ (เครื่องดับกลางทาง) จะถูกข้าม
+    """
+    if not os.path.exists(path):
+        return None
+    state = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if state is None:
+                if "snapshot" not in entry:
+                    return None
+                state = dict(entry, files={}, dirs=set(), live=set())
+            elif "f" in entry:
+                state["files"][entry["f"]] = (entry["size"], entry["mtime_ns"])
+                if entry.get("live"):
+                    state["live"].add(entry["f"])
+                else:
+                    state["live"].discard(entry["f"])
+            elif "d" in entry:
+                state["dirs"].add(entry["d"])
+    return state
+
+
+class Journal:
+    def __init__(self, path, snapshot, destination_format, started, resume=False):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.live = False  # โหมดต่อเนื่อง: ไฟล์ที่บันทึกถูกทำเครื่องหมาย live
+        if resume:
+            trim_torn_tail(path)
+            self.f = open(path, "a", encoding="utf-8")
+        else:
+            self.f = open(path, "w", encoding="utf-8")
+            self._write({"snapshot": snapshot, "format": destination_format, "started": started})
+            self.flush()
+
+    def _write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.f.write(line)
+            self.pending += 1
+            if self.pending >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending = 0
+
+    def dir_done(self, rel_path):
+        self._write({"d": rel_path.replace(os.sep, "/")})
+
+    def file_done(self, rel_path, s_stat):
+        entry = {"f": rel_path.replace(os.sep, "/"), "size": s_stat.st_size, "mtime_ns": s_stat.st_mtime_ns}
+        if self.live:
+            entry["live"] = 1
+        self._write(entry)
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def close(self, finished=False):
+        """finished=True: รอบนี้เสร็จสมบูรณ์ ลบ journal ทิ้ง, ไม่เช่นนั้นเก็บไว้ให้รอบถัดไปทำต่อ"""
+        with self.lock:
+            self._flush_locked()
+            self.f.close()
+        if finished:
+            os.remove(self.path)
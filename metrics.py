@@ -0,0 +1,196 @@
+import collections
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ตัวนับความคืบหน้าระหว่างสำรองข้อมูล ต่อไดรฟ์และต่อปลายทาง
+# - ไดรฟ์: ไฟล์/ไบต์ที่สแกนแล้ว, ที่ทำเสร็จแล้ว, throughput ล่าสุด และ ETA (ประมาณจากขนาดในดัชนีรอบก่อน)
+# - ปลายทาง: อ่านจาก dict target ของ V5 (copied, linked, resumed, errors, bytes)
+# - เปิดดูได้ที่ http://127.0.0.1:{http_port}/metrics (รูปแบบ Prometheus text) และเขียนสรุปลง log เป็นระยะ
+
+THROUGHPUT_WINDOW = 30  # วินาที
+SAMPLE_EVERY = 0.5
+TARGET_COUNTERS = [
+    ("files_copied_total", "copied", "ไฟล์ที่คัดลอกจริง"),
+    ("files_linked_total", "linked", "ไฟล์ที่ hard-link หรือใช้ chunk เดิม"),
+    ("files_resumed_total", "resumed", "ไฟล์ที่รอบที่ค้างทำไว้แล้ว"),
+    ("bytes_copied_total", "bytes", "ไบต์ที่เขียนลงปลายทาง"),
+    ("errors_total", "errors", "จำนวนข้อผิดพลาด"),
+]
+
+
+class DriveProgress:
+    def __init__(self, drive, targets, expected_bytes=0):
+        self.drive = drive
+        self.targets = targets
+        self.expected_bytes = expected_bytes
+        self.lock = threading.Lock()
+        self.files_scanned = 0
+        self.bytes_scanned = 0
+        self.files_done = 0
+        self.bytes_done = 0
+        self.scan_finished = False
+        self.running = True
+        self.started = time.monotonic()
+        self.samples = collections.deque([(self.started, 0)])
+
+    def scanned(self, s_stat):
+        with self.lock:
+            self.files_scanned += 1
+            self.bytes_scanned += s_stat.st_size
+
+    def processed(self, s_stat):
+        now = time.monotonic()
+        with self.lock:
+            self.files_done += 1
+            self.bytes_done += s_stat.st_size
+            if now - self.samples[-1][0] >= SAMPLE_EVERY:
+                self.samples.append((now, self.bytes_done))
+                while len(self.samples) > 2 and now - self.samples[0][0] > THROUGHPUT_WINDOW:
+                    self.samples.popleft()
+
+    def throughput(self):
+        """ไบต์ต่อวินาทีในช่วง THROUGHPUT_WINDOW ล่าสุด"""
+        now = time.monotonic()
+        with self.lock:
+            first_time, first_bytes = self.samples[0]
+            elapsed = now - first_time
+            return (self.bytes_done - first_bytes) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """วินาทีที่เหลือโดยประมาณ หรือ None ถ้ายังประมาณไม่ได้"""
+        rate = self.throughput()
+        with self.lock:
+            total = self.bytes_scanned if self.scan_finished else max(self.expected_bytes, self.bytes_scanned)
+            remaining = max(0, total - self.bytes_done)
+        if not self.running:
+            return 0.0
+        return remaining / rate if rate > 0 else None
+
+
+_drives = {}
+_lock = threading.Lock()
+_queue_depth = None
+_started = False
+
+
+def start_drive(drive, targets, expected_bytes=0):
+    progress = DriveProgress(drive, targets, expected_bytes)
+    with _lock:
+        _drives[drive] = progress
+    return progress
+
+
+def finish_drive(progress):
+    with progress.lock:
+        progress.scan_finished = True
+        progress.running = False
+
+
+def set_queue_depth(func):
+    """func() คืนจำนวนงานที่ค้างอยู่ในคิวคัดลอก"""
+    global _queue_depth
+    _queue_depth = func
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render():
+    """ค่าทั้งหมดในรูปแบบ Prometheus text exposition"""
+    with _lock:
+        drives = list(_drives.values())
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP backup_{name} {help_text}")
+        lines.append(f"# TYPE backup_{name} {kind}")
+        for labels, value in samples:
+            text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"backup_{name}{{{text}}} {value}" if text else f"backup_{name} {value}")
+
+    metric("drive_running", "gauge", "1 ถ้าไดรฟ์นี้กำลังสำรองอยู่",
+           [({"drive": p.drive}, int(p.running)) for p in drives])
+    metric("files_scanned_total", "counter", "ไฟล์ต้นทางที่สแกนแล้ว",
+           [({"drive": p.drive}, p.files_scanned) for p in drives])
+    metric("bytes_scanned_total", "counter", "ขนาดรวมของไฟล์ต้นทางที่สแกนแล้ว",
+           [({"drive": p.drive}, p.bytes_scanned) for p in drives])
+    metric("files_processed_total", "counter", "ไฟล์ที่ทำเสร็จแล้วทุกปลายทาง",
+           [({"drive": p.drive}, p.files_done) for p in drives])
+    metric("bytes_processed_total", "counter", "ขนาดรวมของไฟล์ที่ทำเสร็จแล้ว",
+           [({"drive": p.drive}, p.bytes_done) for p in drives])
+    metric("throughput_bytes_per_second", "gauge", f"throughput เฉลี่ย {THROUGHPUT_WINDOW} วินาทีล่าสุด",
+           [({"drive": p.drive}, round(p.throughput(), 1)) for p in drives])
+    eta = [(p, p.eta()) for p in drives]
+    metric("eta_seconds", "gauge", "เวลาที่เหลือโดยประมาณ",
+           [({"drive": p.drive}, round(value, 1)) for p, value in eta if value is not None])
+    for name, key, help_text in TARGET_COUNTERS:
+        metric(name, "counter", help_text, [
+            ({"drive": p.drive, "destination": target["base"]}, target.get(key, 0))
+            for p in drives for target in p.targets
+        ])
+    if _queue_depth is not None:
+        metric("copy_queue_depth", "gauge", "งานที่รออยู่ในคิวคัดลอก", [({}, _queue_depth())])
+    return "\n".join(lines) + "\n"
+
+
+def summary_lines():
+    """บรรทัดสรุปของไดรฟ์ที่กำลังสำรองอยู่"""
+    with _lock:
+        drives = [p for p in _drives.values() if p.running]
+    depth = _queue_depth() if _queue_depth is not None else 0
+    lines = []
+    for p in drives:
+        eta = p.eta()
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "?"
+        errors = sum(target.get("errors", 0) for target in p.targets)
+        lines.append(
+            f"📊 {p.drive}: สแกน {p.files_scanned} ไฟล์, เสร็จ {p.files_done} ไฟล์ "
+            f"({p.bytes_done / 1024 / 1024:.0f} MB), {p.throughput() / 1024 / 1024:.1f} MB/s, "
+            f"queue {depth}, errors {errors}, ETA {eta_text}"
+        )
+    return lines
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # ไม่ต้องเขียน access log ลง stderr
+
+
+def start(http_port=0, bind="127.0.0.1", summary_interval=60, log=None):
+    """เปิด HTTP endpoint (http_port > 0) และ thread เขียนสรุป (summary_interval > 0) เรียกซ้ำได้"""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    if http_port:
+        try:
+            server = ThreadingHTTPServer((bind, http_port), _Handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        except OSError as e:
+            if log:
+                log(f"[WARN] เปิด metrics endpoint ที่ {bind}:{http_port} ไม่ได้: {e}")
+
+    if summary_interval > 0 and log:
+        def run():
+            while True:
+                time.sleep(summary_interval)
+                for line in summary_lines():
+                    log(line)
+
+        threading.Thread(target=run, name="metrics-summary", daemon=True).start()
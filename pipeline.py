@@ -0,0 +1,68 @@
+import queue
+import threading
+
+# pipeline คัดลอกไฟล์แบบ producer/consumer
+# ตัวสแกนใส่งานลงคิวที่จำกัดขนาด (เต็มแล้วจะรอ = backpressure) และ worker จำนวนคงที่ดึงงานไปทำต่อเนื่อง
+# ไม่มี barrier ต่อโฟลเดอร์ และหน่วยความจำคงที่ไม่ว่าต้นไม้จะใหญ่แค่ไหน
+
+
+class CopyJob:
+    """นับงานที่ยังค้างของงานสำรองหนึ่งงาน (เช่น หนึ่งไดรฟ์) เพื่อรอจนเสร็จทั้งหมด"""
+
+    def __init__(self):
+        self.pending = 0
+        self.cond = threading.Condition()
+
+    def add(self):
+        with self.cond:
+            self.pending += 1
+
+    def done(self):
+        with self.cond:
+            self.pending -= 1
+            if self.pending == 0:
+                self.cond.notify_all()
+
+    def wait(self):
+        with self.cond:
+            while self.pending:
+                self.cond.wait()
+
+
+class CopyPipeline:
+    def __init__(self, workers, queue_size, on_error=None):
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.on_error = on_error
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"copy-worker-{i}", daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def _worker(self):
+        while True:
+            job, func, args = self.queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+            finally:
+                job.done()
+                self.queue.task_done()
+
+    def submit(self, job, func, *args):
+        """ใส่งานลงคิว ถ้าคิวเต็มจะบล็อกจนกว่า worker จะว่าง"""
+        self.start()
+        job.add()
+        self.queue.put((job, func, args))
+
+    def depth(self):
+        return self.queue.qsize()
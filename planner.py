@@ -0,0 +1,246 @@
+import gzip
+import json
+import os
+import sqlite3
+import time
+
+from prescan import IndexedStat
+
+# plan mode: สแกนอย่างเดียวแล้วสรุปงานก่อนคัดลอกจริง (python V5.py --plan <โฟลเดอร์ plan>)
+# - รายการไฟล์/โฟลเดอร์ที่สแกนได้ของแต่ละไดรฟ์เขียนลง {plan}/{ไดรฟ์}.entries.jsonl.gz ทันทีตามลำดับที่สแกน
+#   ไม่เก็บทั้งไดรฟ์ไว้ในหน่วยความจำ (เหมือน journal.py) ไฟล์สำหรับเทียบกับรอบก่อนเรียงด้วย SQLite ชั่วคราวบนดิสก์
+#   (โฟลเดอร์มาก่อนไฟล์ข้างในเสมอ) รอบจริงใช้รายการนี้แทนการสแกนใหม่ (python V5.py --execute-plan <โฟลเดอร์ plan>)
+# - เทียบกับ catalog ของ snapshot ก่อนหน้า (ถ้ามี) ได้ไฟล์ใหม่/เปลี่ยน/ลบ ตรงกับที่รอบจริงจะ hard-link หรือคัดลอก
+#   ถ้าไม่มี catalog ใช้ดัชนีของไดรฟ์แทน (บอกไฟล์ที่ถูกลบไม่ได้)
+# - ประมาณเวลาจากประวัติรอบก่อน ๆ ในดัชนี: เวลา ≈ a × จำนวนไฟล์ + b × ไบต์ที่ต้องคัดลอก (least squares)
+# - สรุปรวมทั้งหมดอยู่ใน {plan}/plan.json
+
+PLAN_NAME = "plan.json"
+ENTRIES_SUFFIX = ".entries.jsonl.gz"
+HISTORY_KEY = "throughput_history"
+HISTORY_RUNS = 14
+SORT_BATCH = 1000
+
+
+def record_run(index, seconds, files, copied_bytes):
+    """เก็บสถิติของรอบที่สำเร็จลงดัชนี (ใช้ประมาณเวลาใน plan) เก็บไว้ HISTORY_RUNS รอบล่าสุด"""
+    history = load_history(index)
+    history.append({"at": time.time(), "seconds": round(seconds, 3), "files": files, "bytes": copied_bytes})
+    index.set_meta(HISTORY_KEY, json.dumps(history[-HISTORY_RUNS:]))
+
+
+def load_history(index):
+    try:
+        return json.loads(index.get_meta(HISTORY_KEY, "[]"))
+    except ValueError:
+        return []
+
+
+def fit_rates(history):
+    """(วินาทีต่อไฟล์, วินาทีต่อไบต์ที่คัดลอก) จากประวัติ หรือ None ถ้ายังไม่มีประวัติที่ใช้ได้"""
+    runs = [(r["files"], r["bytes"], r["seconds"]) for r in history if r.get("seconds", 0) > 0]
+    if not runs:
+        return None
+    sff = sum(f * f for f, _, _ in runs)
+    sbb = sum(b * b for _, b, _ in runs)
+    sfb = sum(f * b for f, b, _ in runs)
+    sft = sum(f * t for f, _, t in runs)
+    sbt = sum(b * t for _, b, t in runs)
+    det = sff * sbb - sfb * sfb
+    if det > 1e-9 * sff * sbb:
+        a = (sft * sbb - sbt * sfb) / det
+        b = (sbt * sff - sft * sfb) / det
+        if a >= 0 and b >= 0:
+            return a, b
+    # ข้อมูลไม่พอแยกสองตัวแปร (เช่นทุกรอบสัดส่วนเท่า ๆ กัน) ใช้ตัวแปรเดียวที่คลาดเคลื่อนน้อยกว่า
+    candidates = []
+    if sff:
+        a = sft / sff
+        candidates.append((sum((t - a * f) ** 2 for f, _, t in runs), (a, 0.0)))
+    if sbb:
+        b = sbt / sbb
+        candidates.append((sum((t - b * x) ** 2 for _, x, t in runs), (0.0, b)))
+    return min(candidates)[1] if candidates else None
+
+
+def estimate_seconds(rates, files, copy_bytes):
+    if rates is None:
+        return None
+    return rates[0] * files + rates[1] * copy_bytes
+
+
+def makespan(durations, slots):
+    """เวลารวมโดยประมาณเมื่อรันได้พร้อมกัน slots งาน (งานยาวเริ่มก่อน เหมือน JobScheduler)"""
+    loads = [0.0] * max(1, slots)
+    for seconds in sorted(durations, reverse=True):
+        i = loads.index(min(loads))
+        loads[i] += seconds
+    return max(loads)
+
+
+def entries_path_for(plan_dir, drive_letter):
+    name = drive_letter.replace("/", "_").replace("\\", "_").strip("_") or "root"
+    return os.path.join(plan_dir, name + ENTRIES_SUFFIX)
+
+
+class PlanEntries:
+    """เขียนรายการที่สแกนได้ของไดรฟ์หนึ่งลงไฟล์ และเก็บ (path, size, mtime_ns) ของไฟล์ลงดิสก์ไว้เทียบกับรอบก่อน"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.f = gzip.open(path + ".tmp", "wt", encoding="utf-8")
+        # ชื่อว่าง = ฐานข้อมูลชั่วคราวบนดิสก์ (ใหญ่เกินหน่วยความจำได้) ถูกลบเองเมื่อปิด
+        self.sorter = sqlite3.connect("")
+        self.sorter.execute("CREATE TABLE files (path BLOB PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL)")
+        self.pending = []
+        self.files = 0
+        self.bytes = 0
+        self.dirs = 0
+
+    def add(self, rel_path, st, is_dir):
+        path = rel_path.replace(os.sep, "/")
+        if is_dir:
+            entry = [path, 1] if st is None else [path, 1, st.st_mtime_ns]
+            self.f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.dirs += 1
+            return
+        self.f.write(json.dumps([path, 0, st.st_size, st.st_mtime_ns, st.st_ino], ensure_ascii=False) + "\n")
+        # UTF-8 (surrogatepass) เรียงแบบไบต์ได้ลำดับเดียวกับ sorted() ของ str (catalog เรียงแบบนั้น)
+        self.pending.append((path.encode("utf-8", "surrogatepass"), st.st_size, st.st_mtime_ns))
+        if len(self.pending) >= SORT_BATCH:
+            self._flush()
+        self.files += 1
+        self.bytes += st.st_size
+
+    def _flush(self):
+        self.sorter.executemany("INSERT OR REPLACE INTO files (path, size, mtime_ns) VALUES (?, ?, ?)", self.pending)
+        self.pending = []
+
+    def sorted_files(self):
+        """(path, size, mtime_ns) ของไฟล์ทั้งหมดเรียงตาม path"""
+        self._flush()
+        for path, size, mtime_ns in self.sorter.execute("SELECT path, size, mtime_ns FROM files ORDER BY path"):
+            yield path.decode("utf-8", "surrogatepass"), size, mtime_ns
+
+    def close(self, finished=True):
+        self.f.close()
+        self.sorter.close()
+        if finished:
+            os.replace(self.path + ".tmp", self.path)
+        else:
+            os.remove(self.path + ".tmp")
+
+
+def iter_plan_entries(path):
+    """อ่านรายการจาก plan คืน (rel_path, stat, is_dir) แบบเดียวกับ scanner.scan_tree (stat เป็น IndexedStat)"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            rel_path = entry[0].replace("/", os.sep)
+            if entry[1]:
+                # โฟลเดอร์เก็บแค่เวลาแก้ไข (plan เก่าไม่มี)
+                yield rel_path, IndexedStat(0, entry[2], 0) if len(entry) > 2 else None, True
+            else:
+                yield rel_path, IndexedStat(entry[2], entry[3], entry[4]), False
+
+
+def _counts():
+    return {key: 0 for key in (
+        "new_files", "new_bytes", "changed_files", "changed_bytes", "unchanged_files", "deleted_files", "deleted_bytes",
+    )}
+
+
+def compare_with_previous(files, previous, tolerance_ns):
+    """
+    เทียบไฟล์ที่สแกนได้ [(path, size, mtime_ns)] กับ snapshot ก่อนหน้า (iterator เรียงตาม path เช่น catalog.read_catalog)
+    files ต้องเรียงตาม path แล้ว (PlanEntries.sorted_files)
+    ใช้เกณฑ์เดียวกับการ hard-link ของรอบจริง (ขนาดเท่ากันและเวลาแก้ไขต่างไม่เกิน tolerance)
+    """
+    counts = _counts()
+    previous = iter(previous)
+    prev = next(previous, None)
+    for path, size, mtime_ns in files:
+        while prev is not None and prev[0] < path:
+            counts["deleted_files"] += 1
+            counts["deleted_bytes"] += prev[1]
+            prev = next(previous, None)
+        if prev is None or prev[0] != path:
+            counts["new_files"] += 1
+            counts["new_bytes"] += size
+            continue
+        if prev[1] == size and abs(prev[2] - mtime_ns) <= tolerance_ns:
+            counts["unchanged_files"] += 1
+        else:
+            counts["changed_files"] += 1
+            counts["changed_bytes"] += size
+        prev = next(previous, None)
+    while prev is not None:
+        counts["deleted_files"] += 1
+        counts["deleted_bytes"] += prev[1]
+        prev = next(previous, None)
+    return counts
+
+
+def compare_with_index(files, index):
+    """เหมือน compare_with_previous แต่ใช้ดัชนีของไดรฟ์ (ไม่รู้ไฟล์ที่ถูกลบ จึงเป็น None)"""
+    counts = _counts()
+    for path, size, mtime_ns in files:
+        row = index.get(path.replace("/", os.sep))
+        if row is None:
+            counts["new_files"] += 1
+            counts["new_bytes"] += size
+        elif row[0] == size and row[1] == mtime_ns:
+            counts["unchanged_files"] += 1
+        else:
+            counts["changed_files"] += 1
+            counts["changed_bytes"] += size
+    counts["deleted_files"] = counts["deleted_bytes"] = None
+    return counts
+
+
+def write_plan(plan_dir, plan):
+    os.makedirs(plan_dir, exist_ok=True)
+    path = os.path.join(plan_dir, PLAN_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_plan(plan_dir):
+    with open(os.path.join(plan_dir, PLAN_NAME), encoding="utf-8") as f:
+        plan = json.load(f)
+    for drive in plan["drives"]:
+        drive["entries_path"] = os.path.join(plan_dir, drive["entries"])
+    return plan
+
+
+def _size(nbytes):
+    return f"{nbytes / 1024 / 1024:.1f} MB"
+
+
+def _duration(seconds):
+    if seconds is None:
+        return "ไม่ทราบ (ยังไม่มีประวัติ)"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def format_plan(plan):
+    """บรรทัดสรุปของ plan สำหรับ log/หน้าจอ"""
+    lines = [f"📋 plan {plan['created']}: {len(plan['drives'])} ไดรฟ์, เวลาโดยประมาณ {_duration(plan['estimated_seconds'])}"]
+    for drive in plan["drives"]:
+        lines.append(f"  {drive['drive']}: {drive['files']} ไฟล์ {_size(drive['bytes'])} "
+                     f"(สแกน {drive['scan_seconds']:.0f} วินาที, error {drive['scan_errors']}), "
+                     f"ประมาณ {_duration(drive['estimated_seconds'])}")
+        for d in drive["destinations"]:
+            deleted = "?" if d["deleted_files"] is None else d["deleted_files"]
+            lines.append(f"    → {d['base']} ({d['format']}, เทียบกับ {d['compared_with']}): "
+                         f"ใหม่ {d['new_files']}, เปลี่ยน {d['changed_files']}, ลบ {deleted}, "
+                         f"ต้องคัดลอก {_size(d['copy_bytes'])}")
+    for d in plan["destinations"]:
+        mark = "✅" if d["fits"] else "❌"
+        lines.append(f"  {mark} {d['base']}: ต้องใช้ {_size(d['required_bytes'])}, ว่าง {_size(d['free_bytes'])}")
+    return lines
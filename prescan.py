@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+
+from scanner import list_dir
+
+# prescan: ข้ามการ list โฟลเดอร์ที่ไม่เปลี่ยนตั้งแต่รอบก่อน (prescan = true ใน [BackupSettings])
+# - ทุกโฟลเดอร์ที่ list จริงจะถูกเก็บ fingerprint ลงดัชนีของไดรฟ์ (ตาราง dirs):
+#   mtime ของโฟลเดอร์, จำนวนรายการ, hash รวมของ (ชื่อ, ขนาด, mtime) ของลูกทุกตัว และรายชื่อลูก
+# - รอบถัดไป ถ้า mtime ของโฟลเดอร์ (ได้มาจากการ list โฟลเดอร์แม่อยู่แล้ว) ไม่เปลี่ยน
+#   จะสร้างรายการจากดัชนีแทน: ไฟล์ใช้ stat ในดัชนี (จึง hard-link/ใช้ chunk จาก snapshot ก่อนได้ทันที)
+#   โฟลเดอร์ย่อย stat ทีละตัวเพื่อเช็ค mtime ต่อ ไม่ต้อง scandir ทั้งโฟลเดอร์ผ่าน SMB
+# - prescan แลกความถูกต้องกับความเร็ว: mtime ของโฟลเดอร์เปลี่ยนเมื่อเพิ่ม/ลบ/เปลี่ยนชื่อรายการข้างในเท่านั้น
+#   ไฟล์ที่ถูกแก้ไขทับที่เดิมในโฟลเดอร์ที่ถูกข้ามจะไม่ถูกสำรอง (snapshot เก็บเนื้อหาเก่า) จนกว่าจะสแกนเต็มครั้งถัดไป
+#   การเช็ค fingerprint ก่อนใช้ซ้ำต้อง stat ลูกทุกตัว ซึ่งแพงเท่ากับ list ใหม่ จึงไม่ได้ทำ
+#   บังคับสแกนเต็มทุก full_scan_every_days วัน (ค่าเริ่มต้น 2) และนับโฟลเดอร์ที่ prescan พลาดไว้ใน log
+#   ต้นทางที่ไฟล์ถูกแก้ทับที่เดิมบ่อย (ไฟล์ Office, ฐานข้อมูล) ควรปิด prescan หรือใช้คู่กับโหมดต่อเนื่อง (--watch)
+
+LAST_FULL_SCAN_KEY = "prescan_last_full_scan"
+FILTER_KEY = "prescan_filter"  # กฎ filters.py ที่ใช้ตอนเก็บ fingerprint (กฎเปลี่ยน → สแกนเต็ม)
+
+
+class IndexedStat:
+    """stat ของไฟล์ที่มาจากดัชนีรอบก่อน (ไม่ได้ stat ไฟล์ต้นทางจริง) ถ้าต้องคัดลอกจริงให้ stat ใหม่ก่อน"""
+
+    __slots__ = ("st_size", "st_mtime_ns", "st_mtime", "st_ino")
+
+    def __init__(self, size, mtime_ns, inode):
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+        self.st_mtime = mtime_ns / 1e9
+        self.st_ino = inode
+
+
+def fingerprint(items):
+    """(จำนวนรายการ, hash รวมของ stat ลูกทุกตัว, รายชื่อลูก JSON) ของผลการ list หนึ่งโฟลเดอร์"""
+    # mtime ของโฟลเดอร์ย่อยไม่นับ (เช็คแยกตอนลงไปอยู่แล้ว) hash จึงเปลี่ยนเฉพาะเมื่อไฟล์ข้างในเปลี่ยน
+    children = sorted((os.path.basename(rel_path), int(is_dir), 0 if is_dir else st.st_size, 0 if is_dir else st.st_mtime_ns)
+                      for rel_path, st, is_dir in items)
+    digest = hashlib.sha1()
+    for name, is_dir, size, mtime_ns in children:
+        digest.update(f"{name}\0{is_dir}\0{size}\0{mtime_ns}\n".encode("utf-8", "surrogateescape"))
+    names = json.dumps([[name, is_dir] for name, is_dir, _, _ in children], ensure_ascii=False)
+    return len(children), digest.hexdigest(), names
+
+
+class Prescan:
+    def __init__(self, root, index, full_scan_every_days=2, force_full=False, filter_signature="", read_only=False):
+        self.root = root
+        self.index = index
+        self.read_only = read_only  # plan mode: ใช้ fingerprint เดิมได้ แต่ไม่บันทึกใหม่ (ไฟล์ยังไม่ได้ถูกคัดลอก)
+        self.filter_signature = filter_signature
+        last_full = float(index.get_meta(LAST_FULL_SCAN_KEY, 0) or 0)
+        self.filter_changed = index.get_meta(FILTER_KEY, "") != filter_signature
+        self.full = force_full or self.filter_changed or time.time() - last_full >= full_scan_every_days * 86400
+        self.next_full = last_full + full_scan_every_days * 86400
+        self.lock = threading.Lock()
+        self.reused_dirs = 0
+        self.reused_files = 0
+        self.listed_dirs = 0
+        self.missed_dirs = 0  # สแกนเต็ม: mtime เท่าเดิมแต่เนื้อหาเปลี่ยน (prescan จะพลาด)
+
+    def root_stat(self):
+        try:
+            return os.stat(self.root)
+        except OSError:
+            return None
+
+    def _reuse(self, rel_dir, dir_stat):
+        row = self.index.get_dir(rel_dir)
+        if row is None or dir_stat is None or row[0] != dir_stat.st_mtime_ns:
+            return None
+        items = []
+        for name, is_dir in json.loads(row[3]):
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            if is_dir:
+                try:
+                    st = os.stat(os.path.join(self.root, rel_path), follow_symlinks=False)
+                except OSError:
+                    return None
+                if not stat.S_ISDIR(st.st_mode):
+                    return None
+            else:
+                entry = self.index.get(rel_path)
+                if entry is None:  # รอบก่อนทำไฟล์นี้ไม่สำเร็จ → list ใหม่
+                    return None
+                st = IndexedStat(entry[0], entry[1], entry[2])
+            items.append((rel_path, st, bool(is_dir)))
+        return items
+
+    def list_dir(self, rel_dir, dir_stat, on_error=None, on_skip=None, file_filter=None):
+        """เหมือน scanner.list_dir แต่ใช้ผลจากดัชนีถ้าโฟลเดอร์ไม่เปลี่ยน"""
+        if not self.read_only:
+            self.index.seen_dir(rel_dir)
+        if not self.full:
+            items = self._reuse(rel_dir, dir_stat)
+            if items is not None and file_filter is not None:
+                # ไฟล์ที่อายุเกิน max_age_days ตั้งแต่รอบก่อน
+                items = [item for item in items if not file_filter.excluded(*item)]
+            if items is not None:
+                with self.lock:
+                    self.reused_dirs += 1
+                    self.reused_files += sum(1 for _, _, is_dir in items if not is_dir)
+                return items, [(rel_path, st) for rel_path, st, is_dir in items if is_dir]
+
+        failed = []
+
+        def track_error(path, e):
+            failed.append(path)
+            if on_error:
+                on_error(path, e)
+
+        items, _ = list_dir(self.root, rel_dir, track_error, on_skip, file_filter)
+        with self.lock:
+            self.listed_dirs += 1
+        # list ไม่ครบ (error) ห้ามเก็บ fingerprint ไม่เช่นนั้นรอบหน้าจะข้ามรายการที่หายไปตลอด
+        if dir_stat is not None and not failed and not self.read_only:
+            entries, digest, children = fingerprint(items)
+            if self.full and not self.filter_changed:
+                row = self.index.get_dir(rel_dir)
+                if row is not None and row[0] == dir_stat.st_mtime_ns and row[2] != digest:
+                    with self.lock:
+                        self.missed_dirs += 1
+            self.index.record_dir(rel_dir, dir_stat.st_mtime_ns, entries, digest, children)
+        return items, [(rel_path, st) for rel_path, st, is_dir in items if is_dir]
+
+    def finish(self):
+        """เรียกเมื่อรอบนี้สำเร็จ คืนข้อความสรุปสำหรับ log"""
+        if self.full:
+            self.index.set_meta(LAST_FULL_SCAN_KEY, time.time())
+            self.index.set_meta(FILTER_KEY, self.filter_signature)
+            return (f"🔎 prescan: สแกนเต็ม {self.listed_dirs} โฟลเดอร์ "
+                    f"(โฟลเดอร์ที่ mtime เท่าเดิมแต่เนื้อหาเปลี่ยน {self.missed_dirs})")
+        return (f"⏩ prescan: ใช้ผลรอบก่อน {self.reused_dirs} โฟลเดอร์ ({self.reused_files} ไฟล์), "
+                f"list ใหม่ {self.listed_dirs} โฟลเดอร์ (ไฟล์ที่ถูกแก้ทับที่เดิมในโฟลเดอร์ที่ข้ามจะถูกสำรองตอนสแกนเต็ม "
+                f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(self.next_full))})")
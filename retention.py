@@ -0,0 +1,207 @@
+import os
+import re
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from chunk_store import STORE_DIR_NAME, prune_store
+from journal import active_snapshots
+
+# ระบบลบ snapshot เก่า (retention)
+# - อายุของ snapshot ดูจาก timestamp ในชื่อ {drive}_{YYYY-mm-dd_HH-MM-SS} ไม่ใช่ mtime ของโฟลเดอร์
+# - รองรับ keep_last และชั้น daily / weekly / monthly ถ้าไม่ตั้งชั้นไหนเลยจะใช้ max_backup_age_days แบบเดิม
+# - ลบแบบ rename เป็น .deleting-* ก่อน (snapshot ที่ลบไม่ครบจะไม่ดูเหมือน snapshot ที่ใช้ได้)
+#   แล้วค่อยลบจริงใน background thread ที่ priority ต่ำ ขนานไปกับการคัดลอก
+# - snapshot ที่มี journal ค้างอยู่ (ยังไม่เสร็จ) ไม่นับเป็นอันล่าสุดและไม่ถูกลบ
+# - ปลายทางแบบ chunks: การลบ snapshot ลบแค่ manifest ข้อมูลจริงคืนพื้นที่ตอน prune ใน finish_retention
+
+SNAPSHOT_TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+SNAPSHOT_RE = re.compile(
+    r"^(?P<prefix>.*)_(?P<stamp>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})(?P<suffix>\.chunks\.jsonl)?$"
+)
+DELETING_PREFIX = ".deleting-"
+SIDECAR_SUFFIXES = (".hashes.jsonl", ".hashes.jsonl.partial")  # ไฟล์ข้าง snapshot (verify.HASH_MANIFEST_SUFFIX) ลบไปด้วยกัน
+
+
+def _parse(parent, name, rel_parent):
+    m = SNAPSHOT_RE.match(name)
+    if not m:
+        return None
+    try:
+        when = datetime.strptime(m.group("stamp"), SNAPSHOT_TIME_FORMAT)
+    except ValueError:
+        return None
+    return {
+        "path": os.path.join(parent, name),
+        "series": os.path.join(rel_parent, m.group("prefix")),
+        "time": when,
+    }
+
+
+def find_snapshots(base):
+    """หา snapshot ทั้งหมดใต้ base (รวมแบบ {drive}/_{timestamp} ที่อยู่ลึกลงไปหนึ่งชั้น)"""
+    snapshots = []
+    if not os.path.isdir(base):
+        return snapshots
+    for entry in os.scandir(base):
+        if entry.name.startswith("."):
+            continue
+        snap = _parse(base, entry.name, "")
+        if snap:
+            snapshots.append(snap)
+        elif entry.is_dir(follow_symlinks=False):
+            for sub in os.scandir(entry.path):
+                if not sub.name.startswith("."):
+                    snap = _parse(entry.path, sub.name, entry.name)
+                    if snap:
+                        snapshots.append(snap)
+    return snapshots
+
+
+def select_expired(snapshots, keep_last=1, keep_daily=0, keep_weekly=0, keep_monthly=0,
+                   max_age_days=7, now=None):
+    """คืนรายการ snapshot ที่หมดอายุ (คิดแยกกันทีละไดรฟ์)"""
+    now = now or datetime.now()
+    tiered = keep_daily or keep_weekly or keep_monthly
+    cutoff = now - timedelta(days=max_age_days)
+    by_series = {}
+    for snap in snapshots:
+        by_series.setdefault(snap["series"], []).append(snap)
+
+    expired = []
+    for series in by_series.values():
+        series.sort(key=lambda s: s["time"], reverse=True)
+        keep = set(id(s) for s in series[:max(1, keep_last)])  # เก็บอันล่าสุดไว้เสมอ
+        if tiered:
+            for count, bucket in (
+                (keep_daily, lambda t: t.date()),
+                (keep_weekly, lambda t: t.isocalendar()[:2]),
+                (keep_monthly, lambda t: (t.year, t.month)),
+            ):
+                seen = set()
+                for snap in series:
+                    key = bucket(snap["time"])
+                    if key in seen:
+                        continue
+                    if len(seen) >= count:
+                        break
+                    seen.add(key)
+                    keep.add(id(snap))  # อันใหม่สุดของแต่ละช่วง
+        else:
+            keep.update(id(s) for s in series if s["time"] >= cutoff)
+        expired.extend(s for s in series if id(s) not in keep)
+    return expired
+
+
+def _lower_thread_priority():
+    """ลด priority ของ thread ปัจจุบัน (Windows: background mode ลดทั้ง CPU และ I/O)"""
+    try:
+        if os.name == "nt":
+            import ctypes
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+        elif hasattr(os, "setpriority"):
+            # บน Linux ค่า nice ตั้งได้ราย thread ผ่าน native thread id
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except Exception:
+        pass
+
+
+def _remove(path):
+    _lower_thread_priority()
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def mark_for_deletion(path):
+    """rename snapshot ไปเป็น .deleting-* ใน parent เดียวกัน (atomic บน volume เดียวกัน) คืนรายการ path ที่ต้องลบ"""
+    parent, name = os.path.split(path)
+    tag = f"{DELETING_PREFIX}{uuid.uuid4().hex[:8]}-"
+    targets = []
+    for suffix in ("",) + SIDECAR_SUFFIXES:
+        if suffix and not os.path.exists(path + suffix):
+            continue
+        target = os.path.join(parent, tag + name + suffix)
+        os.rename(path + suffix, target)
+        targets.append(target)
+    return targets
+
+
+def find_leftovers(base):
+    """โฟลเดอร์ .deleting-* ที่รอบก่อนลบไม่เสร็จ"""
+    leftovers = []
+    for parent in [base] + [e.path for e in os.scandir(base) if e.is_dir() and not e.name.startswith(".")]:
+        leftovers.extend(e.path for e in os.scandir(parent) if e.name.startswith(DELETING_PREFIX))
+    return leftovers
+
+
+def start_retention(bases, policy, log, workers=2):
+    """
+    เลือก snapshot ที่หมดอายุแล้ว rename ทันที (เร็ว) จากนั้นลบจริงใน background
+    คืน thread ไว้ให้ผู้เรียก join ตอนจบรอบ
+    policy: dict keep_last, keep_daily, keep_weekly, keep_monthly, max_age_days
+    """
+    doomed = []
+    for base in bases:
+        if not os.path.isdir(base):
+            continue
+        try:
+            doomed.extend(find_leftovers(base))
+            active = active_snapshots(base)
+            snapshots = [s for s in find_snapshots(base) if os.path.normpath(s["path"]) not in active]
+            for snap in select_expired(snapshots, **policy):
+                try:
+                    doomed.extend(mark_for_deletion(snap["path"]))
+                    log(f"Deleted old backup: {snap['path']}")
+                except Exception as e:
+                    log(f"[ERROR] ไม่สามารถลบ backup เก่า {snap['path']}: {e}")
+        except Exception as e:
+            log(f"[ERROR] ตรวจสอบ backup เก่าใน {base} ไม่ได้: {e}")
+
+    def run():
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_remove, path): path for path in doomed}
+            for future, path in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    log(f"[ERROR] ลบ {path} ไม่สำเร็จ (จะลองใหม่รอบหน้า): {e}")
+
+    thread = threading.Thread(target=run, name="retention", daemon=True)
+    thread.start()
+    return thread
+
+
+def finish_retention(thread, bases, log, stores=None):
+    """
+    รอการลบใน background ให้เสร็จ แล้ว prune chunk store ของทุก base ที่มี (ครั้งเดียวต่อรอบ)
+    เรียกหลังการคัดลอกทั้งหมดเสร็จแล้วเท่านั้น (chunk ของไฟล์ที่กำลังคัดลอกยังไม่อยู่ใน manifest ใด)
+    stores: {base: ChunkStore} ที่เปิดอยู่แล้ว
+    """
+    thread.join()
+    for base in bases:
+        if not os.path.isdir(os.path.join(base, STORE_DIR_NAME)):
+            continue
+        try:
+            stats = prune_store(base, (stores or {}).get(base))
+        except Exception as e:
+            log(f"[ERROR] prune chunk store ใน {base} ไม่สำเร็จ (จะลองใหม่รอบหน้า): {e}")
+            continue
+        if stats["chunks_removed"] or stats["bytes_freed"]:
+            log(f"🧹 prune chunk store {base}: ลบ {stats['chunks_removed']} chunk, ลบ {stats['packs_removed']} pack, "
+                f"เขียนใหม่ {stats['packs_rewritten']} pack, คืนพื้นที่ {stats['bytes_freed'] / 1024 / 1024:.1f} MB")
+
+
+def policy_from_config(config, max_age_days):
+    return {
+        "keep_last": config.getint("Retention", "keep_last", fallback=1),
+        "keep_daily": config.getint("Retention", "keep_daily", fallback=0),
+        "keep_weekly": config.getint("Retention", "keep_weekly", fallback=0),
+        "keep_monthly": config.getint("Retention", "keep_monthly", fallback=0),
+        "max_age_days": max_age_days,
+    }
@@ -0,0 +1,150 @@
+import os
+import queue
+import threading
+
+# ตัวสแกนโฟลเดอร์แบบ iterative บน os.scandir
+# ใช้ข้อมูล stat ที่ DirEntry แคชไว้แล้ว (บน Windows ได้มาจากการ list โฟลเดอร์เลย)
+# จึงไม่ต้องเรียก islink/isdir/exists แยกทีละไฟล์ผ่าน SMB และไม่มีข้อจำกัดความลึกแบบ recursion
+# workers > 1: หลาย thread ช่วยกัน list โฟลเดอร์จากคิวงานกลาง (โฟลเดอร์ย่อยที่เจอระหว่างทางก็เข้าคิวด้วย)
+# แล้วรวมผลกลับเป็น stream เดียว ต้นไม้ใหญ่ก้อนเดียวจึงไม่ติดอยู่ที่ latency ของ thread เดียว
+# prescan (ดู prescan.py) ใช้ผลจากดัชนีแทนการ list โฟลเดอร์ที่ไม่เปลี่ยนตั้งแต่รอบก่อน
+# file_filter (ดู filters.py) ตัดรายการที่ไม่เอาออกตั้งแต่ตอน list โฟลเดอร์ที่ถูกตัดจะไม่ถูกเดินลงไป
+
+OUTPUT_QUEUE_SIZE = 256  # จำนวนโฟลเดอร์ที่ list แล้วแต่ผู้ใช้ยังไม่ได้ดึงไป
+
+
+def _is_link(entry):
+    if entry.is_symlink():
+        return True
+    is_junction = getattr(entry, "is_junction", None)  # Python 3.12+
+    return bool(is_junction and is_junction())
+
+
+def list_dir(root, rel_dir, on_error=None, on_skip=None, file_filter=None):
+    """list โฟลเดอร์เดียว คืน (รายการ [(rel_path, stat, is_dir)], โฟลเดอร์ย่อย)"""
+    path = os.path.join(root, rel_dir) if rel_dir else root
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError as e:
+        if on_error:
+            on_error(path, e)
+        return [], []
+
+    items = []
+    subdirs = []
+    for entry in entries:
+        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+        try:
+            if _is_link(entry):
+                if on_skip:
+                    on_skip(entry.path)
+                continue
+            is_dir = entry.is_dir(follow_symlinks=False)
+            st = entry.stat(follow_symlinks=False)
+        except OSError as e:
+            if on_error:
+                on_error(entry.path, e)
+            continue
+
+        if file_filter is not None and file_filter.excluded(rel_path, st, is_dir):
+            continue
+        items.append((rel_path, st, is_dir))
+        if is_dir:
+            subdirs.append(rel_path)
+    return items, subdirs
+
+
+def list_level(root, rel_dir, dir_stat, on_error, on_skip, prescan, file_filter=None):
+    # คืน (รายการ, [(rel_path, stat) ของโฟลเดอร์ย่อย]) stat ของโฟลเดอร์ใช้เช็ค prescan ตอนลงไปถึง
+    if prescan is not None:
+        return prescan.list_dir(rel_dir, dir_stat, on_error, on_skip, file_filter)
+    items, _ = list_dir(root, rel_dir, on_error, on_skip, file_filter)
+    return items, [(rel_path, st) for rel_path, st, is_dir in items if is_dir]
+
+
+def scan_tree(root, on_error=None, on_skip=None, workers=1, prescan=None, file_filter=None):
+    """
+    เดินทั้งต้นไม้ใต้ root แล้ว yield (rel_path, stat_result, is_dir) ทีละรายการ
+    โฟลเดอร์จะถูก yield ก่อนไฟล์ที่อยู่ข้างในเสมอ
+    on_error(path, exc) ถูกเรียกเมื่อ list โฟลเดอร์ไม่ได้, on_skip(path) เมื่อเจอ symlink
+    workers > 1 จะ list หลายโฟลเดอร์พร้อมกัน (callback อาจถูกเรียกจาก thread อื่น)
+    prescan: Prescan ของไดรฟ์นี้ หรือ None (list ทุกโฟลเดอร์)
+    file_filter: FileFilter ของไดรฟ์นี้ หรือ None (เอาทุกรายการ)
+    """
+    root_stat = prescan.root_stat() if prescan is not None else None
+    if workers > 1:
+        yield from _scan_parallel(root, on_error, on_skip, workers, prescan, root_stat, file_filter)
+        return
+
+    stack = [("", root_stat)]
+    while stack:
+        rel_dir, dir_stat = stack.pop()
+        items, subdirs = list_level(root, rel_dir, dir_stat, on_error, on_skip, prescan, file_filter)
+        yield from items
+        # ใส่กลับแบบย้อนลำดับ เพื่อให้ลงไปตามลำดับเดิมของ listdir
+        stack.extend(reversed(subdirs))
+
+
+def _scan_parallel(root, on_error, on_skip, workers, prescan=None, root_stat=None, file_filter=None):
+    # คิวงานแบบ LIFO: thread ที่ว่างหยิบโฟลเดอร์ล่าสุดที่เพิ่งเจอ (เดินลึกก่อน คิวไม่บวม)
+    # ผลของแต่ละโฟลเดอร์ถูกส่งเข้าคิวผลลัพธ์ "ก่อน" โฟลเดอร์ย่อยจะเข้าคิวงาน
+    # โฟลเดอร์จึงออกจาก stream ก่อนเนื้อหาข้างในเสมอ
+    work = queue.LifoQueue()
+    results = queue.Queue(maxsize=OUTPUT_QUEUE_SIZE)
+    stop = threading.Event()
+    lock = threading.Lock()
+    outstanding = [1]
+    done = object()
+
+    def put_result(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        while not stop.is_set():
+            try:
+                task = work.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if task is None:
+                return
+            rel_dir, dir_stat = task
+            try:
+                items, subdirs = list_level(root, rel_dir, dir_stat, on_error, on_skip, prescan, file_filter)
+            except Exception as e:  # callback พัง: ไม่ให้ทั้งการสแกนค้าง
+                items, subdirs = [], []
+                if on_error:
+                    on_error(os.path.join(root, rel_dir), e)
+            if items and not put_result(items):
+                return
+            with lock:
+                outstanding[0] += len(subdirs) - 1
+                finished = outstanding[0] == 0
+            for subdir in reversed(subdirs):
+                work.put(subdir)
+            if finished:
+                put_result(done)
+
+    work.put(("", root_stat))
+    threads = [threading.Thread(target=worker, name=f"scanner-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            items = results.get()
+            if items is done:
+                break
+            yield from items
+    finally:
+        # จบปกติหรือผู้ใช้เลิกดึงกลางทาง: หยุดทุก thread
+        stop.set()
+        for _ in threads:
+            work.put(None)
+        for t in threads:
+            t.join()
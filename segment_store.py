@@ -0,0 +1,389 @@
+import gzip
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tarfile
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# รูปแบบปลายทางแบบ segments (destination_format = segments)
+# - ไฟล์เล็กกว่า small_file_kb ถูกต่อกันเป็น tar ใน segment ละประมาณ segment_size_mb (บีบอัด zstd หรือ gzip)
+#   ที่ {snapshot}/.segments/ แทนการสร้างไฟล์ทีละไฟล์บนปลายทาง ไฟล์ใหญ่ยังเก็บเป็นไฟล์ปกติเหมือน tree
+# - ดัชนีต่อ snapshot (.segments/index.sqlite) บอกว่าไฟล์ไหนอยู่ใน segment ไหน ดึงไฟล์เดียวได้โดยไม่ต้องกู้ทั้งหมด
+# - ไฟล์เล็กที่ไม่เปลี่ยน: hard-link ทั้ง segment จาก snapshot ก่อนหน้ามาแล้วชี้ดัชนีไปที่ segment นั้น
+#   segment ที่ลากต่อมาแต่เหลือไฟล์ที่ยังใช้อยู่น้อยกว่า MIN_LIVE_RATIO จะถูกแพ็กใหม่ตอนจบรอบ
+# - segment ที่กำลังเขียนชื่อลงท้าย .partial และ rename เมื่อปิดแล้วเท่านั้น (รอบที่ค้างทิ้งได้ทันที)
+#
+# การใช้งาน:
+#   python segment_store.py list <snapshot_dir>
+#   python segment_store.py extract <snapshot_dir> <path> <output_file>
+#   python segment_store.py restore <snapshot_dir> <target_dir>
+
+SEGMENT_DIR_NAME = ".segments"
+BACKUP_FILES = (SEGMENT_DIR_NAME,)  # ไฟล์ของ backup เองในระดับบนของ snapshot (manifest ของ hash อยู่ข้าง snapshot)
+INDEX_NAME = "index.sqlite"
+EXTENSIONS = {"zstd": ".tar.zst", "gzip": ".tar.gz", "none": ".tar"}
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+MIN_LIVE_RATIO = 0.5
+COMMIT_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    path TEXT PRIMARY KEY,
+    segment TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    mode INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    name TEXT PRIMARY KEY,
+    members INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+)
+"""
+
+
+def available_compression(name):
+    """ชื่อวิธีบีบอัดที่ใช้ได้จริง (zstd ต้องมี package zstandard ไม่มีก็ใช้ gzip)"""
+    name = (name or "zstd").strip().lower()
+    if name not in EXTENSIONS:
+        return "gzip"
+    if name == "zstd" and zstandard is None:
+        return "gzip"
+    return name
+
+
+def _compression_of(segment_name):
+    for name in ("zstd", "gzip", "none"):  # .tar ต้องเช็คหลังสุด
+        if segment_name.endswith(EXTENSIONS[name]):
+            return name
+    raise ValueError(f"ไม่รู้จักรูปแบบ segment: {segment_name}")
+
+
+def _open_writer(raw, compression):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False)
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=GZIP_LEVEL)
+    return None
+
+
+def _open_reader(raw, compression):
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("ต้องติดตั้ง zstandard เพื่ออ่าน segment แบบ .tar.zst")
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    return raw
+
+
+def iter_segment(segment_path):
+    """yield (TarInfo, ข้อมูล) ของทุกไฟล์ใน segment ตามลำดับที่เขียน"""
+    with open(segment_path, "rb") as raw:
+        stream = _open_reader(raw, _compression_of(os.path.basename(segment_path)))
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for info in tar:
+                if info.isfile():
+                    yield info, tar.extractfile(info).read()
+
+
+def segment_dir_for(snapshot_path):
+    return os.path.join(snapshot_path, SEGMENT_DIR_NAME)
+
+
+class SegmentIndex:
+    """อ่านดัชนีของ snapshot (ใช้กับ snapshot ก่อนหน้า) path ใช้ / เป็นตัวคั่น"""
+
+    def __init__(self, snapshot_path):
+        self.root = segment_dir_for(snapshot_path)
+        self.lock = threading.Lock()
+        self.conn = None
+        path = os.path.join(self.root, INDEX_NAME)
+        if os.path.exists(path):
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def get(self, rel_path):
+        """(segment, size, mtime_ns, mode) หรือ None"""
+        if self.conn is None:
+            return None
+        with self.lock:
+            return self.conn.execute(
+                "SELECT segment, size, mtime_ns, mode FROM members WHERE path = ?", (rel_path.replace(os.sep, "/"),)
+            ).fetchone()
+
+    def segment_info(self, name):
+        with self.lock:
+            return self.conn.execute("SELECT members, bytes FROM segments WHERE name = ?", (name,)).fetchone()
+
+    def members(self):
+        if self.conn is None:
+            return []
+        with self.lock:
+            return self.conn.execute("SELECT path, segment, size, mtime_ns, mode FROM members ORDER BY path").fetchall()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class SegmentWriter:
+    """
+    เขียนไฟล์เล็กของ snapshot ลง segment
+    on_committed([(rel_path, s_stat), ...]) ถูกเรียกเมื่อไฟล์เหล่านั้นอยู่ใน segment ที่ปิดแล้วและดัชนี commit แล้ว
+    """
+
+    def __init__(self, snapshot_path, compression="zstd", segment_size=64 * 1024 * 1024, on_committed=None):
+        self.root = segment_dir_for(snapshot_path)
+        os.makedirs(self.root, exist_ok=True)
+        self.prefix = os.path.basename(snapshot_path.rstrip("/\\"))  # ชื่อ segment ไม่ซ้ำข้าม snapshot
+        self.compression = available_compression(compression)
+        self.segment_size = segment_size
+        self.on_committed = on_committed
+        self.lock = threading.Lock()
+        for name in os.listdir(self.root):
+            if name.endswith(".partial"):  # segment ที่เขียนค้างจากรอบที่ถูกขัดจังหวะ
+                os.remove(os.path.join(self.root, name))
+        self.conn = sqlite3.connect(os.path.join(self.root, INDEX_NAME), check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        existing = [name for name in os.listdir(self.root) if name.startswith(self.prefix + "-")]
+        self.seq = len(existing)
+        self.linked = {row[0] for row in self.conn.execute("SELECT name FROM segments")} | set(existing)
+        self.raw = self.stream = self.tar = None
+        self.name = None
+        self.written = 0
+        self.in_segment = []  # ไฟล์ใน segment ที่ยังเปิดอยู่
+        self.uncommitted = []  # ไฟล์จาก segment เดิมที่ยังไม่ได้ commit
+
+    def _open_segment(self):
+        self.seq += 1
+        self.name = f"{self.prefix}-{self.seq:06d}{EXTENSIONS[self.compression]}"
+        self.raw = open(os.path.join(self.root, self.name + ".partial"), "wb")
+        self.stream = _open_writer(self.raw, self.compression)
+        self.tar = tarfile.open(fileobj=self.stream or self.raw, mode="w|", format=tarfile.PAX_FORMAT)
+        self.written = 0
+
+    def add(self, rel_path, s_stat, data):
+        name = rel_path.replace(os.sep, "/")
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = s_stat.st_mtime
+        info.mode = s_stat.st_mode & 0o7777
+        with self.lock:
+            if self.tar is None:
+                self._open_segment()
+            self.tar.addfile(info, io.BytesIO(data))
+            self.in_segment.append((name, s_stat, info.mode))
+            self.written += tarfile.BLOCKSIZE + len(data)
+            if self.written >= self.segment_size:
+                self._seal_locked()
+
+    def _seal_locked(self):
+        if self.tar is None:
+            return
+        self.tar.close()
+        if self.stream is not None:
+            self.stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        self.raw.close()
+        path = os.path.join(self.root, self.name)
+        os.replace(path + ".partial", path)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO members (path, segment, size, mtime_ns, mode) VALUES (?, ?, ?, ?, ?)",
+            [(name, self.name, st.st_size, st.st_mtime_ns, mode) for name, st, mode in self.in_segment],
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO segments (name, members, bytes) VALUES (?, ?, ?)",
+            (self.name, len(self.in_segment), sum(st.st_size for _, st, _ in self.in_segment)),
+        )
+        self.uncommitted.extend((name, st) for name, st, _ in self.in_segment)
+        self.in_segment = []
+        self.raw = self.stream = self.tar = None
+        self._commit_locked()
+
+    def _commit_locked(self):
+        self.conn.commit()
+        done, self.uncommitted = self.uncommitted, []
+        if self.on_committed and done:
+            self.on_committed([(name.replace("/", os.sep), st) for name, st in done])
+
+    def link_previous(self, rel_path, s_stat, previous, row):
+        """ใช้ไฟล์จาก segment ของ snapshot ก่อนหน้า (row จาก SegmentIndex.get) โดย hard-link ทั้ง segment"""
+        segment, size, mtime_ns, mode = row
+        name = rel_path.replace(os.sep, "/")
+        with self.lock:
+            if segment not in self.linked:
+                src = os.path.join(previous.root, segment)
+                dst = os.path.join(self.root, segment)
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    shutil.copy2(src, dst)  # ปลายทางไม่รองรับ hard link
+                info = previous.segment_info(segment) or (0, 0)
+                self.conn.execute("INSERT OR REPLACE INTO segments (name, members, bytes) VALUES (?, ?, ?)",
+                                  (segment, info[0], info[1]))
+                self.linked.add(segment)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO members (path, segment, size, mtime_ns, mode) VALUES (?, ?, ?, ?, ?)",
+                (name, segment, size, mtime_ns, mode),
+            )
+            self.uncommitted.append((name, s_stat))
+            if len(self.uncommitted) >= COMMIT_EVERY:
+                self._commit_locked()
+
+    def _compact_locked(self):
+        # segment ที่ลากมาจาก snapshot ก่อน ถ้าไฟล์ที่ยังใช้อยู่เหลือน้อย แพ็กเฉพาะไฟล์เหล่านั้นใหม่ แล้วเลิกอ้างถึง
+        repacked = 0
+        rows = self.conn.execute("SELECT name, bytes FROM segments").fetchall()
+        for name, total in rows:
+            if name.startswith(self.prefix + "-"):
+                continue
+            live = self.conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM members WHERE segment = ?",
+                                     (name,)).fetchone()
+            if live[1] and total and live[0] >= total * MIN_LIVE_RATIO:
+                continue
+            wanted = {row[0]: row for row in self.conn.execute(
+                "SELECT path, size, mtime_ns, mode FROM members WHERE segment = ?", (name,))}
+            if wanted:
+                for info, data in iter_segment(os.path.join(self.root, name)):
+                    row = wanted.get(info.name)
+                    if row is None:
+                        continue
+                    if self.tar is None:
+                        self._open_segment()
+                    info.mode = row[3]
+                    self.tar.addfile(info, io.BytesIO(data))
+                    self.in_segment.append((info.name, _StoredStat(row[1], row[2]), row[3]))
+                    self.written += tarfile.BLOCKSIZE + len(data)
+                    if self.written >= self.segment_size:
+                        self._seal_locked()
+                self._seal_locked()
+            self.conn.execute("DELETE FROM segments WHERE name = ?", (name,))
+            self.conn.commit()
+            os.remove(os.path.join(self.root, name))
+            repacked += 1
+        return repacked
+
+    def close(self, finished=True):
+        """ปิด segment ที่เปิดอยู่และ commit ดัชนี finished=True แพ็ก segment เก่าที่เหลือไฟล์ใช้อยู่น้อยด้วย"""
+        with self.lock:
+            self._seal_locked()
+            self._commit_locked()
+            repacked = self._compact_locked() if finished else 0
+            self.conn.close()
+        return repacked
+
+
+class _StoredStat:
+    """stat เท่าที่ดัชนี segment ต้องใช้ ตอนแพ็กไฟล์จาก segment เดิม"""
+
+    def __init__(self, size, mtime_ns):
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+
+
+class SegmentSink:
+    """ปลายทางแบบ stream สำหรับ copy_engine.copy_file: เก็บเนื้อไฟล์เล็กไว้ในหน่วยความจำก่อนส่งเข้า segment"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        self.buffer = io.BytesIO()
+
+    @property
+    def data(self):
+        return self.buffer.getvalue()
+
+
+def extract_file(snapshot_path, rel_path, output_path):
+    """ดึงไฟล์เดียวจาก snapshot (ไฟล์ใหญ่ที่เก็บเป็นไฟล์ปกติก็คัดลอกให้)"""
+    name = rel_path.replace(os.sep, "/").strip("/")
+    plain = os.path.join(snapshot_path, *name.split("/"))
+    if os.path.isfile(plain):
+        shutil.copy2(plain, output_path)
+        return
+    index = SegmentIndex(snapshot_path)
+    try:
+        row = index.get(name)
+    finally:
+        index.close()
+    if row is None:
+        raise FileNotFoundError(f"ไม่พบ {rel_path} ใน {snapshot_path}")
+    for info, data in iter_segment(os.path.join(segment_dir_for(snapshot_path), row[0])):
+        if info.name == name:
+            with open(output_path, "wb") as out:
+                out.write(data)
+            os.utime(output_path, ns=(row[2], row[2]))
+            os.chmod(output_path, row[3])
+            return
+    raise FileNotFoundError(f"segment {row[0]} ไม่มี {rel_path}")
+
+
+def restore_snapshot(snapshot_path, target_dir):
+    """สร้างต้นไม้ของ snapshot กลับขึ้นมาที่ target_dir (ไฟล์ปกติ + ไฟล์ใน segment) คืนจำนวนไฟล์"""
+    restored = 0
+    for dirpath, dirnames, filenames in os.walk(snapshot_path):
+        top = dirpath == snapshot_path
+        dirnames[:] = [d for d in dirnames if not (top and d in BACKUP_FILES)]
+        out_dir = os.path.join(target_dir, os.path.relpath(dirpath, snapshot_path))
+        os.makedirs(out_dir, exist_ok=True)
+        for name in filenames:
+            if top and name in BACKUP_FILES:
+                continue
+            shutil.copy2(os.path.join(dirpath, name), os.path.join(out_dir, name))
+            restored += 1
+
+    index = SegmentIndex(snapshot_path)
+    try:
+        by_segment = {}
+        for path, segment, size, mtime_ns, mode in index.members():
+            by_segment.setdefault(segment, {})[path] = (mtime_ns, mode)
+    finally:
+        index.close()
+    for segment, wanted in sorted(by_segment.items()):
+        for info, data in iter_segment(os.path.join(segment_dir_for(snapshot_path), segment)):
+            meta = wanted.get(info.name)
+            if meta is None:
+                continue
+            out_path = os.path.join(target_dir, *info.name.split("/"))
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with open(out_path, "wb") as out:
+                out.write(data)
+            os.utime(out_path, ns=(meta[0], meta[0]))
+            os.chmod(out_path, meta[1])
+            restored += 1
+    return restored
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "list":
+        index = SegmentIndex(sys.argv[2])
+        for path, segment, size, mtime_ns, mode in index.members():
+            print(f"{path}\t{size}\t{segment}")
+        index.close()
+    elif len(sys.argv) == 5 and sys.argv[1] == "extract":
+        extract_file(sys.argv[2], sys.argv[3], sys.argv[4])
+        print(f"✅ ดึง {sys.argv[3]} ไปที่ {sys.argv[4]}")
+    elif len(sys.argv) == 4 and sys.argv[1] == "restore":
+        count = restore_snapshot(sys.argv[2], sys.argv[3])
+        print(f"✅ กู้คืน {count} ไฟล์จาก {sys.argv[2]} ไปที่ {sys.argv[3]}")
+    else:
+        print("usage: segment_store.py list <snapshot_dir> | extract <snapshot_dir> <path> <output_file>"
+              " | restore <snapshot_dir> <target_dir>")
+        sys.exit(1)
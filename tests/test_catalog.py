@@ -0,0 +1,131 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalog import Catalog, CatalogWriter, catalog_path_for, snapshot_name
+
+
+def write_snapshot(base, name, files):
+    """สร้างโฟลเดอร์ snapshot (name คั่นด้วย / ได้) และ catalog จาก {rel_path: (size, mtime_ns)} คืนชื่อใน catalog"""
+    snapshot_dir = os.path.join(base, *name.split("/"))
+    os.makedirs(snapshot_dir)
+    writer = CatalogWriter(base, snapshot_name(base, snapshot_dir))
+    for rel_path, (size, mtime_ns) in files.items():
+        writer.add(rel_path, SimpleNamespace(st_size=size, st_mtime_ns=mtime_ns), None)
+    writer.close()
+    return writer.snapshot
+
+
+class NestedSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write_sync_query(self):
+        # mapped_drives = Y:/, F:/ → snapshot ซ้อนหนึ่งชั้น และสองไดรฟ์เริ่มในวินาทีเดียวกัน
+        y = write_snapshot(self.base, "Y/_2026-01-01_01-00-00", {"a.txt": (1, 10)})
+        f = write_snapshot(self.base, "F/_2026-01-01_01-00-00", {"b.txt": (2, 20)})
+        self.assertEqual(y, "Y/_2026-01-01_01-00-00")
+        self.assertTrue(os.path.isfile(catalog_path_for(self.base, y)))
+        self.assertTrue(os.path.isfile(catalog_path_for(self.base, f)))
+
+        catalog = Catalog(self.base)
+        try:
+            self.assertEqual(catalog.sync(), (0, 0))
+            self.assertEqual([row[:2] for row in catalog.snapshots()], [(f, "F"), (y, "Y")])
+            self.assertEqual([row[0] for row in catalog.snapshots("Y:/")], [y])
+            self.assertEqual([row[0] for row in catalog.versions("a.txt")], [y])
+            self.assertEqual([row[2] for row in catalog.find("*.txt", drive="F:\\")], ["b.txt"])
+
+            os.rmdir(os.path.join(self.base, "Y", "_2026-01-01_01-00-00"))  # retention ลบไปแล้ว
+            self.assertEqual(catalog.sync(), (0, 1))
+            self.assertEqual([row[0] for row in catalog.snapshots()], [f])
+            self.assertFalse(os.path.exists(catalog_path_for(self.base, y)))
+        finally:
+            catalog.close()
+
+    def test_sync_imports_nested_catalog(self):
+        name = write_snapshot(self.base, "Y/_2026-01-01_01-00-00", {"a.txt": (1, 10)})
+        os.remove(os.path.join(self.base, ".catalog", "catalog.sqlite"))
+        catalog = Catalog(self.base)
+        try:
+            self.assertEqual(catalog.sync(), (1, 0))
+            self.assertEqual(catalog.snapshots()[0][:2], (name, "Y"))
+        finally:
+            catalog.close()
+
+
+
+class QueryTest(unittest.TestCase):
+    layout = "{drive}_{stamp}"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+        name = lambda drive, stamp: self.layout.format(drive=drive, stamp=stamp)
+        self.jan1 = write_snapshot(self.base, name("Y", "2026-01-01_01-00-00"), {
+            "docs/a.xlsx": (1, 10), "docs/b.xlsx": (2, 20), "old.txt": (3, 30)})
+        self.jan2 = write_snapshot(self.base, name("Y", "2026-01-02_01-00-00"), {
+            "docs/a.xlsx": (1, 10), "docs/b.xlsx": (5, 50), "new.txt": (4, 40)})
+        self.jan3 = write_snapshot(self.base, name("Y", "2026-01-03_01-00-00"), {
+            "docs/a.xlsx": (6, 60), "docs/b.xlsx": (5, 50), "new.txt": (4, 40)})
+        self.other = write_snapshot(self.base, name("F", "2026-01-02_01-00-00"), {"docs/c.xlsx": (7, 70)})
+        self.catalog = Catalog(self.base)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tmp.cleanup()
+
+    def test_versions(self):
+        rows = self.catalog.versions("docs\\a.xlsx")
+        self.assertEqual([(row[0], row[2], row[3]) for row in rows],
+                         [(self.jan1, 1, 10), (self.jan2, 1, 10), (self.jan3, 6, 60)])
+        self.assertEqual(self.catalog.versions("missing.txt"), [])
+
+    def test_find_glob_in_date_range(self):
+        rows = self.catalog.find("docs/*.XLSX", since="2026-01-02", until="2026-01-02")
+        self.assertEqual([(row[0], row[2]) for row in rows],
+                         [(self.jan2, "docs/a.xlsx"), (self.jan2, "docs/b.xlsx"), (self.other, "docs/c.xlsx")])
+        rows = self.catalog.find("*.txt", since="2026-01-02", drive="Y")
+        self.assertEqual([(row[0], row[2]) for row in rows], [(self.jan2, "new.txt"), (self.jan3, "new.txt")])
+
+    def test_diff(self):
+        self.assertEqual(self.catalog.diff(self.jan1, self.jan2),
+                         {"added": ["new.txt"], "removed": ["old.txt"], "changed": ["docs/b.xlsx"]})
+        self.assertEqual(self.catalog.diff(self.jan2, self.jan3),
+                         {"added": [], "removed": [], "changed": ["docs/a.xlsx"]})
+        with self.assertRaises(KeyError):
+            self.catalog.diff(self.jan1, "Y_2025-01-01_01-00-00")
+
+
+    def test_cli(self):
+        def run(*args):
+            result = subprocess.run([sys.executable, os.path.join(ROOT, "catalog.py"), self.base, *args],
+                                    capture_output=True, text=True, encoding="utf-8")
+            self.assertEqual(result.returncode, 0, result.stderr)
+            return result.stdout.splitlines()
+
+        self.assertEqual([line.split("\t")[0] for line in run("list", "--drive", "Y:/")],
+                         [self.jan1, self.jan2, self.jan3])
+        self.assertEqual(run("diff", self.jan1, self.jan2)[:3], ["+ new.txt", "- old.txt", "~ docs/b.xlsx"])
+        self.assertEqual([line.split("\t")[:2] for line in run("find", "*.txt", "--until", "2026-01-01")],
+                         [[self.jan1, "old.txt"]])
+
+class NestedQueryTest(QueryTest):
+    layout = "{drive}/_{stamp}"
+
+    def test_names_accept_native_separator(self):
+        self.assertEqual(self.catalog.diff(self.jan1.replace("/", "\\"), self.jan2)["added"], ["new.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
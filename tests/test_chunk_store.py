@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chunk_store
+from chunk_store import ChunkSink, ChunkStore, ManifestWriter, prune_store, restore_snapshot
+
+
+def pack_bytes(base):
+    packs = os.path.join(base, chunk_store.STORE_DIR_NAME, "packs")
+    return sum(os.path.getsize(os.path.join(packs, name)) for name in os.listdir(packs))
+
+
+def write_snapshot(base, name, files, finished=True):
+    """สร้าง snapshot แบบ chunks จาก {rel_path: bytes} คืน path ของ snapshot"""
+    snapshot = os.path.join(base, name)
+    src = os.path.join(os.path.dirname(base), "src-" + name)
+    os.makedirs(src)
+    store = ChunkStore(base)
+    manifest = ManifestWriter(snapshot)
+    for rel_path, data in files.items():
+        path = os.path.join(src, rel_path)
+        with open(path, "wb") as f:
+            f.write(data)
+        sink = ChunkSink(store)
+        sink.write(data)
+        sink.close()
+        manifest.add_file(rel_path, os.stat(path), sink.chunk_ids)
+    store.close()
+    manifest.close(finished)
+    return snapshot
+
+
+class PruneTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = os.path.join(self.tmp.name, "dst")
+        os.makedirs(self.base)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pack_bytes_drop_after_oldest_snapshot_expires(self):
+        shared = os.urandom(1024 * 1024)
+        old = write_snapshot(self.base, "Y_2026-01-01_01-00-00", {"a.bin": os.urandom(4 * 1024 * 1024), "s.bin": shared})
+        new = write_snapshot(self.base, "Y_2026-01-02_01-00-00", {"s.bin": shared})
+        before = pack_bytes(self.base)
+
+        os.remove(chunk_store.manifest_path_for(old))
+        stats = prune_store(self.base)
+
+        self.assertGreater(stats["chunks_removed"], 0)
+        self.assertLess(pack_bytes(self.base), before / 2)
+        restored = os.path.join(self.tmp.name, "restore")
+        self.assertEqual(restore_snapshot(self.base, os.path.basename(new), restored), 1)
+        with open(os.path.join(restored, "s.bin"), "rb") as f:
+            self.assertEqual(f.read(), shared)
+
+    def test_partial_manifest_keeps_chunks(self):
+        data = os.urandom(2 * 1024 * 1024)
+        write_snapshot(self.base, "Y_2026-01-01_01-00-00", {"a.bin": data}, finished=False)
+        before = pack_bytes(self.base)
+
+        stats = prune_store(self.base)
+
+        self.assertEqual(stats["chunks_removed"], 0)
+        self.assertEqual(pack_bytes(self.base), before)
+
+    def test_empty_pack_is_removed(self):
+        old_size = chunk_store.PACK_SIZE
+        chunk_store.PACK_SIZE = 1  # ทุก chunk ขึ้น pack ใหม่
+        try:
+            old = write_snapshot(self.base, "Y_2026-01-01_01-00-00", {"a.bin": os.urandom(1024 * 1024)})
+            write_snapshot(self.base, "Y_2026-01-02_01-00-00", {"b.bin": os.urandom(1024 * 1024)})
+            os.remove(chunk_store.manifest_path_for(old))
+            stats = prune_store(self.base)
+        finally:
+            chunk_store.PACK_SIZE = old_size
+        self.assertGreater(stats["packs_removed"], 0)
+        self.assertEqual(stats["packs_rewritten"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
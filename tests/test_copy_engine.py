@@ -0,0 +1,114 @@
+import hashlib
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import copy_engine
+
+MB = 1024 * 1024
+
+
+class ShrinkingSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, "src.bin")
+        with open(self.src, "wb") as f:
+            f.write(os.urandom(4 * MB))
+        self.s_stat = os.stat(self.src)
+        self.saved = (copy_engine.LARGE_FILE_THRESHOLD, copy_engine.CHUNK_SIZE,
+                      copy_engine.CHUNK_THREADS, copy_engine.BUFFER_SIZE)
+        copy_engine.configure(large_file_threshold=64 * MB, chunk_size=MB, chunk_threads=2, buffer_size=MB)
+
+    def tearDown(self):
+        threshold, chunk_size, threads, buffer_size = self.saved
+        copy_engine.configure(threshold, chunk_size, threads, buffer_size)
+        self.tmp.cleanup()
+
+    def truncate_once(self):
+        """throttle callback ที่ตัดไฟล์ต้นทางเหลือ 1.5 MB หลังอ่านได้ครั้งแรก"""
+        state = {"done": False}
+
+        def throttle(nbytes):
+            if not state["done"]:
+                state["done"] = True
+                os.truncate(self.src, 3 * MB // 2)
+        return throttle
+
+    def copy(self, count=1, hasher=None):
+        d_paths = [os.path.join(self.tmp.name, f"dst{i}.tmp") for i in range(count)]
+        errors = copy_engine.copy_file(self.src, self.s_stat, d_paths, self.truncate_once(), hasher)
+        return d_paths, errors
+
+    def assert_failed(self, d_paths, errors):
+        for d_path in d_paths:
+            self.assertIsInstance(errors[d_path], EOFError)
+            self.assertIn(self.src, str(errors[d_path]))
+            self.assertFalse(os.path.exists(d_path))
+
+    def test_single_destination(self):
+        self.assert_failed(*self.copy())
+
+    def test_fanout_with_hash(self):
+        self.assert_failed(*self.copy(count=2, hasher=copy_engine.ContentHasher()))
+
+    def test_chunked(self):
+        copy_engine.configure(large_file_threshold=2 * MB)
+        self.assert_failed(*self.copy())
+
+    def test_unchanged_source_copies(self):
+        d_path = os.path.join(self.tmp.name, "dst.tmp")
+        errors = copy_engine.copy_file(self.src, self.s_stat, [d_path])
+        self.assertIsNone(errors[d_path])
+        with open(self.src, "rb") as a, open(d_path, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+
+
+class HashOnCopyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, "src.bin")
+        self.data = os.urandom(3 * MB)
+        with open(self.src, "wb") as f:
+            f.write(self.data)
+        self.s_stat = os.stat(self.src)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def copy(self, count, zero_copy_min=None):
+        hasher = copy_engine.ContentHasher(zero_copy_min)
+        d_paths = [os.path.join(self.tmp.name, f"dst{i}.tmp") for i in range(count)]
+        errors = copy_engine.copy_file(self.src, self.s_stat, d_paths, hasher=hasher)
+        self.assertTrue(all(error is None for error in errors.values()))
+        for d_path in d_paths:
+            with open(d_path, "rb") as f:
+                self.assertEqual(f.read(), self.data)
+        return hasher.hexdigest()
+
+    def test_single_destination_is_hashed(self):
+        self.assertEqual(self.copy(1), "sha256:" + hashlib.sha256(self.data).hexdigest())
+
+    def test_chunked_single_destination_is_hashed(self):
+        saved = copy_engine.LARGE_FILE_THRESHOLD, copy_engine.CHUNK_SIZE
+        copy_engine.configure(large_file_threshold=MB, chunk_size=MB)
+        try:
+            self.assertTrue(self.copy(1).startswith(f"sha256-c{MB}:"))
+        finally:
+            copy_engine.configure(*saved)
+
+    @unittest.skipUnless(copy_engine.HAS_COPY_FILE_RANGE or copy_engine.HAS_SENDFILE, "ไม่มี zero-copy")
+    def test_fast_mode_keeps_zero_copy_for_large_files(self):
+        self.assertIsNone(self.copy(1, zero_copy_min=2 * MB))
+
+    def test_fast_mode_hashes_small_files(self):
+        self.assertEqual(self.copy(1, zero_copy_min=4 * MB), "sha256:" + hashlib.sha256(self.data).hexdigest())
+
+    def test_fanout_hashes_buffered_data(self):
+        self.assertEqual(self.copy(2, zero_copy_min=0), "sha256:" + hashlib.sha256(self.data).hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
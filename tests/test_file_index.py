@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_index import FileIndex, index_total_bytes
+from prescan import IndexedStat
+
+
+class SweepTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "Y.sqlite")
+        index = FileIndex(self.db)
+        for name, size in (("a", 10), ("b", 20), ("c", 30)):
+            index.record(name, IndexedStat(size, 1, 0))
+        index.record_dir("", 1, 3, "x", "[]")
+        index.record_dir("gone", 1, 0, "y", "[]")
+        index.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sweep_drops_files_not_seen(self):
+        index = FileIndex(self.db)
+        index.seen("a")
+        index.record("c", IndexedStat(31, 2, 0))
+        self.assertEqual(index.sweep(), (1, 0))
+        index.close()
+        self.assertEqual(index_total_bytes(self.db), 41)
+
+    def test_sweep_drops_dirs_only_when_tracked(self):
+        index = FileIndex(self.db)
+        index.seen_dir("")
+        self.assertEqual(index.sweep(), (3, 1))
+        self.assertIsNotNone(index.get_dir(""))
+        self.assertIsNone(index.get_dir("gone"))
+        index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import configparser
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scanner
+from filters import FileFilter, drive_key, drive_option
+
+
+def make_config(text):
+    config = configparser.ConfigParser()
+    config.read_string(text)
+    return config
+
+
+class DriveKeyTest(unittest.TestCase):
+    def test_drive_forms_match(self):
+        for drive in ("Y:/", "Y:\\", "Y:", "Y/", "y"):
+            self.assertEqual(drive_key(drive), "y", drive)
+        self.assertEqual(drive_key("\\\\nas1\\share"), "nas1/share")
+        self.assertEqual(drive_key("//NAS1/share/"), "nas1/share")
+
+    def test_drive_option(self):
+        config = make_config("[Watch]\nmethod = auto\nmethod@Y = poll\n")
+        self.assertEqual(drive_option(config, "Watch", "method", "Y:/"), "poll")
+        self.assertEqual(drive_option(config, "Watch", "method", "y:\\"), "poll")
+        self.assertEqual(drive_option(config, "Watch", "method", "F:/"), "auto")
+        self.assertEqual(drive_option(make_config(""), "Watch", "method", "Y:/", fallback="auto"), "auto")
+
+
+class PerDriveFilterTest(unittest.TestCase):
+    config = make_config("[Filters]\nexclude_glob = *.tmp\nexclude_glob@Y = *.bak\nmax_size_mb@src = 1\n")
+
+    def test_rules_apply_to_matching_drive(self):
+        for drive in ("Y:/", "Y:\\", "Y:", "Y/"):
+            rules = FileFilter.from_config(self.config, drive).rules
+            self.assertEqual(rules["exclude_glob"], ["*.tmp", "*.bak"], drive)
+            self.assertEqual(rules["max_size_mb"], 0)
+
+    def test_rules_skip_other_drives(self):
+        self.assertEqual(FileFilter.from_config(self.config, "F:/").rules["exclude_glob"], ["*.tmp"])
+        self.assertEqual(FileFilter.from_config(self.config, "src/").rules["max_size_mb"], 1)
+
+
+class ScanFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "src")
+        for rel_path in ("a.txt", "sub/b.tmp", "sub/c.txt", "node_modules/x/y.js", "keep/node_modules.txt"):
+            path = os.path.join(self.root, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write("x")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def scan(self, workers):
+        config = make_config("[Filters]\nexclude_dirs@src = node_modules\nexclude_glob@src = *.tmp\n")
+        file_filter = FileFilter.from_config(config, "src/")
+        listed = []
+        real_scandir = os.scandir
+
+        def scandir(path):
+            listed.append(os.path.relpath(path, self.root))
+            return real_scandir(path)
+
+        with mock.patch.object(scanner.os, "scandir", scandir):
+            found = {rel_path.replace(os.sep, "/") for rel_path, _, is_dir in scanner.scan_tree(
+                self.root, workers=workers, file_filter=file_filter) if not is_dir}
+        return found, listed, file_filter
+
+    def test_excluded_files_and_pruned_dirs(self):
+        for workers in (1, 4):
+            found, listed, file_filter = self.scan(workers)
+            self.assertEqual(found, {"a.txt", "sub/c.txt", "keep/node_modules.txt"})
+            self.assertFalse(any(path.startswith("node_modules") for path in listed), listed)
+            self.assertEqual(file_filter.skipped_dirs, 1)
+            self.assertEqual(file_filter.skipped_files, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
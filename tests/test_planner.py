@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from planner import PlanEntries, compare_with_previous, iter_plan_entries
+from prescan import IndexedStat
+
+
+class PlanEntriesTest(unittest.TestCase):
+    def test_streams_entries_and_sorts_files_on_disk(self):
+        names = ["b/z.txt", "a.txt", "b/ก.txt", "B.txt", "b/a.txt"]
+        with tempfile.TemporaryDirectory() as tmp:
+            entries = PlanEntries(os.path.join(tmp, "Y.entries.jsonl.gz"))
+            entries.add("b", None, True)
+            for i, name in enumerate(names):
+                entries.add(name.replace("/", os.sep), IndexedStat(i + 1, i, 0), False)
+            self.assertEqual([f[0] for f in entries.sorted_files()], sorted(names))
+            self.assertEqual((entries.files, entries.bytes, entries.dirs), (5, 15, 1))
+
+            previous = [("a.txt", 2, 1), ("b/a.txt", 9, 4), ("gone.txt", 7, 0)]
+            counts = compare_with_previous(entries.sorted_files(), previous, 0)
+            entries.close()
+            self.assertEqual((counts["new_files"], counts["changed_files"], counts["unchanged_files"],
+                              counts["deleted_files"]), (3, 1, 1, 1))
+            self.assertEqual(len(list(iter_plan_entries(entries.path))), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
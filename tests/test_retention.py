@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retention import finish_retention, start_retention
+from test_chunk_store import pack_bytes, write_snapshot
+
+
+class ChunkRetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = os.path.join(self.tmp.name, "dst")
+        os.makedirs(self.base)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_expired_chunk_snapshot_frees_pack_bytes(self):
+        write_snapshot(self.base, "Y_2026-01-01_01-00-00", {"a.bin": os.urandom(4 * 1024 * 1024)})
+        write_snapshot(self.base, "Y_2026-01-02_01-00-00", {"b.bin": os.urandom(1024 * 1024)})
+        before = pack_bytes(self.base)
+        logs = []
+
+        thread = start_retention([self.base], {"keep_last": 1, "max_age_days": 0}, logs.append)
+        finish_retention(thread, [self.base], logs.append)
+
+        self.assertLess(pack_bytes(self.base), before / 2)
+        self.assertTrue(any(line.startswith("🧹") for line in logs), logs)
+        self.assertFalse(any("[ERROR]" in line for line in logs), logs)
+
+
+class SidecarTest(unittest.TestCase):
+    def test_hash_manifest_is_deleted_with_snapshot(self):
+        with tempfile.TemporaryDirectory() as base:
+            for stamp in ("2026-01-01_01-00-00", "2026-01-02_01-00-00"):
+                os.makedirs(os.path.join(base, f"Y_{stamp}"))
+                with open(os.path.join(base, f"Y_{stamp}.hashes.jsonl"), "w") as f:
+                    f.write("{}\n")
+            logs = []
+            start_retention([base], {"keep_last": 1, "max_age_days": 0}, logs.append).join()
+            self.assertEqual(sorted(os.listdir(base)), ["Y_2026-01-02_01-00-00", "Y_2026-01-02_01-00-00.hashes.jsonl"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import throttle
+from throttle import Throttle, TokenBucket, parse_rate, parse_schedule, rate_at
+
+MB = 1024 * 1024
+NIGHT_AND_DAY = "01:00-06:00=0, 06:00-01:00=20MB"
+
+
+def at(hour, minute):
+    return datetime(2026, 1, 1, hour, minute)
+
+
+class ScheduleTest(unittest.TestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("20MB"), 20 * MB)
+        self.assertEqual(parse_rate("512 kb/s"), 512 * 1024)
+        self.assertEqual(parse_rate("200"), 200)
+        self.assertEqual(parse_rate("unlimited"), 0)
+        with self.assertRaises(ValueError):
+            parse_rate("fast")
+
+    def test_window_boundaries(self):
+        schedule = parse_schedule(NIGHT_AND_DAY)
+        self.assertEqual(schedule, [(60, 360, 0), (360, 60, 20 * MB)])
+        self.assertEqual(rate_at(schedule, at(0, 59)), 20 * MB)  # ช่วงที่ข้ามเที่ยงคืน
+        self.assertEqual(rate_at(schedule, at(1, 0)), 0)
+        self.assertEqual(rate_at(schedule, at(5, 59)), 0)
+        self.assertEqual(rate_at(schedule, at(6, 0)), 20 * MB)
+        self.assertEqual(rate_at(schedule, at(23, 59)), 20 * MB)
+
+    def test_uncovered_time_is_unlimited(self):
+        schedule = parse_schedule("08:00-18:00=200")
+        self.assertEqual(rate_at(schedule, at(7, 59)), 0)
+        self.assertEqual(rate_at(schedule, at(12, 0)), 200)
+        self.assertEqual(rate_at(parse_schedule("5MB"), at(3, 0)), 5 * MB)
+        with self.assertRaises(ValueError):
+            parse_schedule("8-18=200")
+
+
+class TokenBucketTest(unittest.TestCase):
+    def acquire(self, bucket, amount):
+        with mock.patch.object(throttle.time, "sleep") as sleep:
+            bucket.acquire(amount)
+        return sleep.call_args[0][0] if sleep.called else 0
+
+    def test_burst_then_wait_for_debt(self):
+        bucket = TokenBucket(1000)
+        self.assertEqual(self.acquire(bucket, 1000), 0)
+        self.assertAlmostEqual(self.acquire(bucket, 500), 0.5, delta=0.05)
+        # หนี้ยังค้าง: ผู้ขอรายถัดไปรอทั้งหนี้เดิมและส่วนของตัวเอง
+        self.assertAlmostEqual(self.acquire(bucket, 500), 1.0, delta=0.05)
+
+    def test_unlimited_and_rate_change(self):
+        bucket = TokenBucket(0)
+        self.assertEqual(self.acquire(bucket, 10 ** 12), 0)
+        bucket.set_rate(100)  # เริ่มเต็ม bucket เหมือน bucket ใหม่
+        self.assertEqual(self.acquire(bucket, 100), 0)
+        self.assertAlmostEqual(self.acquire(bucket, 100), 1.0, delta=0.05)
+        bucket.set_rate(50)
+        self.assertAlmostEqual(self.acquire(bucket, 50), 3.0, delta=0.1)  # หนี้เดิม 100 ที่ 50/วินาที
+        bucket.set_rate(0)
+        self.assertEqual(self.acquire(bucket, 10 ** 12), 0)
+
+
+class ThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmp.name, "config.ini")
+        self.now = at(5, 59)
+        self.refresh = mock.patch.object(throttle, "REFRESH_EVERY", 0)
+        self.refresh.start()
+
+    def tearDown(self):
+        self.refresh.stop()
+        self.tmp.cleanup()
+
+    def write_config(self, text, mtime):
+        with open(self.config_path, "w", encoding="utf-8") as f:
+            f.write("[Throttle]\n" + text)
+        os.utime(self.config_path, (mtime, mtime))  # เวลาแก้ไขต่างจากครั้งก่อนแน่นอน
+
+    def make(self):
+        return Throttle(self.config_path, clock=lambda: self.now)
+
+    def source_rate(self, limiter, key="nas1"):
+        limiter.charge_bytes(key, ["d"], 0)
+        return limiter.buckets[("source_bytes_per_sec", key)].rate
+
+    def test_rate_follows_window_during_run(self):
+        self.write_config(f"source_bytes_per_sec = {NIGHT_AND_DAY}\n", 1000)
+        limiter = self.make()
+        self.assertEqual(self.source_rate(limiter), 0)
+        self.now = at(6, 0)
+        self.assertEqual(self.source_rate(limiter), 20 * MB)
+        self.now = at(1, 0)
+        self.assertEqual(self.source_rate(limiter), 0)
+        self.assertEqual(limiter.describe(), "source_bytes_per_sec=unlimited")
+
+    def test_per_share_override(self):
+        self.write_config("source_bytes_per_sec = 20MB\nsource_bytes_per_sec@nas1 = 10MB\n", 1000)
+        limiter = self.make()
+        self.assertEqual(self.source_rate(limiter, "nas1"), 10 * MB)
+        self.assertEqual(self.source_rate(limiter, "nas2"), 20 * MB)
+
+    def test_config_change_is_picked_up_without_restart(self):
+        self.write_config("source_bytes_per_sec = 10MB\n", 1000)
+        limiter = self.make()
+        self.assertEqual(self.source_rate(limiter), 10 * MB)
+        self.write_config("source_bytes_per_sec = 5MB\ndestination_bytes_per_sec = 1MB\n", 2000)
+        self.assertEqual(self.source_rate(limiter), 5 * MB)
+        self.assertEqual(limiter.buckets[("destination_bytes_per_sec", "d")].rate, 1 * MB)
+
+    def test_limits_added_after_start_are_enabled(self):
+        self.write_config("", 1000)
+        limiter = self.make()
+        self.assertFalse(limiter.enabled())
+        self.write_config("source_ops_per_sec = 200\n", 2000)
+        self.assertTrue(limiter.enabled())
+
+    def test_invalid_value_is_reported_and_unlimited(self):
+        self.write_config("source_bytes_per_sec = soon=1MB\n", 1000)
+        errors = []
+        limiter = Throttle(self.config_path, on_error=errors.append, clock=lambda: self.now)
+        self.assertFalse(limiter.enabled())
+        self.assertEqual(len(errors), 1)
+        self.assertIn("[WARN]", errors[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
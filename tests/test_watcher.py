@@ -0,0 +1,28 @@
+import configparser
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from watcher import methods_from_config
+
+
+class MethodsFromConfigTest(unittest.TestCase):
+    def methods(self, text, roots):
+        config = configparser.ConfigParser()
+        config.read_string(text)
+        return methods_from_config(config, roots)
+
+    def test_per_drive_method_matches_mapped_drive(self):
+        methods = self.methods("[Watch]\nmethod = auto\nmethod@Y = Poll\nmethod@nas1/share = poll\n",
+                               ["Y:/", "F:/", "\\\\nas1\\share"])
+        self.assertEqual(methods, {"Y:/": "poll", "F:/": "auto", "\\\\nas1\\share": "poll"})
+
+    def test_default_method(self):
+        self.assertEqual(self.methods("[Watch]\nmethod = poll\n", ["Y:\\"]), {"Y:\\": "poll"})
+        self.assertEqual(self.methods("", ["Y:/"]), {"Y:/": "auto"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+import configparser
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+# จำกัดความเร็วด้วย token bucket ทั้งไบต์/วินาที และจำนวนไฟล์ (ops)/วินาที
+# แยก bucket ต่อ share ต้นทาง และต่อดิสก์ปลายทาง ตั้งช่วงเวลาได้ใน [Throttle] ของ config.ini เช่น
+#   source_bytes_per_sec = 01:00-06:00=0, 06:00-01:00=20MB
+# (0 = ไม่จำกัด, ช่วงเวลาที่ไม่ได้ระบุ = ไม่จำกัด) และตั้งเฉพาะ share ได้ด้วย key@share เช่น
+#   source_bytes_per_sec@nas1 = 06:00-01:00=10MB
+# อัตราถูกคำนวณใหม่ทุก REFRESH_EVERY วินาที และอ่าน config.ini ใหม่เมื่อไฟล์ถูกแก้ไข ระหว่างงานที่กำลังรันอยู่
+
+KINDS = ["source_bytes_per_sec", "source_ops_per_sec", "destination_bytes_per_sec", "destination_ops_per_sec"]
+UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2, "g": 1024 ** 3, "gb": 1024 ** 3}
+REFRESH_EVERY = 10
+WINDOW_RE = re.compile(r"^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$")
+
+
+def parse_rate(text):
+    """'20MB' → 20971520, '0' / 'unlimited' / '' → 0 (ไม่จำกัด)"""
+    text = text.strip().lower().replace("/s", "")
+    if text in ("", "unlimited", "none"):
+        return 0
+    m = re.match(r"^([\d.]+)\s*([a-z]*)$", text)
+    if not m or m.group(2) not in UNITS:
+        raise ValueError(f"อัตราไม่ถูกต้อง: {text}")
+    return int(float(m.group(1)) * UNITS[m.group(2)])
+
+
+def parse_schedule(text):
+    """'01:00-06:00=0, 06:00-01:00=20MB' → [(นาทีเริ่ม, นาทีจบ, อัตรา), ...] ค่าที่ไม่มีช่วงเวลา = ทั้งวัน"""
+    schedule = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "=" in part:
+            window, rate = part.split("=", 1)
+            m = WINDOW_RE.match(window.strip())
+            if not m:
+                raise ValueError(f"ช่วงเวลาไม่ถูกต้อง: {window}")
+            h1, m1, h2, m2 = (int(g) for g in m.groups())
+            schedule.append((h1 * 60 + m1, h2 * 60 + m2, parse_rate(rate)))
+        else:
+            schedule.append((0, 24 * 60, parse_rate(part)))
+    return schedule
+
+
+def rate_at(schedule, now=None):
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    for start, end, rate in schedule:
+        inside = start <= minute < end if start < end else (minute >= start or minute < end)  # ข้ามเที่ยงคืน
+        if inside:
+            return rate
+    return 0
+
+
+class TokenBucket:
+    """bucket ที่ยอมให้ติดหนี้: งานใหญ่กว่า burst ผ่านได้ แต่ผู้ขอรายถัดไปต้องรอจนคืนหนี้หมด"""
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            if rate != self.rate:
+                if self.rate <= 0:
+                    # จากไม่จำกัด (เช่นข้ามช่วงเวลา) เริ่มเต็ม bucket เหมือน bucket ใหม่
+                    self.tokens = rate
+                    self.last = time.monotonic()
+                else:
+                    self.tokens = min(self.tokens, rate)
+                self.rate = rate
+
+    def acquire(self, amount):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Throttle:
+    def __init__(self, config_path="config.ini", section="Throttle", on_error=None, clock=datetime.now):
+        self.config_path = config_path
+        self.section = section
+        self.on_error = on_error
+        self.clock = clock  # เวลาที่ใช้เลือกช่วงของอัตรา
+        self.lock = threading.Lock()
+        self.schedules = {kind: {} for kind in KINDS}  # kind → {share key หรือ None (ค่าเริ่มต้น): schedule}
+        self.buckets = {}  # (kind, key) → TokenBucket
+        self.config_mtime = None
+        self.last_refresh = 0.0
+        self.reload()
+
+    def reload(self):
+        config = configparser.ConfigParser()
+        config.read(self.config_path, encoding="utf-8")
+        schedules = {kind: {} for kind in KINDS}
+        if config.has_section(self.section):
+            for option, value in config.items(self.section):
+                kind, _, share = option.partition("@")
+                if kind not in schedules:
+                    continue
+                try:
+                    schedules[kind][share or None] = parse_schedule(value)
+                except ValueError as e:
+                    if self.on_error:
+                        self.on_error(f"[WARN] [{self.section}] {option}: {e} (ไม่จำกัด)")
+        with self.lock:
+            self.schedules = schedules
+        try:
+            self.config_mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            self.config_mtime = None
+        self._apply_rates()
+
+    def enabled(self):
+        # เช็ค config ก่อน: เพิ่มค่าใน [Throttle] ระหว่างรันได้แม้ตอนเริ่มจะไม่ได้จำกัดอะไร
+        self._refresh()
+        return any(self.schedules[kind] for kind in KINDS)
+
+    def _rate_for(self, kind, key, now=None):
+        schedules = self.schedules[kind]
+        schedule = schedules.get(key, schedules.get(None))
+        return rate_at(schedule, now or self.clock()) if schedule else 0
+
+    def _apply_rates(self):
+        now = self.clock()
+        with self.lock:
+            buckets = list(self.buckets.items())
+        for (kind, key), bucket in buckets:
+            bucket.set_rate(self._rate_for(kind, key, now))
+        self.last_refresh = time.monotonic()
+
+    def _refresh(self):
+        # เช็คเวลาและไฟล์ config เป็นระยะ ไม่ใช่ทุกครั้งที่เรียก
+        if time.monotonic() - self.last_refresh < REFRESH_EVERY:
+            return
+        self.last_refresh = time.monotonic()
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            mtime = self.config_mtime
+        if mtime != self.config_mtime:
+            self.reload()
+        else:
+            self._apply_rates()
+
+    def _bucket(self, kind, key):
+        bucket = self.buckets.get((kind, key))
+        if bucket is None:
+            with self.lock:
+                bucket = self.buckets.get((kind, key))
+                if bucket is None:
+                    bucket = self.buckets[(kind, key)] = TokenBucket(self._rate_for(kind, key))
+        return bucket
+
+    def _charge(self, kind_prefix, source_key, destination_keys, amount):
+        self._refresh()
+        self._bucket(f"source_{kind_prefix}", source_key).acquire(amount)
+        for key in destination_keys:
+            self._bucket(f"destination_{kind_prefix}", key).acquire(amount)
+
+    def charge_bytes(self, source_key, destination_keys, nbytes):
+        self._charge("bytes_per_sec", source_key, destination_keys, nbytes)
+
+    def charge_ops(self, source_key, destination_keys, count=1):
+        self._charge("ops_per_sec", source_key, destination_keys, count)
+
+    def describe(self, now=None):
+        """อัตราที่ใช้อยู่ตอนนี้ของค่าที่ตั้งไว้ทั้งหมด (สำหรับ log)"""
+        parts = []
+        now = now or self.clock()
+        for kind in KINDS:
+            for key in self.schedules[kind]:
+                rate = rate_at(self.schedules[kind][key], now)
+                name = f"{kind}@{key}" if key else kind
+                parts.append(f"{name}={rate or 'unlimited'}")
+        return ", ".join(parts) or "unlimited"
@@ -0,0 +1,223 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from chunk_store import MANIFEST_SUFFIX, STORE_DIR_NAME, load_manifest
+from copy_engine import hash_stream
+from journal import trim_torn_tail
+from retention import find_snapshots
+from segment_store import SEGMENT_DIR_NAME, SegmentIndex, iter_segment
+
+# manifest ของ hash ต่อ snapshot และคำสั่งตรวจ snapshot เทียบกับ manifest
+# - hash คำนวณระหว่างคัดลอก (copy_engine.ContentHasher) ไฟล์ที่ hard-link จากรอบก่อนใช้ hash ในดัชนี
+# - manifest อยู่ข้าง snapshot ที่ {snapshot}.hashes.jsonl (JSON lines: path, size, hash) เขียนเป็น .partial ก่อน
+#   ไม่อยู่ใน snapshot เอง จึงไม่ชนกับไฟล์ชื่อเดียวกันของต้นทางและไม่ติดไปตอนกู้คืน (retention ลบคู่กับ snapshot)
+#   hash_mode = all ทุกไฟล์มี hash, fast: ไฟล์ใหญ่ที่คัดลอกแบบ zero-copy ไม่มี hash ตรวจแค่ขนาด (นับแยกในผลตรวจ)
+# - ตรวจด้วย process pool กระจายทุก core: ไฟล์ปกติทีละไฟล์, segment ทีละ segment, chunk store ทีละ packfile
+#
+# การใช้งาน:
+#   python verify.py <destination_base> [snapshot ...] [--workers N]
+
+HASH_MANIFEST_SUFFIX = ".hashes.jsonl"
+LEGACY_HASH_MANIFEST_NAME = ".hashes.jsonl"  # ตำแหน่งเดิมใน snapshot (ยังอ่านได้)
+BATCH_FILES = 64
+
+
+def hash_manifest_path_for(snapshot_path):
+    return snapshot_path + HASH_MANIFEST_SUFFIX
+
+
+def _existing_hash_manifest(snapshot_path):
+    for path in (hash_manifest_path_for(snapshot_path), os.path.join(snapshot_path, LEGACY_HASH_MANIFEST_NAME)):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class HashManifest:
+    """เขียน manifest ของ hash ลง .partial ก่อน แล้ว rename เมื่อสำรองเสร็จ (แบบเดียวกับ ManifestWriter)"""
+
+    def __init__(self, snapshot_path):
+        self.path = hash_manifest_path_for(snapshot_path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        trim_torn_tail(self.path + ".partial")
+        # line buffered: บรรทัดต้องถึงไฟล์ก่อน journal บันทึกว่าไฟล์เสร็จ (รอบที่ทำต่อจะข้ามไฟล์นั้น)
+        self.f = open(self.path + ".partial", "a", encoding="utf-8", buffering=1)
+
+    def add(self, rel_path, size, digest):
+        line = json.dumps({"path": rel_path.replace(os.sep, "/"), "size": size, "hash": digest}, ensure_ascii=False)
+        with self.lock:
+            self.f.write(line + "\n")
+
+    def close(self, finished=True):
+        with self.lock:
+            self.f.close()
+        if finished:
+            os.replace(self.path + ".partial", self.path)
+
+
+def load_hash_manifest(snapshot_path):
+    entries = {}
+    path = _existing_hash_manifest(snapshot_path)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                entries[entry["path"]] = entry  # บรรทัดหลังทับบรรทัดก่อน (รอบที่ทำต่อ)
+    return entries
+
+
+def _verify_files(snapshot_path, entries):
+    # ทำงานใน process ลูก: คืน [(path, ปัญหา)]
+    problems = []
+    for entry in entries:
+        path = os.path.join(snapshot_path, *entry["path"].split("/"))
+        try:
+            if os.path.getsize(path) != entry["size"]:
+                problems.append((entry["path"], "ขนาดไม่ตรง"))
+                continue
+            if entry.get("hash"):
+                with open(path, "rb") as f:
+                    if hash_stream(f, entry["hash"]) != entry["hash"]:
+                        problems.append((entry["path"], "hash ไม่ตรง"))
+        except OSError as e:
+            problems.append((entry["path"], str(e)))
+    return problems
+
+
+def _verify_segment(segment_path, entries):
+    wanted = {entry["path"]: entry for entry in entries}
+    problems = []
+    try:
+        for info, data in iter_segment(segment_path):
+            entry = wanted.pop(info.name, None)
+            if entry is None:
+                continue
+            if len(data) != entry["size"]:
+                problems.append((entry["path"], "ขนาดไม่ตรง"))
+            elif entry.get("hash") and hash_stream(io.BytesIO(data), entry["hash"]) != entry["hash"]:
+                problems.append((entry["path"], "hash ไม่ตรง"))
+    except Exception as e:
+        problems.append((os.path.basename(segment_path), f"อ่าน segment ไม่ได้: {e}"))
+    problems.extend((path, "ไม่พบใน segment") for path in wanted)
+    return problems
+
+
+def _verify_pack(pack_path, chunks):
+    problems = []
+    try:
+        with open(pack_path, "rb") as f:
+            for digest, offset, length in sorted(chunks, key=lambda c: c[1]):
+                f.seek(offset)
+                if hashlib.sha256(f.read(length)).hexdigest() != digest:
+                    problems.append((f"chunk {digest[:16]}", "hash ไม่ตรง"))
+    except OSError as e:
+        problems.append((os.path.basename(pack_path), str(e)))
+    return problems
+
+
+def _plan_snapshot(destination_base, snapshot):
+    """แยกงานตรวจของ snapshot เดียวเป็นก้อน ๆ [(ฟังก์ชัน, args)] และจำนวนไฟล์ที่ไม่มี hash"""
+    snapshot_path = os.path.join(destination_base, snapshot)
+    tasks = []
+    if snapshot.endswith(MANIFEST_SUFFIX) or os.path.exists(snapshot_path + MANIFEST_SUFFIX):
+        # chunk store: ตรวจทุก chunk ที่ snapshot อ้างถึง จัดกลุ่มตาม packfile
+        base = snapshot_path[:-len(MANIFEST_SUFFIX)] if snapshot.endswith(MANIFEST_SUFFIX) else snapshot_path
+        manifest = load_manifest(base + MANIFEST_SUFFIX)
+        digests = {d for entry in manifest.values() if not entry.get("dir") for d in entry["chunks"]}
+        store_root = os.path.join(destination_base, STORE_DIR_NAME)
+        conn = sqlite3.connect(os.path.join(store_root, "chunks.sqlite"))
+        by_pack = {}
+        try:
+            for digest in digests:
+                row = conn.execute("SELECT pack, offset, length FROM chunks WHERE hash = ?", (digest,)).fetchone()
+                if row is None:
+                    tasks.append((_report, ([(f"chunk {digest[:16]}", "ไม่พบใน store")],)))
+                    continue
+                by_pack.setdefault(row[0], []).append((digest, row[1], row[2]))
+        finally:
+            conn.close()
+        for pack_no, chunks in by_pack.items():
+            tasks.append((_verify_pack, (os.path.join(store_root, "packs", f"pack-{pack_no:06d}.pack"), chunks)))
+        return tasks, 0
+
+    manifest = load_hash_manifest(snapshot_path)
+    if not manifest:
+        return [(_report, ([(snapshot, f"ไม่พบ {os.path.basename(hash_manifest_path_for(snapshot))}")],))], 0
+    index = SegmentIndex(snapshot_path)
+    plain = []
+    by_segment = {}
+    try:
+        for path, entry in manifest.items():
+            row = index.get(path)
+            if row is not None:
+                by_segment.setdefault(row[0], []).append(entry)
+            else:
+                plain.append(entry)
+    finally:
+        index.close()
+    for i in range(0, len(plain), BATCH_FILES):
+        tasks.append((_verify_files, (snapshot_path, plain[i:i + BATCH_FILES])))
+    for segment, entries in by_segment.items():
+        tasks.append((_verify_segment, (os.path.join(snapshot_path, SEGMENT_DIR_NAME, segment), entries)))
+    return tasks, sum(1 for entry in manifest.values() if not entry.get("hash"))
+
+
+def _report(problems):
+    return problems
+
+
+def list_verifiable(destination_base):
+    """snapshot ใต้ destination_base ที่มี manifest ให้ตรวจ (ชื่อสัมพัทธ์กับ destination_base)"""
+    snapshots = []
+    for snap in find_snapshots(destination_base):
+        path = snap["path"]
+        if path.endswith(MANIFEST_SUFFIX) or _existing_hash_manifest(path):
+            snapshots.append(os.path.relpath(path, destination_base))
+    return sorted(snapshots)
+
+
+def verify_snapshots(destination_base, snapshots=None, workers=None):
+    """ตรวจ snapshot คืน {snapshot: (ปัญหา [(path, ข้อความ)], จำนวนไฟล์ที่ไม่มี hash)}"""
+    snapshots = snapshots or list_verifiable(destination_base)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {}
+        for snapshot in snapshots:
+            tasks, unhashed = _plan_snapshot(destination_base, snapshot)
+            results[snapshot] = ([], unhashed)
+            futures[snapshot] = [pool.submit(func, *args) for func, args in tasks]
+        for snapshot, fs in futures.items():
+            for future in fs:
+                try:
+                    results[snapshot][0].extend(future.result())
+                except Exception as e:
+                    results[snapshot][0].append((snapshot, f"ตรวจไม่สำเร็จ: {e}"))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ตรวจ snapshot เทียบกับ manifest ของ hash")
+    parser.add_argument("destination_base")
+    parser.add_argument("snapshots", nargs="*", help="ชื่อ snapshot (ไม่ระบุ = ทุก snapshot ที่ตรวจได้)")
+    parser.add_argument("--workers", type=int, default=0, help="จำนวน process (0 = เท่าจำนวน core)")
+    args = parser.parse_args()
+
+    failed = False
+    for snapshot, (problems, unhashed) in verify_snapshots(args.destination_base, args.snapshots, args.workers).items():
+        note = f" (ไม่มี hash {unhashed} ไฟล์ ตรวจแค่ขนาด)" if unhashed else ""
+        if problems:
+            failed = True
+            print(f"❌ {snapshot}: พบปัญหา {len(problems)} รายการ{note}")
+            for path, message in problems:
+                print(f"   {path}: {message}")
+        else:
+            print(f"✅ {snapshot}: ถูกต้อง{note}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,302 @@
+import itertools
+import math
+import os
+import stat
+import threading
+import time
+
+from filters import drive_option
+from scanner import list_dir
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # ไม่มี watchdog → ใช้การ poll อย่างเดียว
+    FileSystemEventHandler = object
+    Observer = None
+
+# โหมดต่อเนื่อง (python V5.py --watch หรือ [Watch] enabled = true): ทยอยคัดลอกไฟล์ที่เปลี่ยนระหว่างวัน
+# เข้า snapshot ของรอบกลางคืนถัดไป รอบกลางคืนจึงเหลือแค่เก็บส่วนที่เหลือและปิด snapshot
+# - method = auto: ใช้การแจ้งเตือนของระบบผ่าน watchdog (ReadDirectoryChangesW/inotify) ถ้าติดตั้งไว้และเปิดได้
+#   method = poll: stat โฟลเดอร์ที่รู้จักทยอยให้ครบทุก sweep_minutes แล้ว list ใหม่เฉพาะโฟลเดอร์ที่ mtime เปลี่ยน
+#   โฟลเดอร์ที่เพิ่งเปลี่ยน (ภายใน hot_minutes) list ซ้ำทุก poll_seconds เทียบกับผลครั้งก่อน
+#   (ไฟล์ที่ถูกแก้ทับที่เดิมไม่ทำให้ mtime ของโฟลเดอร์เปลี่ยน)
+#   share ที่ mount ผ่านเครือข่ายบางชนิดไม่ส่งการแจ้งเตือนของการแก้จากเครื่องอื่น ให้ตั้ง method@ไดรฟ์ = poll
+# - path ที่เปลี่ยนเข้าคิวที่รวมรายการซ้ำ และรอจนไม่เปลี่ยนแล้ว settle_seconds ก่อนคัดลอก
+# - ไฟล์ที่ถูกลบหรือหลุดรอดการตรวจ รอบกลางคืนจัดการตามปกติ
+
+DISPATCH_SECONDS = 1.0
+BATCH_SIZE = 500
+
+
+def methods_from_config(config, roots, section="Watch"):
+    """{root: "auto" | "poll"} จาก method และ method@ไดรฟ์ (@Y ตรงกับ Y:/ เหมือนตัวกรอง)"""
+    return {root: drive_option(config, section, "method", root, fallback="auto").strip().lower() for root in roots}
+
+
+def walk(root, rel_dir, file_filter=None):
+    """เดินต้นไม้ใต้ rel_dir แล้ว yield (rel_path, stat, is_dir) (เหมือน scanner.scan_tree แต่เริ่มจากโฟลเดอร์ย่อยได้)"""
+    stack = [rel_dir]
+    while stack:
+        items, subdirs = list_dir(root, stack.pop(), file_filter=file_filter)
+        yield from items
+        stack.extend(subdirs)
+
+
+def in_excluded_dir(file_filter, rel_dir):
+    """True ถ้าโฟลเดอร์ใดโฟลเดอร์หนึ่งใน path ถูกตัดด้วย exclude_dirs (การเดินปกติจะไม่ลงไปถึงเลย)"""
+    parts = rel_dir.split(os.sep) if rel_dir else []
+    return any(file_filter.excluded(os.sep.join(parts[:i + 1]), None, True) for i in range(len(parts)))
+
+
+class ChangeQueue:
+    """path ที่เปลี่ยน (path ซ้ำเหลือรายการเดียว) เรียงตามเวลาที่เห็นการเปลี่ยนครั้งล่าสุด"""
+
+    def __init__(self, settle_seconds=10):
+        self.settle_seconds = settle_seconds
+        self.lock = threading.Lock()
+        self.items = {}
+
+    def put(self, root, rel_path):
+        key = (root, rel_path)
+        with self.lock:
+            self.items.pop(key, None)  # เปลี่ยนอีก → ย้ายไปท้ายคิว นับเวลารอใหม่
+            self.items[key] = time.monotonic()
+
+    def ready(self, limit=BATCH_SIZE):
+        """ดึง path ที่ไม่เปลี่ยนแล้วอย่างน้อย settle_seconds ออกจากคิว คืน {root: [rel_path, ...]}"""
+        cutoff = time.monotonic() - self.settle_seconds
+        batch = {}
+        with self.lock:
+            for key, seen in list(itertools.islice(self.items.items(), limit)):
+                if seen > cutoff:
+                    break
+                del self.items[key]
+                batch.setdefault(key[0], []).append(key[1])
+        return batch
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+
+class DirPoller:
+    """หาไฟล์ที่เปลี่ยนใต้ root ด้วยการ stat โฟลเดอร์ (ต้นทางที่ไม่มีการแจ้งเตือน)"""
+
+    def __init__(self, root, on_change, file_filter=None, poll_seconds=60, sweep_seconds=900, hot_seconds=1800):
+        self.root = root
+        self.on_change = on_change
+        self.file_filter = file_filter
+        self.poll_seconds = poll_seconds
+        self.sweep_seconds = max(poll_seconds, sweep_seconds)
+        self.hot_seconds = hot_seconds
+        self.dirs = {}  # rel_dir -> mtime_ns ที่เห็นล่าสุด
+        self.hot = {}  # rel_dir -> (เวลาที่เปลี่ยนล่าสุด, {rel_path: (size, mtime_ns)} ของไฟล์ข้างใน)
+        self.pending_sweep = []
+
+    def _path(self, rel_dir):
+        return os.path.join(self.root, rel_dir) if rel_dir else self.root
+
+    def _walk(self, rel_dir, mtime_ns, report):
+        # mtime ของโฟลเดอร์จำไว้ก่อน list เสมอ การเปลี่ยนระหว่าง list จึงถูกเห็นในรอบถัดไป
+        self.dirs[rel_dir] = mtime_ns
+        for rel_path, st, is_dir in walk(self.root, rel_dir, self.file_filter):
+            if is_dir:
+                self.dirs[rel_path] = st.st_mtime_ns
+            elif report:
+                self.on_change(rel_path)
+
+    def prime(self):
+        """จำ mtime ของทุกโฟลเดอร์ตอนเริ่ม (ยังไม่นับว่ามีไฟล์เปลี่ยน)"""
+        self._walk("", os.stat(self.root).st_mtime_ns, report=False)
+
+    def _forget(self, rel_dir):
+        prefix = rel_dir + os.sep
+        for table in (self.dirs, self.hot):
+            for key in [k for k in table if k == rel_dir or k.startswith(prefix)]:
+                del table[key]
+
+    def _check(self, rel_dir, force=False):
+        try:
+            mtime_ns = os.stat(self._path(rel_dir)).st_mtime_ns
+        except OSError:
+            self._forget(rel_dir)  # ถูกลบหรือย้ายไป (ชื่อใหม่จะถูกเห็นจากโฟลเดอร์แม่)
+            return
+        if not force and mtime_ns == self.dirs.get(rel_dir):
+            return
+        self.dirs[rel_dir] = mtime_ns
+        items, _ = list_dir(self.root, rel_dir, file_filter=self.file_filter)
+        seen, previous = self.hot.get(rel_dir, (time.monotonic(), None))
+        listing = {}
+        changed = previous is None
+        for rel_path, st, is_dir in items:
+            if is_dir:
+                if rel_path not in self.dirs:
+                    self._walk(rel_path, st.st_mtime_ns, report=True)  # โฟลเดอร์ใหม่หรือย้ายเข้ามา
+                    changed = True
+                continue
+            listing[rel_path] = (st.st_size, st.st_mtime_ns)
+            # ยังไม่มีผล list ครั้งก่อน: ส่งทุกไฟล์ ผู้คัดลอกเช็คกับดัชนีเองว่าไฟล์ไหนเปลี่ยนจริง
+            if previous is None or previous.get(rel_path) != listing[rel_path]:
+                self.on_change(rel_path)
+                changed = True
+        self.hot[rel_dir] = (time.monotonic() if changed else seen, listing)
+
+    def poll(self):
+        now = time.monotonic()
+        for rel_dir in list(self.hot):
+            if rel_dir not in self.hot:  # ถูก _forget ไประหว่างรอบนี้
+                continue
+            if now - self.hot[rel_dir][0] > self.hot_seconds:
+                del self.hot[rel_dir]
+            else:
+                self._check(rel_dir, force=True)
+        # โฟลเดอร์อื่นทยอย stat ทีละส่วน ให้ครบทุกโฟลเดอร์ภายใน sweep_seconds
+        if not self.pending_sweep:
+            self.pending_sweep = list(self.dirs)
+        count = max(1, math.ceil(len(self.dirs) * self.poll_seconds / self.sweep_seconds))
+        batch, self.pending_sweep = self.pending_sweep[-count:], self.pending_sweep[:-count]
+        for rel_dir in batch:
+            if rel_dir in self.dirs and rel_dir not in self.hot:
+                self._check(rel_dir)
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, root, on_change):
+        super().__init__()
+        self.root = root
+        self.on_change = on_change
+
+    def on_any_event(self, event):
+        if event.event_type not in ("created", "modified", "moved", "closed"):
+            return
+        if event.is_directory and event.event_type == "modified":
+            return  # บอกแค่ว่ามีรายการข้างในเปลี่ยน รายการนั้นมี event ของตัวเองอยู่แล้ว
+        path = getattr(event, "dest_path", "") or event.src_path
+        rel_path = os.path.relpath(os.fsdecode(path), self.root)
+        if rel_path != "." and not rel_path.startswith(".."):
+            self.on_change(rel_path)
+
+
+class Watcher:
+    """
+    ตรวจการเปลี่ยนแปลงของทุกไดรฟ์ แล้วส่งไฟล์ที่เปลี่ยน [(rel_path, stat)] ให้ on_files(root, files) ทีละชุด
+    filters = {root: FileFilter}, methods = {root: "auto" | "poll"}
+    """
+
+    def __init__(self, roots, on_files, filters=None, methods=None, poll_seconds=60, sweep_seconds=900,
+                 hot_seconds=1800, settle_seconds=10, on_log=None):
+        self.roots = list(roots)
+        self.on_files = on_files
+        self.filters = filters or {}
+        self.methods = methods or {}
+        self.poll_seconds = poll_seconds
+        self.sweep_seconds = sweep_seconds
+        self.hot_seconds = hot_seconds
+        self.on_log = on_log or (lambda message: None)
+        self.queue = ChangeQueue(settle_seconds)
+        self.observer = None
+        self.pollers = []
+        self.modes = {}
+        self.stop_event = threading.Event()
+        self.dispatch_lock = threading.Lock()
+        self.paused = False
+        self.threads = []
+
+    def _watch(self, root):
+        if self.observer is None:
+            self.observer = Observer()
+            self.observer.daemon = True
+            self.observer.start()
+        self.observer.schedule(_EventHandler(root, lambda rel_path: self.queue.put(root, rel_path)), root, recursive=True)
+
+    def start(self):
+        for root in self.roots:
+            if self.methods.get(root, "auto") != "poll" and Observer is not None:
+                try:
+                    self._watch(root)
+                    self.modes[root] = "watchdog"
+                    continue
+                except Exception as e:
+                    self.on_log(f"[WARN] เปิดการแจ้งเตือนของ {root} ไม่ได้ ({e}) ใช้การ poll แทน")
+            self.pollers.append(DirPoller(
+                root,
+                lambda rel_path, root=root: self.queue.put(root, rel_path),
+                self.filters.get(root),
+                self.poll_seconds,
+                self.sweep_seconds,
+                self.hot_seconds,
+            ))
+            self.modes[root] = "poll"
+        for name, target in (("watch-dispatch", self._dispatch_loop), ("watch-poll", self._poll_loop)):
+            if target == self._poll_loop and not self.pollers:
+                continue
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _poll_loop(self):
+        for poller in list(self.pollers):
+            try:
+                poller.prime()
+            except OSError as e:
+                self.on_log(f"[ERROR] เริ่มตรวจ {poller.root} ไม่ได้: {e}")
+                self.pollers.remove(poller)
+        while not self.stop_event.wait(self.poll_seconds):
+            for poller in self.pollers:
+                try:
+                    poller.poll()
+                except Exception as e:
+                    self.on_log(f"[ERROR] ตรวจการเปลี่ยนแปลงของ {poller.root} ไม่ได้: {e}")
+
+    def _expand(self, root, rel_paths):
+        """path ในคิว → ไฟล์ที่ต้องคัดลอก [(rel_path, stat)] (โฟลเดอร์ที่สร้าง/ย้ายเข้ามาเดินทั้งต้นไม้)"""
+        file_filter = self.filters.get(root)
+        files = {}
+        for rel_path in rel_paths:
+            if file_filter is not None and in_excluded_dir(file_filter, os.path.dirname(rel_path)):
+                continue
+            try:
+                st = os.stat(os.path.join(root, rel_path), follow_symlinks=False)
+            except OSError:
+                continue  # ถูกลบไปแล้ว
+            if stat.S_ISDIR(st.st_mode):
+                if file_filter is None or not file_filter.excluded(rel_path, st, True):
+                    files.update((p, s) for p, s, is_dir in walk(root, rel_path, file_filter) if not is_dir)
+            elif stat.S_ISREG(st.st_mode):
+                if file_filter is None or not file_filter.excluded(rel_path, st, False):
+                    files[rel_path] = st
+        return sorted(files.items())
+
+    def _dispatch_loop(self):
+        while not self.stop_event.is_set():
+            with self.dispatch_lock:
+                batch = {} if self.paused else self.queue.ready()
+                for root, rel_paths in batch.items():
+                    try:
+                        files = self._expand(root, rel_paths)
+                        if files:
+                            self.on_files(root, files)
+                    except Exception as e:
+                        self.on_log(f"[ERROR] คัดลอกไฟล์ที่เปลี่ยนจาก {root} ไม่สำเร็จ: {e}")
+            if not batch:
+                self.stop_event.wait(DISPATCH_SECONDS)
+
+    def pause(self):
+        """หยุดคัดลอก (รอชุดที่กำลังทำอยู่ให้เสร็จ) การตรวจยังทำต่อ path ที่เปลี่ยนค้างอยู่ในคิว"""
+        self.paused = True
+        with self.dispatch_lock:
+            pass
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        self.pause()
+        self.stop_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+
+    def describe(self):
+        modes = ", ".join(f"{root}={mode}" for root, mode in self.modes.items()) or "-"
+        return f"{modes} (poll ทุก {self.poll_seconds} วินาที, ค้างในคิว {len(self.queue)})"